@@ -1,11 +1,29 @@
-from flask import Flask, render_template, request, send_file, flash, redirect, url_for
+from flask import Flask, render_template, request, send_file, send_from_directory, flash, redirect, url_for, abort, Response, jsonify
 import os
+import hmac
+import base64
+import hashlib
+import json
 from datetime import datetime
-from main import generate_report_for_date
+from main import active_shops, generate_report_for_date, collect_report_data
+from utils.order_events import record_event
+from utils.renderers import render_report
+from utils.report_cache import lookup_report
+from utils.output_profiles import DELIVERY_PROFILE
+from utils.single_flight import SingleFlight
+from utils.profiling import PROFILE_DIR, profile_session
 
 app = Flask(__name__)
 app.secret_key = 'supersecretkey'  # Necesario para flash messages
 
+# Solicitudes idénticas en paralelo esperan a una sola generación
+report_flight = SingleFlight()
+
+def _flight_key(kind, start, end):
+    """Clave de deduplicación: tipo de salida, fechas y tiendas activas"""
+    shops = tuple(shop['name'] for shop in active_shops())
+    return (kind, str(start), str(end) if end else None, shops)
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -32,8 +50,21 @@ def generate():
         if end_date:
             datetime.strptime(end_date, '%Y-%m-%d')
         
+        # profile=1: se genera de cero bajo cProfile/tracemalloc (sin caché ni deduplicación)
+        if request.values.get('profile', '').lower() in ('1', 'true', 'yes'):
+            return _generate_profiled(target_date, end_date)
+        
+        # Reportes pre-generados por el job diario: se sirven directo (si no
+        # hay uno del perfil de pantalla, sirve el PDF que se entregó por mail)
+        shops = [shop['name'] for shop in active_shops()]
+        cached = (lookup_report(target_date, end_date, shops)
+                  or lookup_report(target_date, end_date, shops, profile=DELIVERY_PROFILE))
+        if cached:
+            return send_file(cached, as_attachment=True)
+        
         # Generate report (now supports optional end_date)
-        filename = generate_report_for_date(target_date, end_date)
+        filename, _ = report_flight.do(_flight_key('pdf', target_date, end_date),
+                                       generate_report_for_date, target_date, end_date)
         
         if filename and os.path.exists(filename):
             return send_file(filename, as_attachment=True)
@@ -48,5 +79,92 @@ def generate():
         flash(f'Error inesperado: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+def _generate_profiled(target_date, end_date):
+    """Genera el PDF perfilando cada etapa. El perfil queda en /profiles/<archivo>."""
+    name = f"generate_{target_date}" + (f"_to_{end_date}" if end_date else "")
+    with profile_session(name) as session:
+        filename = generate_report_for_date(target_date, end_date)
+    
+    if not filename or not os.path.exists(filename):
+        flash('Could not generate the report. Please verify there is data for that date.', 'error')
+        return redirect(url_for('index'))
+    response = send_file(filename, as_attachment=True)
+    if session and session.report_path:
+        response.headers['X-Profile-Report'] = url_for('download_profile', filename=os.path.basename(session.report_path))
+    return response
+
+@app.route('/profiles')
+def list_profiles():
+    """Perfiles guardados, del más reciente al más viejo"""
+    if not os.path.isdir(PROFILE_DIR):
+        return jsonify([])
+    names = sorted(os.listdir(PROFILE_DIR), key=lambda n: os.path.getmtime(os.path.join(PROFILE_DIR, n)), reverse=True)
+    return jsonify([{'name': n, 'url': url_for('download_profile', filename=n)} for n in names if n.endswith(('.txt', '.prof'))])
+
+@app.route('/profiles/<path:filename>')
+def download_profile(filename):
+    return send_from_directory(os.path.abspath(PROFILE_DIR), filename, as_attachment=True)
+
+def _render_report(fmt):
+    """Devuelve los datos agregados en un formato liviano (sin gráficos ni PDF)"""
+    target_date = request.args.get('date')
+    end_date = (request.args.get('end_date') or '').strip() or None
+    
+    if not target_date:
+        abort(400, 'Missing date')
+    try:
+        start = datetime.strptime(target_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    except ValueError:
+        abort(400, 'Invalid date format')
+    
+    if end:
+        title = f"{start.strftime('%b %d')} - {end.strftime('%b %d, %Y')}"
+    else:
+        title = start.strftime('%B %d, %Y')
+    meta = {'title': title, 'start_date': start, 'end_date': end, 'generated_at': datetime.now().isoformat()}
+    
+    collected_data, _ = report_flight.do(_flight_key('data', start, end), collect_report_data, start, end)
+    body, mimetype = render_report(fmt, collected_data, meta)
+    response = Response(body, mimetype=mimetype)
+    if fmt == 'csv':
+        suffix = f"{start}_to_{end}" if end else f"{start}"
+        response.headers['Content-Disposition'] = f'attachment; filename=Reporte_Ventas_{suffix}.csv'
+    return response
+
+@app.route('/api/report')
+def api_report():
+    return _render_report('json')
+
+@app.route('/export.csv')
+def export_csv():
+    return _render_report('csv')
+
+@app.route('/dashboard')
+def dashboard():
+    return _render_report('html')
+
+def verify_webhook(raw_body, hmac_header):
+    """Verifica la firma HMAC-SHA256 (base64) que Shopify envía en cada webhook"""
+    secret = os.getenv("SHOPIFY_WEBHOOK_SECRET", "")
+    if not secret or not hmac_header:
+        return False
+    digest = hmac.new(secret.encode('utf-8'), raw_body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), hmac_header)
+
+@app.route('/webhooks/orders/<action>', methods=['POST'])
+def orders_webhook(action):
+    if action not in ('create', 'updated'):
+        abort(404)
+
+    raw_body = request.get_data()
+    if not verify_webhook(raw_body, request.headers.get('X-Shopify-Hmac-Sha256')):
+        abort(401)
+
+    shop = request.headers.get('X-Shopify-Shop-Domain', '')
+    order = json.loads(raw_body)
+    record_event(shop, f"orders/{action}", order, webhook_id=request.headers.get('X-Shopify-Webhook-Id'))
+    return '', 200
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -6,10 +6,32 @@ Flujo:
 1. Genera el reporte de ventas para el día de ayer.
 2. Envía el PDF por correo electrónico (si está configurado).
 3. Sube el PDF a Monday.com (si está configurado).
+   Con SPLIT_REPORTS_BY_SHOP=true se genera un PDF por tienda en paralelo y
+   cada uno va a los destinatarios / board de Monday de su tienda.
+   Antes del PDF, cada tienda se compara contra sus series históricas
+   (utils/anomaly.py) y si algo se sale de lo normal se envía una alerta.
+   Se desactiva con ANOMALY_ALERTS=false.
+4. Pre-genera las vistas de PREWARM_VIEWS (ej: weekly,last_30_days,month_to_date)
+   y las deja en el caché de reportes para que /generate las sirva al instante.
+
+Cada paso se guarda en un checkpoint (utils/checkpoint.py): si el job falla,
+volver a correrlo para la misma fecha solo repite lo que faltó. Con --force
+se descarta el checkpoint y se corre todo de nuevo.
+
+Los PDFs que se entregan usan el perfil de salida DAILY_OUTPUT_PROFILE
+(default: email, ver utils/output_profiles.py): mismo contenido con gráficos
+y logo livianos para adjuntar y subir. Las vistas pre-generadas usan el
+perfil por defecto de la app.
+
+Con REPORT_PROFILE=true la corrida se perfila por etapa (utils/profiling.py)
+y el resultado queda en PROFILE_DIR (descargable desde /profiles en la app).
 """
 
 import os
 import sys
+import time
+from contextlib import nullcontext
+from functools import partial
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
@@ -17,9 +39,203 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Importar funciones del proyecto
-from main import generate_report_for_date
+from main import generate_report, build_pipeline, render_pdf_stage, render_shop_reports, active_shops, REPORT_TYPES, DEFAULT_STAGES
+from utils.email_sender import SMTPMailer
+from utils.report_cache import store_report
+from utils.checkpoint import RunCheckpoint, checkpointed_stages, prune_checkpoints
+from utils.anomaly import with_anomaly_alerts
+from utils.profiling import profile_session
+from utils.http_cache import HTTPCache, transfer_stats
+from utils.output_profiles import DELIVERY_PROFILE
+
+# Un PDF por tienda (con sus propios destinatarios / board) en lugar de uno combinado
+SPLIT_REPORTS_BY_SHOP = os.getenv("SPLIT_REPORTS_BY_SHOP", "").lower() in ("1", "true", "yes")
+
+# Alertas de anomalías apenas se agregan los datos de cada tienda
+ANOMALY_ALERTS = os.getenv("ANOMALY_ALERTS", "true").lower() in ("1", "true", "yes")
+
+# Perfilado de la corrida (cProfile + tracemalloc por etapa)
+REPORT_PROFILE = os.getenv("REPORT_PROFILE", "").lower() in ("1", "true", "yes")
+
+# Perfil de salida de los PDFs entregados por email / Monday
+OUTPUT_PROFILE = DELIVERY_PROFILE
+
+def report_stages(checkpoint, **overrides):
+    """Etapas del reporte diario: checkpoint por tienda y, si están activas, alertas"""
+    stages = {**DEFAULT_STAGES, **overrides}
+    if ANOMALY_ALERTS:
+        stages = with_anomaly_alerts(stages)
+    return checkpointed_stages(checkpoint, stages)
+
+def prewarm_views(anchor_date, views, checkpoint=None):
+    """
+    Genera las vistas estándar terminando en anchor_date y las guarda en el
+    caché de reportes. Un error en una vista no frena las demás.
+    """
+    shops = [shop['name'] for shop in active_shops()]
+    for view in views:
+        if view not in REPORT_TYPES or view == "range":
+            print(f"⚠️  Vista desconocida en PREWARM_VIEWS: {view}")
+            continue
+        sink = f"prewarm:{view}"
+        if checkpoint and checkpoint.sink_done(sink):
+            print(f"♻️  Vista {view} ya pre-generada en una corrida anterior")
+            continue
+        period = REPORT_TYPES[view].period_fn(anchor_date, None)
+        start = time.perf_counter()
+        try:
+            # Sin aislar errores: un reporte sin alguna tienda no se cachea
+            filename = generate_report(view, anchor_date, isolate_shop_errors=False)
+            if not filename:
+                print(f"⚠️  Vista {view}: no se generó el PDF")
+                if checkpoint: checkpoint.mark_sink(sink, "failed", "no se generó el PDF")
+                continue
+            elapsed = time.perf_counter() - start
+            store_report(filename, period.start_date, period.end_date, view=view, shops=shops, build_seconds=elapsed)
+            os.remove(filename)
+            print(f"🔥 Vista {view} ({period.title}) pre-generada en {elapsed:.1f}s")
+            if checkpoint: checkpoint.mark_sink(sink, "done")
+        except Exception as e:
+            print(f"⚠️  Error pre-generando {view}: {e}")
+            if checkpoint: checkpoint.mark_sink(sink, "failed", str(e))
+
+def _deliver(checkpoint, sink, deliver_fn):
+    """Ejecuta una entrega si no se completó en una corrida anterior y guarda su estado"""
+    if checkpoint.sink_done(sink):
+        print(f"\n♻️  {sink}: ya entregado en una corrida anterior")
+        return
+    try:
+        ok = deliver_fn()
+        checkpoint.mark_sink(sink, "done" if ok else "failed", None if ok else "la entrega devolvió error")
+    except Exception as e:
+        print(f"⚠️  Error en {sink}: {e}")
+        checkpoint.mark_sink(sink, "failed", str(e))
+
+def deliver_combined_report(report_date, checkpoint):
+    """Genera el PDF con todas las tiendas y lo envía por email y a Monday"""
+    target_date_str = report_date.strftime('%Y-%m-%d')
+
+    # 2. Generar PDF (las tiendas y el PDF ya guardados en el checkpoint no se repiten)
+    render = partial(render_pdf_stage, profile=OUTPUT_PROFILE)
+    pdf_filename = generate_report("daily", report_date, isolate_shop_errors=False,
+                                   **report_stages(checkpoint, render=render))
+    
+    if not pdf_filename or not os.path.exists(pdf_filename):
+        print("❌ Error: No se generó el archivo PDF.")
+        sys.exit(1)
+        
+    print(f"✅ PDF generado exitosamente: {pdf_filename}")
+    store_report(pdf_filename, report_date, view="daily", shops=[shop['name'] for shop in active_shops()],
+                 profile=OUTPUT_PROFILE)
+    
+    # 3. Enviar por Email (si está configurado)
+    recipients_str = os.getenv("EMAIL_RECIPIENTS", "")
+    smtp_user = os.getenv("SMTP_USER", "")
+    smtp_password = os.getenv("SMTP_PASSWORD", "")
+    
+    if recipients_str and smtp_user and smtp_password:
+        def send_email():
+            from utils.email_sender import send_email_report
+            recipients = [r.strip() for r in recipients_str.split(",")]
+            print(f"\n📧 Enviando correo a {len(recipients)} destinatarios...")
+            return send_email_report(
+                pdf_filename, 
+                recipients, 
+                subject=f"Shopify Daily Report - {target_date_str}"
+            )
+        _deliver(checkpoint, "email", send_email)
+    else:
+        print("\n⚠️  Credenciales de email no configuradas. Saltando envío de correo.")
+        print("    Configura: EMAIL_RECIPIENTS, SMTP_USER, SMTP_PASSWORD en .env")
+        checkpoint.mark_sink("email", "skipped")
+
+    # 4. Subir a Monday.com (si está configurado)
+    monday_token = os.getenv("MONDAY_API_TOKEN", "")
+    monday_board = os.getenv("MONDAY_BOARD_ID", "")
+    
+    if monday_token and monday_board:
+        def upload():
+            from utils.monday_uploader import upload_to_monday
+            print("\n📋 Subiendo a Monday.com...")
+            item_name = f"Reporte Ventas {target_date_str}"
+            return upload_to_monday(pdf_filename, item_name)
+        _deliver(checkpoint, "monday", upload)
+    else:
+        print("\n⚠️  Credenciales de Monday.com no configuradas. Saltando subida.")
+        print("    Configura: MONDAY_API_TOKEN, MONDAY_BOARD_ID en .env")
+        checkpoint.mark_sink("monday", "skipped")
+
+def deliver_split_reports(report_date, checkpoint):
+    """
+    Consulta todas las tiendas una sola vez, genera un PDF por tienda en
+    paralelo y entrega cada uno apenas está listo: a los destinatarios y al
+    board de Monday de esa tienda (o a los globales si no tiene propios).
+    """
+    target_date_str = report_date.strftime('%Y-%m-%d')
+    shops_by_name = {shop['name']: shop for shop in active_shops()}
+    stages = report_stages(checkpoint, render=None)
+    pipeline = build_pipeline("daily", report_date, isolate_shop_errors=False, **stages)
+    collected_data = pipeline.run()
+    if not collected_data:
+        print("❌ Error: No hay datos de ninguna tienda.")
+        sys.exit(1)
+
+    # Las tiendas con todas sus entregas hechas en una corrida anterior no se regeneran
+    pending = [data for data in collected_data
+               if not all(checkpoint.sink_done(f"{sink}:{data['name']}") for sink in ("email", "monday"))]
+
+    default_recipients = [r.strip() for r in os.getenv("EMAIL_RECIPIENTS", "").split(",") if r.strip()]
+    monday_token = os.getenv("MONDAY_API_TOKEN", "")
+    mailer = SMTPMailer()
+    monday_uploads = []
+
+    if not mailer.configured:
+        print("\n⚠️  Credenciales de email no configuradas. Saltando envío de correo.")
+
+    def deliver_shop(data, filename):
+        checkpoint.mark_sink(f"pdf:{data['name']}", "done")
+        shop = shops_by_name.get(data['name'], {})
+        recipients = shop.get('recipients') or default_recipients
+        if mailer.configured and recipients:
+            subject = f"Shopify Daily Report - {data['name']} - {target_date_str}"
+            _deliver(checkpoint, f"email:{data['name']}",
+                     lambda: mailer.send(recipients, subject, attachments=[filename]))
+        else:
+            checkpoint.mark_sink(f"email:{data['name']}", "skipped")
+
+        # Monday se sube en lote al final (una mutation para crear todos los items)
+        board_id = shop.get('monday_board_id') or os.getenv("MONDAY_BOARD_ID", "")
+        if monday_token and board_id:
+            if not checkpoint.sink_done(f"monday:{data['name']}"):
+                monday_uploads.append((data['name'], (filename, f"Reporte Ventas {data['name']} {target_date_str}", board_id)))
+        else:
+            checkpoint.mark_sink(f"monday:{data['name']}", "skipped")
+
+    print(f"\n📄 Generando {len(pending)} PDFs por tienda...")
+    try:
+        results = render_shop_reports(pending, pipeline.period.title, pipeline.period.filename_suffix,
+                                      on_ready=deliver_shop, profile=OUTPUT_PROFILE)
+    finally:
+        mailer.close()
+
+    if monday_uploads:
+        from utils.monday_uploader import MondayClient
+        print(f"\n📋 Subiendo {len(monday_uploads)} reportes a Monday.com...")
+        try:
+            with MondayClient(monday_token) as client:
+                results_monday = client.upload_reports([upload for _, upload in monday_uploads])
+        except Exception as e:
+            print(f"⚠️  Error subiendo a Monday: {e}")
+            results_monday = [False] * len(monday_uploads)
+        for (name, _), ok in zip(monday_uploads, results_monday):
+            checkpoint.mark_sink(f"monday:{name}", "done" if ok else "failed", None if ok else "la subida devolvió error")
 
-def run_daily_job():
+    # Una tienda sin PDF queda como fallida para que el próximo intento la repita
+    for name, filename in results.items():
+        if not filename:
+            checkpoint.mark_sink(f"pdf:{name}", "failed", "no se generó el PDF")
+
+def run_daily_job(force=False):
     print(f"\n{'='*60}")
     print(f"🚀 INICIANDO JOB DIARIO: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"{'='*60}\n")
@@ -27,55 +243,46 @@ def run_daily_job():
     # 1. Calcular fecha (Ayer)
     yesterday = datetime.now() - timedelta(days=1)
     target_date_str = yesterday.strftime('%Y-%m-%d')
+
+    checkpoint = RunCheckpoint("daily", target_date_str)
+    if force:
+        checkpoint.reset()
+    elif checkpoint.completed:
+        print(f"✅ El job para {target_date_str} ya se completó. Usa --force para repetirlo.")
+        return
+    attempt = checkpoint.start_attempt()
     
-    print(f"📅 Generando reporte para: {target_date_str}")
+    print(f"📅 Generando reporte para: {target_date_str}" + (f" (intento {attempt})" if attempt > 1 else ""))
 
     try:
-        # 2. Generar PDF
-        pdf_filename = generate_report_for_date(target_date_str)
-        
-        if not pdf_filename or not os.path.exists(pdf_filename):
-            print("❌ Error: No se generó el archivo PDF.")
+        profiler = profile_session(f"daily_{target_date_str}") if REPORT_PROFILE else nullcontext()
+        with profiler:
+            if SPLIT_REPORTS_BY_SHOP:
+                # 2-4. Un PDF por tienda, entregado a los destinatarios / board de cada tienda
+                deliver_split_reports(yesterday.date(), checkpoint)
+            else:
+                # 2-4. Un PDF con todas las tiendas
+                deliver_combined_report(yesterday.date(), checkpoint)
+
+            # 5. Pre-generar vistas estándar (si está configurado)
+            views = [v.strip() for v in os.getenv("PREWARM_VIEWS", "").split(",") if v.strip()]
+            if views:
+                print(f"\n🔥 Pre-generando {len(views)} vistas: {', '.join(views)}")
+                prewarm_views(yesterday.date(), views, checkpoint)
+
+        # Si alguna entrega falló, salir con error para que el próximo intento la repita
+        failed = checkpoint.failed_sinks()
+        if failed:
+            print(f"\n❌ Entregas con error: {', '.join(failed)}. Al reintentar el job solo se repetirán esas.")
             sys.exit(1)
-            
-        print(f"✅ PDF generado exitosamente: {pdf_filename}")
-        
-        # 3. Enviar por Email (si está configurado)
-        recipients_str = os.getenv("EMAIL_RECIPIENTS", "")
-        smtp_user = os.getenv("SMTP_USER", "")
-        smtp_password = os.getenv("SMTP_PASSWORD", "")
-        
-        if recipients_str and smtp_user and smtp_password:
-            try:
-                from utils.email_sender import send_email_report
-                recipients = [r.strip() for r in recipients_str.split(",")]
-                print(f"\n📧 Enviando correo a {len(recipients)} destinatarios...")
-                send_email_report(
-                    pdf_filename, 
-                    recipients, 
-                    subject=f"Shopify Daily Report - {target_date_str}"
-                )
-            except Exception as e:
-                print(f"⚠️  Error enviando email: {e}")
-        else:
-            print("\n⚠️  Credenciales de email no configuradas. Saltando envío de correo.")
-            print("    Configura: EMAIL_RECIPIENTS, SMTP_USER, SMTP_PASSWORD en .env")
 
-        # 4. Subir a Monday.com (si está configurado)
-        monday_token = os.getenv("MONDAY_API_TOKEN", "")
-        monday_board = os.getenv("MONDAY_BOARD_ID", "")
-        
-        if monday_token and monday_board:
-            try:
-                from utils.monday_uploader import upload_to_monday
-                print(f"\n📋 Subiendo a Monday.com...")
-                item_name = f"Reporte Ventas {target_date_str}"
-                upload_to_monday(pdf_filename, item_name)
-            except Exception as e:
-                print(f"⚠️  Error subiendo a Monday: {e}")
-        else:
-            print("\n⚠️  Credenciales de Monday.com no configuradas. Saltando subida.")
-            print("    Configura: MONDAY_API_TOKEN, MONDAY_BOARD_ID en .env")
+        checkpoint.mark_completed()
+        prune_checkpoints()
+        HTTPCache().prune()
+
+        transfer = transfer_stats.summary()
+        print(f"\n📶 Shopify: {transfer['requests']} requests ({transfer['not_modified']} sin cambios), "
+              f"{transfer['fresh_hits']} lecturas del caché, {transfer['wire_bytes'] / 1024:.0f} KB recibidos")
 
         print(f"\n{'='*60}")
         print("🏁 JOB DIARIO COMPLETADO EXITOSAMENTE")
@@ -83,9 +290,10 @@ def run_daily_job():
 
     except Exception as e:
         print(f"\n❌ CRITICAL ERROR en daily_job: {e}")
+        print(f"   El progreso quedó guardado en {checkpoint.path}")
         import traceback
         traceback.print_exc()
         sys.exit(1)
 
 if __name__ == "__main__":
-    run_daily_job()
+    run_daily_job(force="--force" in sys.argv)
@@ -0,0 +1,249 @@
+"""
+Reporte intradía ("today so far").
+Este script está diseñado para ejecutarse cada 15 minutos (ej: Render Cron).
+
+Flujo:
+1. Carga el estado guardado del día (cursor y agregados por tienda).
+2. Consulta solo las órdenes de hoy creadas o actualizadas desde el último cursor.
+3. Aplica los deltas sobre los buckets por hora (una orden actualizada
+   reemplaza su contribución anterior).
+4. Regenera solo los gráficos de las tiendas que cambiaron y rearma el PDF
+   únicamente si cambió lo que muestra: el PDF anterior se reutiliza solo si
+   su huella (fecha, hora de comparación y agregados de cada tienda) coincide
+   con la de los datos actuales.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+from main import SHOPS, ShopifyAPIError, ShopifyFetcher, PDFReport, create_chart
+from utils.aggregates import OrderAggregate, build_summary, classify_channel, parse_price
+
+STATE_DIR = os.getenv("INTRADAY_STATE_DIR", "intraday_state")
+
+
+def load_state(path):
+    """Carga el estado del día (o uno vacío si no existe)"""
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"shops": {}}
+
+
+def save_state(path, state):
+    """Guarda el estado de forma atómica para no dejar archivos a medias"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _order_contribution(fetcher, order):
+    """Contribución de una orden a los agregados: [hora, total, canal, tipo]"""
+    channel, channel_type = classify_channel(order.get('referring_site', ''), order.get('source_name', ''))
+    return [
+        fetcher.get_order_bucket(order),
+        parse_price(order.get('total_price', 0)),
+        channel,
+        channel_type
+    ]
+
+
+def apply_order_deltas(fetcher, shop_state, orders):
+    """
+    Aplica las órdenes nuevas o actualizadas sobre el agregado de la tienda.
+    Devuelve True si el agregado cambió.
+
+    El cursor avanza hasta el updated_at más reciente de la consulta aunque
+    la orden no cambie lo que suma (ej: se le agregó un tag): si no, esas
+    órdenes se vuelven a pedir en cada actualización.
+    """
+    aggregate = OrderAggregate.from_dict(shop_state['aggregate'])
+    contributions = shop_state['orders']
+    changed = False
+
+    for order in orders:
+        updated_at = order.get('updated_at') or order.get('created_at')
+        if updated_at and (not shop_state['cursor'] or updated_at > shop_state['cursor']):
+            shop_state['cursor'] = updated_at
+
+        order_id = str(order['id'])
+        new = _order_contribution(fetcher, order)
+        old = contributions.get(order_id)
+        if old == new:
+            continue
+        if old:
+            aggregate.remove(*old)
+        aggregate.add(*new)
+        contributions[order_id] = new
+        changed = True
+
+    shop_state['aggregate'] = aggregate.to_dict()
+    return changed
+
+
+def _new_shop_state(fetcher, today):
+    """Estado inicial del día: incluye el día anterior completo para comparar"""
+    yesterday = today - timedelta(days=1)
+    previous = OrderAggregate(num_buckets=24)
+    for order in fetcher.get_orders_for_date(yesterday):
+        previous.add(*_order_contribution(fetcher, order))
+
+    return {
+        "date": today.isoformat(),
+        "cursor": None,
+        "orders": {},
+        "aggregate": OrderAggregate(num_buckets=24).to_dict(),
+        "previous": {
+            "bucket_counts": previous.bucket_counts,
+            "bucket_sales": previous.bucket_sales
+        },
+        "chart_signature": None,
+        "chart_file": None
+    }
+
+
+def poll_shop(shop_conf, shop_state):
+    """
+    Consulta los deltas de una tienda.
+    Devuelve (shop_state, changed, local_now).
+    """
+    fetcher = ShopifyFetcher(shop_conf)
+    local_now = fetcher.get_local_now()
+    today = local_now.date()
+
+    if not shop_state or shop_state.get('date') != today.isoformat():
+        print(f"  🌅 Nuevo día para {shop_conf['name']}: cargando {today}")
+        shop_state = _new_shop_state(fetcher, today)
+
+    orders = fetcher.get_orders_updated_since(today, shop_state['cursor'])
+    changed = apply_order_deltas(fetcher, shop_state, orders)
+    print(f"  🔄 {shop_conf['name']}: {len(orders)} órdenes nuevas/actualizadas desde {shop_state['cursor'] or 'inicio del día'}")
+    return shop_state, changed, local_now
+
+
+def _build_store_data(shop_conf, shop_state, local_now):
+    """Arma la sección de la tienda con el mismo formato que el reporte diario"""
+    aggregate = OrderAggregate.from_dict(shop_state['aggregate'])
+    stats = {
+        "summary": aggregate.summary(),
+        "hourly_orders": aggregate.bucket_counts,
+        "daily_orders": None,
+        "attribution": aggregate.channels,
+        "is_range": False,
+        "start_date": local_now.date(),
+        "end_date": None
+    }
+
+    # Comparar contra el día anterior hasta la misma hora
+    hour = local_now.hour
+    previous = shop_state['previous']
+    previous_stats = {"summary": build_summary(
+        sum(previous['bucket_sales'][:hour + 1]),
+        sum(previous['bucket_counts'][:hour + 1])
+    )}
+    comparison = ShopifyFetcher(shop_conf).compare_periods(stats, previous_stats)
+
+    # Regenerar el gráfico solo si cambiaron los buckets
+    signature = hashlib.sha1(json.dumps(aggregate.bucket_counts).encode()).hexdigest()
+    chart_file = shop_state.get('chart_file')
+    if signature != shop_state.get('chart_signature') or not chart_file or not os.path.exists(chart_file):
+        chart_file = create_chart(
+            aggregate.bucket_counts, shop_conf['name'], is_range=False,
+            title=f"Orders by Hour (Today) - {shop_conf['name']}",
+            filename=os.path.join(STATE_DIR, f"chart_{shop_conf['name'].replace(' ', '_')}.png")
+        )
+        shop_state['chart_signature'] = signature
+        shop_state['chart_file'] = chart_file
+        print(f"  📊 Gráfico actualizado: {shop_conf['name']}")
+
+    narrative = (
+        f"{shop_conf['name']} store has generated total sales of {stats['summary']['Ventas']} so far today "
+        f"(as of {local_now.strftime('%H:%M')}), {comparison['sales_change']:+.0f}% compared to the same time yesterday. "
+        f"The store has received {stats['summary']['Ordenes']} orders, "
+        f"{comparison['orders_change']:+.0f}% change in order volume."
+    )
+
+    return {
+        "name": shop_conf['name'],
+        "stats": stats,
+        "comparison": comparison,
+        "chart_file": chart_file,
+        "narrative": narrative,
+        "analytics": {'sessions': 0, 'conversion_rate': 0},
+        "abandoned_carts": None
+    }
+
+
+def _report_fingerprint(sections):
+    """Huella de lo que muestra el PDF: tiendas, fecha, hora de comparación y agregados"""
+    content = [
+        [shop_conf['name'], shop_state['date'], local_now.hour, shop_state['aggregate'], shop_state['previous']]
+        for shop_conf, shop_state, local_now in sections
+    ]
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def run_intraday_refresh():
+    """Ejecuta una actualización intradía. Devuelve el nombre del PDF o None."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    state_path = os.path.join(STATE_DIR, "intraday_state.json")
+    state = load_state(state_path)
+
+    print(f"\n⏱️  Actualización intradía: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    filename = os.path.join(STATE_DIR, "Reporte_Intradia.pdf")
+    sections = []
+    for shop_conf in SHOPS:
+        if not shop_conf["token"]: continue
+
+        try:
+            shop_state, _, local_now = poll_shop(shop_conf, state['shops'].get(shop_conf['name']))
+        except ShopifyAPIError as e:
+            # Sin guardar el estado: los cursores no avanzan y la próxima
+            # actualización vuelve a pedir los mismos deltas
+            print(f"  ❌ {e}. Se reintenta en la próxima actualización; PDF anterior vigente.")
+            return filename if os.path.exists(filename) else None
+        state['shops'][shop_conf['name']] = shop_state
+        sections.append((shop_conf, shop_state, local_now))
+
+    if not sections:
+        return None
+    # "Sin cambios" no alcanza: al pasar la medianoche el día nuevo arranca
+    # sin órdenes y el PDF en disco sigue siendo el de ayer
+    fingerprint = _report_fingerprint(sections)
+    if state.get('report_fingerprint') == fingerprint and os.path.exists(filename):
+        save_state(state_path, state)
+        print("  ✅ Sin cambios desde la última actualización. PDF vigente.")
+        return filename
+
+    # Se escribe en un temporal: el PDF vigente sigue disponible hasta output()
+    report_date = f"Today so far - {sections[0][2].strftime('%B %d, %Y')}"
+    with PDFReport(report_date=report_date, stream_to=filename) as pdf:
+        for shop_conf, shop_state, local_now in sections:
+            pdf.add_page()
+            pdf.add_store_section(_build_store_data(shop_conf, shop_state, local_now))
+        pdf.output(filename)
+    state['report_fingerprint'] = fingerprint
+    save_state(state_path, state)
+    print(f"\n✅ Reporte intradía actualizado: {filename}")
+    return filename
+
+
+if __name__ == "__main__":
+    # --loop: se queda corriendo y refresca cada INTRADAY_INTERVAL_MINUTES
+    if "--loop" in sys.argv:
+        interval = int(os.getenv("INTRADAY_INTERVAL_MINUTES", "15"))
+        while True:
+            run_intraday_refresh()
+            time.sleep(interval * 60)
+    else:
+        run_intraday_refresh()
@@ -0,0 +1,126 @@
+"""
+Prueba de carga de la capa de consulta contra el simulador local de Shopify.
+
+Levanta utils/shopify_simulator en un thread, arma N tiendas sintéticas que
+apuntan a él y corre el pipeline de reportes (sin tocar la API real).
+Al final muestra el tiempo total, los tiempos por etapa y cuántas requests,
+throttles (429) y bytes se movieron.
+
+Uso:
+    python load_test.py --shops 20 --orders-per-day 1000 --type weekly
+    python load_test.py --shops 50 --concurrency 8 --latency 0.05 --pdf
+    python load_test.py --shops 20 --backend graphql
+    python load_test.py --shops 10 --type weekly --runs 2   (2da corrida: caché HTTP)
+    python load_test.py --shops 1 --orders-per-day 50 --backend graphql --check
+
+Con --check (y backend graphql) falla si la cantidad de queries o de
+respuestas THROTTLED supera lo esperable (ver check_graphql_usage).
+"""
+
+import os
+import math
+import time
+import argparse
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import main
+from main import build_pipeline, GRAPHQL_LINE_ITEMS_PAGE, GRAPHQL_MAX_PAGE, GRAPHQL_ORDERS_QUERY, REPORT_TYPES
+from utils.graphql_cost import MAX_QUERY_COST, max_page_size
+from utils.shopify_simulator import start_simulator
+from utils.shop_registry import _normalize
+from utils.http_cache import transfer_stats
+
+
+def build_simulated_shops(count, base_url):
+    """Tiendas sintéticas apuntando al simulador"""
+    return [_normalize({
+        "name": f"Sim Shop {n}",
+        "url": f"sim-shop-{n}.myshopify.com",
+        "token": "simulated",
+        "api_base_url": base_url
+    }) for n in range(1, count + 1)]
+
+
+def check_graphql_usage(stats, orders, shops):
+    """
+    Verifica que el backend GraphQL no se dispare en queries ni en throttles.
+    Cada query de órdenes trae al menos una página mínima (1/4 de la
+    completa) salvo la última de cada período, y las líneas que no entran
+    van en un lote por página. El reporte consulta dos períodos por tienda
+    (el actual y el de comparación, de tamaño parecido).
+    """
+    full_page = max_page_size(GRAPHQL_ORDERS_QUERY, {"lineItems": GRAPHQL_LINE_ITEMS_PAGE}, MAX_QUERY_COST,
+                              maximum=GRAPHQL_MAX_PAGE)
+    order_pages = math.ceil(2 * orders / max(1, full_page // 4)) + 2 * shops
+    max_requests = 2 * order_pages
+    # Las páginas se dimensionan con el throttleStatus: un throttle es la excepción
+    max_throttled = stats['graphql_requests'] // 10
+    print(f"   🔎 GraphQL: {stats['graphql_requests']} queries (máximo {max_requests}), "
+          f"{stats['throttled']} THROTTLED (máximo {max_throttled})")
+    assert stats['graphql_requests'] <= max_requests, "Demasiadas queries GraphQL por orden"
+    assert stats['throttled'] <= max_throttled, "Demasiadas respuestas THROTTLED"
+
+
+def run_load_test(shops=10, orders_per_day=500, report_type="daily", date=None,
+                  concurrency=None, latency=0.0, render_pdf=False, backend=None, runs=1, check=False):
+    server, base_url = start_simulator(orders_per_day=orders_per_day, latency=latency)
+    if backend:
+        main.ORDERS_BACKEND = backend
+    if concurrency:
+        os.environ["REPORT_MAX_CONCURRENCY"] = str(concurrency)
+
+    date = date or (datetime.now() - timedelta(days=1)).date()
+    stages = {} if render_pdf else {"render": None}
+    simulated_shops = build_simulated_shops(shops, base_url)
+
+    try:
+        for run in range(1, runs + 1):
+            pipeline = build_pipeline(report_type, date, **stages)
+            pipeline.shops = simulated_shops
+            print(f"\n🧪 Prueba de carga{f' (corrida {run}/{runs})' if runs > 1 else ''}: {shops} tiendas, "
+                  f"~{orders_per_day} órdenes/día, reporte {report_type} ({pipeline.period.title}), backend {main.ORDERS_BACKEND}")
+            transfer_stats.reset()
+            start = time.perf_counter()
+            output = pipeline.run()
+            elapsed = time.perf_counter() - start
+            transfer = transfer_stats.summary()
+            print(f"   📶 Red: {transfer['requests']} requests ({transfer['not_modified']} con 304), "
+                  f"{transfer['fresh_hits']} lecturas del caché, "
+                  f"{transfer['wire_bytes'] / 1024:.0f} KB recibidos ({transfer['body_bytes'] / 1024:.0f} KB descomprimidos)")
+    finally:
+        server.shutdown()
+
+    stats = server.state.stats
+    total_orders = sum(data['stats']['summary']['Ordenes'] for data in pipeline.collected_data)
+    print("\n📈 Resultado:")
+    print(f"   Tiempo total: {elapsed:.2f}s")
+    print(f"   Órdenes procesadas: {total_orders} ({total_orders / elapsed:.0f}/s)")
+    print(f"   Requests: {stats['requests']} ({stats['requests'] / elapsed:.1f}/s), 429: {stats['throttled']}")
+    print(f"   Bytes recibidos: {stats['bytes_sent'] / 1024 / 1024:.1f} MB")
+    if render_pdf:
+        print(f"   PDF: {output}")
+    if check and main.ORDERS_BACKEND == "graphql":
+        check_graphql_usage(stats, total_orders, shops)
+    return {"elapsed": elapsed, "orders": total_orders, **stats}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga contra el simulador de Shopify")
+    parser.add_argument("--shops", type=int, default=10)
+    parser.add_argument("--orders-per-day", type=int, default=500)
+    parser.add_argument("--type", default="daily", choices=[t for t in REPORT_TYPES if t != "range"])
+    parser.add_argument("--date", help="Fecha del reporte (YYYY-MM-DD). Default: ayer")
+    parser.add_argument("--concurrency", type=int, help="REPORT_MAX_CONCURRENCY para la prueba")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia simulada por request (segundos)")
+    parser.add_argument("--backend", choices=["rest", "graphql"], help="ORDERS_BACKEND para la prueba")
+    parser.add_argument("--runs", type=int, default=1, help="Corridas seguidas contra el mismo simulador")
+    parser.add_argument("--pdf", action="store_true", help="Generar también los gráficos y el PDF")
+    parser.add_argument("--check", action="store_true", help="Fallar si GraphQL usa más queries o throttles de lo esperable")
+    args = parser.parse_args()
+
+    date = datetime.strptime(args.date, '%Y-%m-%d').date() if args.date else None
+    run_load_test(args.shops, args.orders_per_day, args.type, date, args.concurrency, args.latency, args.pdf, args.backend, args.runs,
+                  args.check)
@@ -1,90 +1,454 @@
 import os
 import requests
 import json
+import time
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from fpdf import FPDF
-from collections import defaultdict
+try:
+    import ijson  # Opcional: parseo en streaming de las respuestas de órdenes
+except ImportError:
+    ijson = None
+from utils.aggregates import OrderAggregate, classify_channel, parse_price
+from utils.order_events import load_period_stats
+from utils.order_record import Order
+from utils.streaming_pdf import StreamingFPDF
+from utils import order_snapshots
+from utils.pipeline import ReportPeriod, ReportPipeline, ReportType
+from utils.shop_registry import DEFAULT_SECTIONS, load_shops
+from utils.rate_limit import cost_budget_for, limiter_for
+from utils.topk import TopProducts
+from utils import customer_index
+from utils.profiling import bind_session, profiled, stage as profile_stage
+from utils.graphql_cost import MAX_QUERY_COST, max_page_size, query_cost
+from utils.output_profiles import fit_image, get_profile, save_chart
+from utils.http_cache import ACCEPT_ENCODING, CACHE_DIR as HTTP_CACHE_DIR, CountingReader, HTTPCache, record_response, slim_payload, transfer_stats, ttl_for
 
 # 1. Cargar variables de entorno
 load_dotenv()
 
-# Configuración de las tiendas basada en el .env
-SHOPS = [
-    {
-        "name": os.getenv("SHOP1_NAME"),
-        "url": os.getenv("SHOP1_URL"),
-        "token": os.getenv("SHOP1_TOKEN")
-    },
-    {
-        "name": os.getenv("SHOP2_NAME"),
-        "url": os.getenv("SHOP2_URL"),
-        "token": os.getenv("SHOP2_TOKEN")
-    },
-    {
-        "name": os.getenv("SHOP3_NAME"),
-        "url": os.getenv("SHOP3_URL"),
-        "token": os.getenv("SHOP3_TOKEN")
+# Configuración de las tiendas: SHOPS_CONFIG (JSON) o variables SHOP{n}_* del .env
+SHOPS = load_shops()
+
+# Origen de las órdenes: "api" (consulta a Shopify), "events" (webhooks ya agregados)
+# o "snapshots" (días cerrados guardados en ORDER_SNAPSHOT_DIR)
+ORDERS_SOURCE = os.getenv("ORDERS_SOURCE", "api")
+
+# Base de la API: por defecto la tienda real. Con SHOPIFY_API_BASE_URL (o
+# api_base_url en el registro) se apunta al simulador; {url} se reemplaza
+# por el dominio de la tienda.
+SHOPIFY_API_BASE_URL = os.getenv("SHOPIFY_API_BASE_URL")
+SHOPIFY_MAX_RETRIES = int(os.getenv("SHOPIFY_MAX_RETRIES", "5"))
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Backend para consultar órdenes: "rest" (payload completo) o "graphql"
+# (solo los campos que usa el reporte, con paginación por cursor). GraphQL
+# trae menos bytes pero cobra ~12 puntos por orden (6 + 3 por línea) y el
+# bucket se recarga a restoreRate (50 puntos/s en el plan estándar): unas 4
+# órdenes por segundo por tienda una vez agotados los primeros 1000 puntos.
+# Para rangos largos o tiendas grandes conviene "rest".
+ORDERS_BACKEND = os.getenv("ORDERS_BACKEND", "rest")
+
+# Las líneas de cada orden vienen en la misma página hasta
+# GRAPHQL_LINE_ITEMS_PAGE (cubre la gran mayoría de las órdenes). El costo
+# pedido de la query es first x (costo de una orden con sus líneas) y tiene
+# que entrar en 1000 puntos. Las órdenes con más líneas completan el resto
+# en lote, varias órdenes por query (ver _line_items_batch_query).
+GRAPHQL_LINE_ITEMS_PAGE = int(os.getenv("GRAPHQL_LINE_ITEMS_PAGE", "8"))
+GRAPHQL_LINE_ITEM_FIELDS = "nodes { sku title quantity originalTotalSet { shopMoney { amount } } } pageInfo { hasNextPage endCursor }"
+GRAPHQL_ORDERS_QUERY = """
+query ($first: Int!, $after: String, $query: String, $lineItems: Int!) {
+  orders(first: $first, after: $after, query: $query, sortKey: CREATED_AT) {
+    nodes {
+      id
+      createdAt
+      updatedAt
+      totalPriceSet { shopMoney { amount } }
+      subtotalLineItemsQuantity
+      referrerUrl
+      sourceName
+      email
+      customer { id }
+      lineItems(first: $lineItems) { %s }
     }
-]
+    pageInfo { hasNextPage endCursor }
+  }
+}
+""" % GRAPHQL_LINE_ITEM_FIELDS
+GRAPHQL_MAX_PAGE = 250
+
+def _line_items_batch_query(count):
+    """Query con el resto de las líneas de `count` órdenes (alias o0, o1, ...; cada una con su first/after)"""
+    params = ", ".join(f"$id{i}: ID!, $first{i}: Int!, $after{i}: String" for i in range(count))
+    aliases = "\n".join(f"  o{i}: order(id: $id{i}) {{ lineItems(first: $first{i}, after: $after{i}) {{ {GRAPHQL_LINE_ITEM_FIELDS} }} }}"
+                        for i in range(count))
+    return f"query ({params}) {{\n{aliases}\n}}"
+
+# Página inicial con el total de todas las tiendas (en PDFs con más de una tienda)
+REPORT_SUMMARY_PAGE = os.getenv("REPORT_SUMMARY_PAGE", "true").lower() in ("1", "true", "yes")
+
+# Productos en la sección "Top Products"
+TOP_PRODUCTS_K = int(os.getenv("TOP_PRODUCTS_K", "10"))
+
+# Ventanas en paralelo al consultar órdenes de una tienda (1 = secuencial).
+# Un rango se parte por días y un día único por bloques de horas. Se puede
+# definir por tienda con "fetch_slices" en el registro.
+ORDER_FETCH_SLICES = int(os.getenv("ORDER_FETCH_SLICES", "1"))
+
+class ShopifyAPIError(Exception):
+    """
+    La API respondió con error (después de los reintentos) o una página no
+    llegó: los datos del período quedarían incompletos, así que la tienda no
+    se reporta ni se guarda en el checkpoint.
+    """
 
 class ShopifyFetcher:
     def __init__(self, shop_config):
         self.shop = shop_config
         self.headers = {
             "X-Shopify-Access-Token": self.shop['token'],
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            "Accept-Encoding": ACCEPT_ENCODING
         }
-        self.base_url = f"https://{self.shop['url']}/admin/api/2025-10"
+        api_base = self.shop.get('api_base_url') or SHOPIFY_API_BASE_URL or "https://{url}"
+        self.base_url = f"{api_base.format(url=self.shop['url'])}/admin/api/2025-10"
         self.graphql_url = f"{self.base_url}/graphql.json"
+        self.rate_limiter = limiter_for(self.shop['url'])
+        self.graphql_budget = cost_budget_for(self.shop['url'])
+        # Caché HTTP de lecturas REST (ETag / Last-Modified + TTL por endpoint)
+        self.http_cache = HTTPCache() if HTTP_CACHE_DIR else None
+
+    def _request(self, method, url, **kwargs):
+        """
+        Hace la request reintentando en 429 (rate limit) y errores 5xx.
+        Respeta Retry-After; si no viene, espera con backoff exponencial.
+        """
+        # GraphQL tiene su propio presupuesto de puntos (ver _fetch_orders_graphql)
+        is_rest = url != self.graphql_url
+        headers = {**self.headers, **kwargs.pop('headers', {})}
+        for attempt in range(SHOPIFY_MAX_RETRIES + 1):
+            if is_rest:
+                self.rate_limiter.acquire()
+            try:
+                response = requests.request(method, url, headers=headers, **kwargs)
+            except requests.ConnectionError as e:
+                if attempt == SHOPIFY_MAX_RETRIES:
+                    raise
+                print(f"  ⚠️  Error de conexión en {self.shop['name']}: {e}. Reintentando...")
+                time.sleep(min(2 ** attempt * 0.5, 10))
+                continue
+            if is_rest:
+                self.rate_limiter.observe(response.headers.get('X-Shopify-Shop-Api-Call-Limit'))
+            if response.status_code not in RETRY_STATUS_CODES or attempt == SHOPIFY_MAX_RETRIES:
+                return response
+            retry_after = response.headers.get('Retry-After')
+            try:
+                wait = float(retry_after) if retry_after else min(2 ** attempt * 0.5, 10)
+            except ValueError:
+                wait = 1.0
+            response.close()
+            time.sleep(wait)
+        return response
+
+    def _get_json(self, url, endpoint, params=None, ttl=0):
+        """
+        GET REST pasando por el caché HTTP: una entrada fresca no hace request
+        y una vencida se revalida con ETag / Last-Modified (304 = sin cuerpo).
+        El cuerpo se reduce a los campos del reporte (slim_payload), venga de
+        la API o del caché. Devuelve (status, data, next_url, error).
+        """
+        entry = self.http_cache.get(url, params) if self.http_cache else None
+        if entry and HTTPCache.is_fresh(entry):
+            transfer_stats.record(fresh_hit=True)
+            return 200, entry['data'], entry.get('next_url'), None
+
+        response = self._request("GET", url, params=params, headers=HTTPCache.conditional_headers(entry) if entry else {})
+        record_response(response)
+        if response.status_code == 304 and entry:
+            self.http_cache.touch(url, params, entry, ttl)
+            return 200, entry['data'], entry.get('next_url'), None
+        if response.status_code != 200:
+            return response.status_code, None, None, response.text
+
+        data = slim_payload(endpoint, response.json())
+        next_url = response.links.get('next', {}).get('url')
+        if self.http_cache:
+            self.http_cache.store(url, params, response, data, ttl, next_url)
+        return 200, data, next_url, None
 
     def _get_rest_data(self, endpoint, params=None):
         url = f"{self.base_url}/{endpoint}"
-        response = requests.get(url, headers=self.headers, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error en {self.shop['name']} ({endpoint}): {response.status_code} - {response.text}")
-            return None
-            
+        status, data, _, error = self._get_json(url, endpoint, params, ttl_for(endpoint, params))
+        if status != 200:
+            raise ShopifyAPIError(f"Error en {self.shop['name']} ({endpoint}): {status} - {error}")
+        return data
+
+    def _iter_rest_pages(self, endpoint, params, key):
+        """
+        Recorre todas las páginas de un endpoint REST siguiendo el header Link
+        y devuelve los elementos de `key` uno a uno. Si está instalado ijson, el
+        JSON se parsea en streaming sin cargar la página completa en memoria.
+        """
+        url = f"{self.base_url}/{endpoint}"
+        ttl = ttl_for(endpoint, params)
+        if self.http_cache and ttl > 0:
+            # Período cerrado: las páginas se guardan en el caché (sin streaming)
+            while url:
+                status, data, url, error = self._get_json(url, endpoint, params, ttl)
+                if status != 200:
+                    raise ShopifyAPIError(f"Error en {self.shop['name']} ({endpoint}): {status} - {error}")
+                yield from data.get(key, [])
+                params = None
+            return
+
+        while url:
+            response = self._request("GET", url, params=params, stream=ijson is not None)
+            if response.status_code != 200:
+                raise ShopifyAPIError(f"Error en {self.shop['name']} ({endpoint}): {response.status_code} - {response.text}")
+            if ijson is not None:
+                response.raw.decode_content = True
+                reader = CountingReader(response.raw)
+                yield from ijson.items(reader, f"{key}.item")
+                record_response(response, body_bytes=reader.bytes)
+            else:
+                yield from response.json().get(key, [])
+                record_response(response)
+            # page_info ya incluye los filtros de la primera consulta
+            url = response.links.get('next', {}).get('url')
+            params = None
+
+    def _fetch_orders(self, params):
+        """Órdenes de todas las páginas, reducidas a registros compactos"""
+        if ORDERS_BACKEND == 'graphql':
+            return self._fetch_orders_graphql(params)
+        return [Order.from_payload(order) for order in self._iter_rest_pages("orders.json", params, "orders")]
+
+    def _split_windows(self, start_date, final_date, slices):
+        """
+        Parte el período en hasta `slices` ventanas (inicio, fin) con zona:
+        un rango por grupos de días locales, un día único por bloques de horas.
+        """
+        days = (final_date - start_date).days + 1
+        if days > 1:
+            per_slice = -(-days // min(slices, days))
+            windows = []
+            day = start_date
+            while day <= final_date:
+                last = min(day + timedelta(days=per_slice - 1), final_date)
+                start_local, end_local, _ = self._get_local_range(day, last)
+                windows.append((start_local, end_local))
+                day = last + timedelta(days=1)
+            return windows
+
+        start_local, end_local, _ = self._get_local_range(start_date, final_date)
+        hours = -(-24 // min(slices, 24))
+        windows = []
+        window_start = start_local
+        while window_start <= end_local:
+            window_end = min(window_start + timedelta(hours=hours) - timedelta(microseconds=1), end_local)
+            windows.append((window_start, window_end))
+            window_start = window_end + timedelta(microseconds=1)
+        return windows
+
+    def _fetch_orders_sliced(self, params, windows):
+        """Consulta las ventanas en paralelo y une los resultados en orden cronológico"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def fetch(window):
+            return self._fetch_orders({
+                **params,
+                "created_at_min": window[0].astimezone(timezone.utc).isoformat(),
+                "created_at_max": window[1].astimezone(timezone.utc).isoformat()
+            })
+
+        with ThreadPoolExecutor(max_workers=len(windows)) as executor:
+            results = list(executor.map(bind_session(fetch), windows))
+        return [order for window_orders in results for order in window_orders]
+
+    def _fetch_orders_graphql(self, params):
+        """
+        Órdenes vía GraphQL pidiendo solo los campos del reporte.
+        El tamaño de cada página se ajusta a los puntos disponibles
+        (extensions.cost.throttleStatus) y, si no alcanzan, se espera
+        solo lo necesario para que se recarguen. Shopify valida contra el
+        costo pedido (no el real), así que el tamaño sale del costo
+        calculado de la query (utils/graphql_cost.py).
+        """
+        filters = [f"created_at:>='{params['created_at_min']}'", f"created_at:<='{params['created_at_max']}'"]
+        if params.get('updated_at_min'):
+            filters.append(f"updated_at:>='{params['updated_at_min']}'")
+        search = " ".join(filters)
+
+        tz, _ = self._get_local_tz()
+        orders = []
+        cursor = None
+        # Página más grande que entra en el límite de costo por query
+        page_variables = {"lineItems": GRAPHQL_LINE_ITEMS_PAGE}
+        full_page = max_page_size(GRAPHQL_ORDERS_QUERY, page_variables, MAX_QUERY_COST, maximum=GRAPHQL_MAX_PAGE)
+        # Con muy pocos puntos conviene esperar un poco antes que pedir páginas mínimas
+        min_page = max(1, full_page // 4)
+        while True:
+            first = full_page
+            available = self.graphql_budget.available()
+            if available is not None:
+                first = max_page_size(GRAPHQL_ORDERS_QUERY, page_variables, available, maximum=full_page)
+                if first < min_page:
+                    # Esperar solo los puntos de una página mínima (no de una completa)
+                    self.graphql_budget.wait_for(query_cost(GRAPHQL_ORDERS_QUERY, {**page_variables, "first": min_page}))
+                    first = min_page
+
+            result = self._execute_graphql(GRAPHQL_ORDERS_QUERY, {**page_variables, "first": first, "after": cursor, "query": search})
+            if result.get('errors'):
+                if self._is_throttled(result):
+                    # La página no se cobró: volver a pedirla con los puntos actualizados
+                    continue
+                raise ShopifyAPIError(f"Error GraphQL en {self.shop['name']}: {result['errors']}")
+
+            connection = result['data']['orders']
+            nodes = connection['nodes']
+            self._fetch_remaining_line_items(nodes)
+            orders.extend(Order.from_graphql(node, tz) for node in nodes)
+            if not connection['pageInfo']['hasNextPage']:
+                break
+            cursor = connection['pageInfo']['endCursor']
+        return orders
+
+    @staticmethod
+    def _is_throttled(result):
+        """THROTTLED con throttleStatus: la query no se cobró y se sabe cuánto esperar"""
+        return (any(e.get('extensions', {}).get('code') == 'THROTTLED' for e in result.get('errors') or ())
+                and bool(result.get('extensions', {}).get('cost', {}).get('throttleStatus')))
+
+    @staticmethod
+    def _missing_line_items(node):
+        """
+        Cota de las líneas que faltan: cada línea tiene al menos una unidad,
+        así que no pueden ser más que las unidades que faltan
+        """
+        connection = node['lineItems']
+        total_units = node.get('subtotalLineItemsQuantity')
+        if total_units is None:
+            return GRAPHQL_MAX_PAGE
+        fetched_units = sum(item.get('quantity') or 0 for item in connection['nodes'])
+        return max(1, min(GRAPHQL_MAX_PAGE, total_units - fetched_units))
+
+    def _fetch_remaining_line_items(self, nodes):
+        """
+        Completa en los nodos las líneas que no entraron en la página de
+        órdenes. Las órdenes pendientes van en lote (una query con un alias
+        por orden) que entra en los puntos disponibles; cada una pide solo
+        las líneas que le pueden faltar.
+        """
+        pending = [node for node in nodes if node['lineItems']['pageInfo']['hasNextPage']]
+        single = _line_items_batch_query(1)
+        base_cost = query_cost(single, {"first0": 0})
+        per_item = query_cost(single, {"first0": 1}) - base_cost
+        while pending:
+            available = self.graphql_budget.available()
+            budget = MAX_QUERY_COST if available is None else min(MAX_QUERY_COST, available)
+            batch, cost = [], 0
+            for node in pending:
+                first = self._missing_line_items(node)
+                node_cost = base_cost + first * per_item
+                if batch and cost + node_cost > budget:
+                    break
+                batch.append((node, first))
+                cost += node_cost
+            # Si ni la primera orden entra, esperar solo los puntos que le faltan
+            self.graphql_budget.wait_for(cost)
+
+            variables = {}
+            for i, (node, first) in enumerate(batch):
+                variables.update({f"id{i}": node['id'], f"first{i}": first,
+                                  f"after{i}": node['lineItems']['pageInfo']['endCursor']})
+            result = self._execute_graphql(_line_items_batch_query(len(batch)), variables)
+            errors = result.get('errors')
+            if self._is_throttled(result):
+                continue  # No se cobró: se rearma el lote con los puntos actualizados
+            data = result.get('data') or {}
+            missing = [node['id'] for i, (node, _) in enumerate(batch) if not data.get(f"o{i}")]
+            if errors or missing:
+                raise ShopifyAPIError(f"Error GraphQL en {self.shop['name']} (líneas de {len(batch)} órdenes): "
+                                      f"{errors or f'órdenes no encontradas: {missing}'}")
+            for i, (node, _) in enumerate(batch):
+                page = data[f"o{i}"]['lineItems']
+                node['lineItems']['nodes'].extend(page['nodes'])
+                node['lineItems']['pageInfo'] = page['pageInfo']
+            pending = [node for node in pending if node['lineItems']['pageInfo']['hasNextPage']]
+
     def get_shop_timezone(self):
-        """Obtiene la zona horaria de la tienda"""
+        """
+        Obtiene la zona horaria de la tienda (se consulta una sola vez).
+        Si shop.json falla lanza ShopifyAPIError a propósito, sin caer a UTC:
+        con la zona equivocada los límites del día se corren y los totales
+        salen mal sin ningún aviso. La tienda queda marcada como fallida en
+        el reporte (o corta el job diario).
+        """
+        if getattr(self, '_timezone', None):
+            return self._timezone
+        if self.shop.get('timezone'):
+            # Configurada en el registro: no hace falta consultar shop.json
+            self._timezone = self.shop['timezone']
+            return self._timezone
         data = self._get_rest_data("shop.json")
         if data and 'shop' in data:
-            return data['shop']['iana_timezone']
+            self._timezone = data['shop']['iana_timezone']
+            return self._timezone
         return 'UTC'
-    
-    def _execute_graphql(self, query):
-        """Ejecuta query GraphQL para Analytics"""
-        response = requests.post(self.graphql_url, json={'query': query}, headers=self.headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error GraphQL en {self.shop['name']}: {response.status_code} - {response.text}")
-            return None
 
-    def get_orders_for_period(self, target_date=None, end_date=None, days_ago=None):
-        """
-        Obtiene órdenes para un período específico.
-        Puede ser un día único (target_date) o un rango (target_date a end_date).
-        """
+    def _get_local_tz(self):
+        """Devuelve (tz, nombre) de la tienda, con fallback a UTC"""
         try:
             import pytz
         except ImportError:
             # Fallback si no está instalado pytz, usar UTC
             print("  ⚠️  Librería 'pytz' no instalada. Usando UTC por defecto.")
-            timezone_str = 'UTC'
-            tz = timezone.utc
+            return timezone.utc, 'UTC'
+        timezone_str = self.get_shop_timezone()
+        try:
+            return pytz.timezone(timezone_str), timezone_str
+        except:
+            return timezone.utc, timezone_str
+
+    def _get_local_range(self, start_date, final_date):
+        """Convierte un rango de días locales de la tienda a datetimes con zona"""
+        tz, timezone_str = self._get_local_tz()
+        naive_start = datetime.combine(start_date, datetime.min.time())
+        naive_end = datetime.combine(final_date, datetime.max.time())
+
+        if hasattr(tz, 'localize'):
+            start_local = tz.localize(naive_start)
+            end_local = tz.localize(naive_end)
         else:
-            timezone_str = self.get_shop_timezone()
-            try:
-                tz = pytz.timezone(timezone_str)
-            except:
-                tz = timezone.utc
-            
+            start_local = naive_start.replace(tzinfo=tz)
+            end_local = naive_end.replace(tzinfo=tz)
+        return start_local, end_local, timezone_str
+
+    def get_local_now(self):
+        """Fecha y hora actual en la zona horaria de la tienda"""
+        tz, _ = self._get_local_tz()
+        return datetime.now(timezone.utc).astimezone(tz)
+    
+    def _execute_graphql(self, query, variables=None):
+        """Ejecuta una query GraphQL (órdenes y Analytics)"""
+        payload = {'query': query}
+        if variables:
+            payload['variables'] = variables
+        response = self._request("POST", self.graphql_url, json=payload)
+        record_response(response)
+        if response.status_code != 200:
+            raise ShopifyAPIError(f"Error GraphQL en {self.shop['name']}: {response.status_code} - {response.text}")
+        result = response.json()
+        self.graphql_budget.observe(result.get('extensions', {}).get('cost', {}).get('throttleStatus'))
+        return result
+
+    def get_orders_for_period(self, target_date=None, end_date=None, days_ago=None):
+        """
+        Obtiene órdenes para un período específico.
+        Puede ser un día único (target_date) o un rango (target_date a end_date).
+        """
         # Determinar inicio y fin del rango
         if end_date:
             # Rango de fechas
@@ -100,15 +464,7 @@ class ShopifyFetcher:
             final_date = start_date
 
         # Calcular fechas en la zona horaria de la tienda
-        naive_start = datetime.combine(start_date, datetime.min.time())
-        naive_end = datetime.combine(final_date, datetime.max.time())
-        
-        if hasattr(tz, 'localize'):
-            start_local = tz.localize(naive_start)
-            end_local = tz.localize(naive_end)
-        else:
-            start_local = naive_start.replace(tzinfo=tz)
-            end_local = naive_end.replace(tzinfo=tz)
+        start_local, end_local, timezone_str = self._get_local_range(start_date, final_date)
         
         # Convertir a UTC para la API
         start_utc = start_local.astimezone(timezone.utc)
@@ -121,13 +477,27 @@ class ShopifyFetcher:
             "limit": 250 
         }
         
+        # Días cerrados ya guardados como snapshot: no hace falta consultar la API
+        if ORDERS_SOURCE == 'snapshots' and order_snapshots.has_period(self.shop['url'], start_date, final_date):
+            print(f"  💾 Leyendo snapshots: {start_date} - {final_date}")
+            return order_snapshots.load_orders(self.shop['url'], start_date, final_date)
+        
         print(f"  📅 Consultando {timezone_str}: {start_date} - {final_date}")
         
-        data = self._get_rest_data("orders.json", params)
-        if data and 'orders' in data:
-            orders_count = len(data['orders'])
-            print(f"  ℹ️  Encontradas {orders_count} órdenes para {start_local.strftime('%Y-%m-%d')}")
-            return data['orders']
+        slices = int(self.shop.get('fetch_slices') or ORDER_FETCH_SLICES)
+        if slices > 1:
+            orders = self._fetch_orders_sliced(params, self._split_windows(start_date, final_date, slices))
+        else:
+            orders = self._fetch_orders(params)
+        # Llegar acá implica que todas las páginas vinieron bien (si no,
+        # _fetch_orders lanza ShopifyAPIError): el snapshot queda completo.
+        # Un día sin órdenes también se guarda, para no volver a consultarlo.
+        if order_snapshots.SNAPSHOT_DIR:
+            order_snapshots.write_period(self.shop['url'], start_date, final_date, orders, self.get_local_now().date())
+        if orders:
+            print(f"  ℹ️  Encontradas {len(orders)} órdenes para {start_local.strftime('%Y-%m-%d')}")
+            self._index_customers(orders)
+            return orders
         else:
             print(f"  ⚠️  No se encontraron órdenes para {start_local.strftime('%Y-%m-%d')}")
         return []
@@ -153,30 +523,38 @@ class ShopifyFetcher:
             previous_day = start_date - timedelta(days=1)
             return self.get_orders_for_period(target_date=previous_day)
     
+    def get_orders_updated_since(self, day, updated_since=None):
+        """
+        Obtiene órdenes creadas en el día local `day` que fueron creadas o
+        actualizadas desde `updated_since` (ISO 8601). Sin cursor trae el día completo.
+        Se usa para el reporte intradía: cada consulta trae solo los deltas.
+        """
+        start_local, end_local, _ = self._get_local_range(day, day)
+        params = {
+            "status": "any",
+            "created_at_min": start_local.astimezone(timezone.utc).isoformat(),
+            "created_at_max": end_local.astimezone(timezone.utc).isoformat(),
+            "limit": 250
+        }
+        if updated_since:
+            params["updated_at_min"] = updated_since
+        orders = self._fetch_orders(params)
+        self._index_customers(orders)
+        return orders
+
+    def _index_customers(self, orders):
+        """Registra la primera orden de cada cliente en el índice local"""
+        if not customer_index.enabled():
+            return
+        try:
+            customer_index.record_orders(self.shop['url'], orders)
+        except Exception as e:
+            print(f"  ⚠️  No se pudo actualizar el índice de clientes de {self.shop['name']}: {e}")
+    
     def get_abandoned_checkouts(self, target_date):
         """Obtiene carritos abandonados de una fecha específica"""
-        try:
-            import pytz
-        except ImportError:
-            timezone_str = 'UTC'
-            tz = timezone.utc
-        else:
-            timezone_str = self.get_shop_timezone()
-            try:
-                tz = pytz.timezone(timezone_str)
-            except:
-                tz = timezone.utc
-        
         # Calcular rango del día
-        naive_start = datetime.combine(target_date, datetime.min.time())
-        naive_end = datetime.combine(target_date, datetime.max.time())
-        
-        if hasattr(tz, 'localize'):
-            start_local = tz.localize(naive_start)
-            end_local = tz.localize(naive_end)
-        else:
-            start_local = naive_start.replace(tzinfo=tz)
-            end_local = naive_end.replace(tzinfo=tz)
+        start_local, end_local, _ = self._get_local_range(target_date, target_date)
         
         start_utc = start_local.astimezone(timezone.utc)
         end_utc = end_local.astimezone(timezone.utc)
@@ -188,133 +566,80 @@ class ShopifyFetcher:
             "limit": 250
         }
         
-        data = self._get_rest_data("checkouts.json", params)
-        if data and 'checkouts' in data:
-            checkouts = data['checkouts']
+        checkouts = list(self._iter_rest_pages("checkouts.json", params, "checkouts"))
+        if checkouts:
             print(f"  🛒 Encontrados {len(checkouts)} carritos abandonados")
-            return checkouts
-        return []
+        return checkouts
     
     def get_analytics_by_channel(self, days_ago=1):
         """Obtiene sesiones y conversión por canal usando ShopifyQL"""
         # TEMPORALMENTE DESHABILITADO - ShopifyQL no está disponible en plan básico
-        print(f"  ℹ️  Analytics por canal no disponible (requiere Shopify Plus)")
+        print("  ℹ️  Analytics por canal no disponible (requiere Shopify Plus)")
         return {}
     
     def get_overall_analytics(self, days_ago=1):
         """Obtiene métricas generales del día"""
         # TEMPORALMENTE DESHABILITADO - ShopifyQL no disponible en plan básico
-        print(f"  ℹ️  Analytics generales no disponible (requiere Shopify Plus)")
+        print("  ℹ️  Analytics generales no disponible (requiere Shopify Plus)")
         return {'sessions': 0, 'sales': 0.0, 'orders': 0, 'conversion_rate': 0.0}
 
+    @profiled('process_daily_stats')
     def process_daily_stats(self, orders, is_range=False, start_date=None, end_date=None):
         """Calcula totales basados en la lista de órdenes"""
-        total_sales = 0.0
-        total_orders = len(orders)
-        
         if is_range and start_date and end_date:
             # Para rangos, agrupar por día
-            num_days = (end_date - start_date).days + 1
-            daily_counts = [0] * num_days
+            aggregate = OrderAggregate(num_buckets=(end_date - start_date).days + 1)
         else:
             # Para un solo día, agrupar por hora
-            hourly_counts = [0] * 24
-            daily_counts = None
-        
-        channels = defaultdict(lambda: {'count': 0, 'sales': 0.0})
-
-        for order in orders:
-            # Ventas (usamos total_price)
-            try:
-                total_sales += float(order.get('total_price', 0))
-            except:
-                pass
-    
-            # Agrupar por hora o por día según el caso
-            created_at = datetime.fromisoformat(order['created_at'].replace('Z', '+00:00'))
-            
-            if is_range and start_date and end_date:
-                # Agrupar por día
-                order_date = created_at.date()
-                day_index = (order_date - start_date).days
-                if 0 <= day_index < len(daily_counts):
-                    daily_counts[day_index] += 1
-            else:
-                # Agrupar por hora
-                hour = created_at.hour
-                if 0 <= hour < 24:
-                    hourly_counts[hour] += 1
-
-            # Atribución mejorada: usamos referring_site para ver los canales de marketing reales
-            referring_site = order.get('referring_site', '')
-            source_name = order.get('source_name', '')
-            
-            # Determinar el canal y tipo basado en referring_site
-            channel_type = 'unknown'
-            if referring_site:
-                # Limpiar y categorizar
-                if 'google' in referring_site.lower():
-                    channel = 'Google Search'
-                    channel_type = 'organic' if 'search' in referring_site.lower() or '/url?' in referring_site else 'unknown'
-                elif 'facebook' in referring_site.lower() or 'fb' in referring_site.lower():
-                    channel = 'Facebook'
-                    channel_type = 'paid'  # Facebook suele ser tráfico pago
-                elif 'instagram' in referring_site.lower():
-                    channel = 'Instagram'
-                    channel_type = 'paid'
-                elif 'tiktok' in referring_site.lower():
-                    channel = 'TikTok'
-                    channel_type = 'paid'
-                elif 'pinterest' in referring_site.lower():
-                    channel = 'Pinterest'
-                    channel_type = 'organic'
-                elif 'youtube' in referring_site.lower():
-                    channel = 'YouTube'
-                    channel_type = 'organic'
-                elif 'twitter' in referring_site.lower() or 't.co' in referring_site.lower():
-                    channel = 'Twitter/X'
-                    channel_type = 'organic'
-                else:
-                    # Mostrar el dominio limpio
-                    channel = referring_site.replace('https://', '').replace('http://', '').split('/')[0]
-                    channel_type = 'unknown'
-            else:
-                # Sin referring_site = tráfico directo o app
-                if source_name == 'web':
-                    channel = 'Direct'
-                    channel_type = 'direct'
-                elif source_name in ['iphone', 'android', 'mobile_app']:
-                    channel = f'App ({source_name.title()})'
-                    channel_type = 'direct'
-                else:
-                    channel = source_name if source_name else 'Direct'
-                    channel_type = 'direct'
-            
-            # Guardar con tipo
-            if channel not in channels:
-                channels[channel] = {'count': 0, 'sales': 0.0, 'type': channel_type}
-            
-            channels[channel]['count'] += 1
-            try:
-                channels[channel]['sales'] += float(order.get('total_price', 0))
-            except:
-                pass
+            aggregate = OrderAggregate(num_buckets=24)
 
+        # Productos más vendidos en la misma pasada, con memoria acotada
+        top_products = TopProducts(k=TOP_PRODUCTS_K)
+        has_line_items = False
 
+        for order in orders:
+            aggregate.add(
+                self.get_order_bucket(order, is_range, start_date),
+                parse_price(order.get('total_price', 0)),
+                # Atribución mejorada: usamos referring_site para ver los canales de marketing reales
+                *classify_channel(order.get('referring_site', ''), order.get('source_name', ''))
+            )
+            for line_item in order.get('line_items') or ():
+                top_products.add(*line_item)
+                has_line_items = True
 
         return {
-            "summary": {
-                "Ventas": f"${total_sales:.2f}",
-                "Ordenes": total_orders,
-                "Ticket Prom": f"${(total_sales/total_orders):.2f}" if total_orders > 0 else "$0.00"
-            },
-            "hourly_orders": hourly_counts if not is_range else None,
-            "daily_orders": daily_counts if is_range else None,
-            "attribution": channels,
+            "summary": aggregate.summary(),
+            "hourly_orders": aggregate.bucket_counts if not is_range else None,
+            "hourly_sales": aggregate.bucket_sales if not is_range else None,
+            "daily_sales": aggregate.bucket_sales if is_range else None,
+            "daily_orders": aggregate.bucket_counts if is_range else None,
+            "attribution": aggregate.channels,
+            "top_products": top_products.result() if has_line_items else None,
+            "customers": self._customer_split(orders),
             "is_range": is_range,
             "start_date": start_date,
             "end_date": end_date
         }
+
+    def _customer_split(self, orders):
+        """Órdenes y ventas de clientes nuevos vs. recurrentes (None si no hay datos)"""
+        if not customer_index.enabled():
+            return None
+        try:
+            return customer_index.split_new_returning(self.shop['url'], orders)
+        except Exception as e:
+            print(f"  ⚠️  No se pudo consultar el índice de clientes de {self.shop['name']}: {e}")
+            return None
+
+    def get_order_bucket(self, order, is_range=False, start_date=None):
+        """Índice del bucket (hora del día o día del rango) de una orden"""
+        created_at = datetime.fromisoformat(order['created_at'].replace('Z', '+00:00'))
+        if is_range and start_date:
+            # Agrupar por día
+            return (created_at.date() - start_date).days
+        # Agrupar por hora
+        return created_at.hour
     
     def compare_periods(self, current_stats, previous_stats):
         """Compara dos períodos y calcula % de cambio"""
@@ -337,16 +662,18 @@ class ShopifyFetcher:
             'orders_change': orders_change
         }
 
-def create_chart(data_points, store_name, is_range=False, start_date=None, end_date=None):
-    """Genera y guarda el gráfico PNG de Órdenes por Hora o por Día"""
-    plt.figure(figsize=(10, 3))
+@profiled('create_chart')
+def create_chart(data_points, store_name, is_range=False, start_date=None, end_date=None, title=None, filename=None, profile=None):
+    """Genera y guarda el gráfico de Órdenes por Hora o por Día (resolución y formato según el perfil de salida)"""
+    profile = get_profile(profile)
+    figure = plt.figure(figsize=(10, 3))
     
     if is_range:
         # Gráfico por días
         num_days = len(data_points)
         days = range(num_days)
         plt.bar(days, data_points, color='#008060', alpha=0.7)
-        plt.title(f"Orders by Day - {store_name}", fontsize=10)
+        plt.title(title or f"Orders by Day - {store_name}", fontsize=10)
         plt.xlabel("Day")
         plt.ylabel("Order Count")
         plt.grid(True, axis='y', linestyle='--', alpha=0.3)
@@ -364,27 +691,33 @@ def create_chart(data_points, store_name, is_range=False, start_date=None, end_d
         # Gráfico por horas
         hours = range(len(data_points))
         plt.bar(hours, data_points, color='#008060', alpha=0.7)
-        plt.title(f"Orders by Hour (Yesterday) - {store_name}", fontsize=10)
+        plt.title(title or f"Orders by Hour (Yesterday) - {store_name}", fontsize=10)
         plt.xlabel("Hour of day")
         plt.ylabel("Order Count")
         plt.grid(True, axis='y', linestyle='--', alpha=0.3)
         plt.xticks(hours[::2])  # Mostrar cada 2 horas
     
-    filename = f"temp_chart_{store_name.replace(' ', '_')}.png"
-    plt.savefig(filename, dpi=100, bbox_inches='tight')
-    plt.close()
+    filename = filename or f"temp_chart_{store_name.replace(' ', '_')}.{profile.chart_extension}"
+    save_chart(figure, filename, profile)
+    plt.close(figure)
     return filename
 
-class PDFReport(FPDF):
-    def __init__(self, report_date=None):
-        super().__init__()
+LOGO_PATH = 'static/logo.jpg'
+LOGO_WIDTH_MM = 30
+
+class PDFReport(StreamingFPDF):
+    def __init__(self, report_date=None, stream_to=None, profile=None):
+        # stream_to: escribe cada página al archivo apenas termina (ver utils/streaming_pdf.py)
+        self.profile = get_profile(profile)
+        super().__init__(stream_to=stream_to, compress_level=self.profile.compress_level)
         self.report_date = report_date
+        # El logo se resuelve una vez, reducido a su tamaño impreso; FPDF lo embebe una sola vez
+        self.logo_path = fit_image(LOGO_PATH, LOGO_WIDTH_MM, self.profile) if os.path.exists(LOGO_PATH) else None
         
     def header(self):
         # Logo (si existe)
-        logo_path = 'static/logo.jpg'
-        if os.path.exists(logo_path):
-            self.image(logo_path, x=10, y=8, w=30)  # Logo en la esquina superior izquierda
+        if self.logo_path:
+            self.image(self.logo_path, x=10, y=8, w=LOGO_WIDTH_MM)  # Logo en la esquina superior izquierda
         
         if self.report_date:
             # Título principal: Fecha del reporte
@@ -403,11 +736,103 @@ class PDFReport(FPDF):
             self.set_text_color(0, 0, 0)
             self.ln(18)  # Más espacio para evitar que el título de la tienda pise el logo
 
+    def add_portfolio_summary(self, portfolio):
+        """Página de resumen con el total combinado de todas las tiendas"""
+        self.set_fill_color(240, 240, 240)
+        self.set_font('Arial', 'B', 14)
+        self.cell(0, 12, f" All Stores ({len(portfolio['stores'])})", 0, 1, 'L', 1)
+        self.ln(2)
+
+        # Métricas combinadas (una fila de ventas por moneda si hay varias)
+        col_w = 95
+        self.set_font('Arial', 'B', 11)
+        self.set_fill_color(250, 250, 250)
+        for currency, summary in portfolio['by_currency'].items():
+            label = f"Total Sales ({currency})" if currency else "Total Sales"
+            self.cell(col_w, 10, f"{label}: {summary['Ventas']}", 1, 0, 'L', 1)
+            self.cell(col_w, 10, f"Avg Ticket: {summary['Ticket Prom']}", 1, 1, 'L', 1)
+        self.cell(col_w, 10, f"Orders: {portfolio['total'].total_orders}", 1, 0, 'L', 1)
+        self.cell(col_w, 10, "", 1, 1)
+        self.ln(5)
+
+        if portfolio.get('chart_file'):
+            self.image(portfolio['chart_file'], x=10, w=190)
+            if not portfolio['is_range']:
+                self.set_font('Arial', '', 8)
+                self.set_text_color(128, 128, 128)
+                self.cell(0, 5, "Hours are local to each store.", 0, 1, 'R')
+                self.set_text_color(0, 0, 0)
+            self.ln(2)
+
+        # Participación de cada tienda (dentro de su moneda)
+        self.set_font('Arial', 'B', 10)
+        self.cell(0, 8, "Stores", 0, 1)
+        self.ln(2)
+        self.set_fill_color(245, 245, 245)
+        self.set_font('Arial', 'B', 9)
+        col_w = [80, 30, 50, 30]  # Store, Orders, Sales, % Sales
+        headers = ["Store", "Orders", "Sales", "% Sales"]
+        for i, h in enumerate(headers):
+            self.cell(col_w[i], 7, h, 1, 0, 'C', 1)
+        self.ln()
+        self.set_font('Arial', '', 9)
+        self.set_fill_color(250, 250, 250)
+        for store in portfolio['stores']:
+            currency_total = portfolio['currency_totals'][store['currency']]
+            share = store['sales'] / currency_total * 100 if currency_total else 0
+            self.cell(col_w[0], 7, f"{store['name']} ({store['currency']})"[:40] if store['currency'] else store['name'][:40], 1, 0, 'L', 1)
+            self.cell(col_w[1], 7, str(store['orders']), 1, 0, 'C', 1)
+            self.cell(col_w[2], 7, f"${store['sales']:.2f}", 1, 0, 'R', 1)
+            self.cell(col_w[3], 7, f"{share:.1f}%", 1, 1, 'C', 1)
+        self.ln(10)
+
+        # Mezcla de canales de todas las tiendas
+        self.set_font('Arial', 'B', 10)
+        self.cell(0, 8, "Channel Mix - All Stores", 0, 1)
+        self.ln(2)
+        self.set_fill_color(245, 245, 245)
+        self.set_font('Arial', 'B', 9)
+        mixed_currencies = len(portfolio['by_currency']) > 1
+        col_w = [80, 30, 30, 50]  # Channel, Orders, % Orders, Sales
+        headers = ["Channel", "Orders", "% Orders", "Sales"]
+        for i, h in enumerate(headers):
+            self.cell(col_w[i], 7, h, 1, 0, 'C', 1)
+        self.ln()
+        self.set_font('Arial', '', 9)
+        self.set_fill_color(250, 250, 250)
+        total = portfolio['total']
+        if not total.channels:
+            self.cell(sum(col_w), 7, "No order data", 1, 1, 'C')
+        for channel_name, data in sorted(total.channels.items(), key=lambda x: x[1]['count'], reverse=True):
+            share = data['count'] / total.total_orders * 100 if total.total_orders else 0
+            self.cell(col_w[0], 7, str(channel_name)[:35], 1, 0, 'L', 1)
+            self.cell(col_w[1], 7, str(data['count']), 1, 0, 'C', 1)
+            self.cell(col_w[2], 7, f"{share:.1f}%", 1, 0, 'C', 1)
+            # Con varias monedas la suma de ventas no tiene sentido
+            self.cell(col_w[3], 7, "-" if mixed_currencies else f"${data['sales']:.2f}", 1, 1, 'R', 1)
+        self.ln(10)
+
+    def add_failed_shops_notice(self, failed_shops):
+        """Aviso de las tiendas que quedaron fuera del reporte por un error de la API"""
+        self.set_fill_color(255, 235, 235)
+        self.set_text_color(160, 0, 0)
+        self.set_font('Arial', 'B', 10)
+        self.cell(0, 8, f" Data unavailable for {len(failed_shops)} store(s) - not included in this report:", 0, 1, 'L', 1)
+        self.set_font('Arial', '', 9)
+        for name, error in failed_shops:
+            # FPDF 1.7 solo escribe latin-1
+            self.multi_cell(0, 5, f"  - {name}: {error[:150]}".encode("latin-1", "replace").decode("latin-1"), 0, 'L', 1)
+        self.set_text_color(0, 0, 0)
+        self.ln(5)
+
     def add_store_section(self, store_data):
         # Título Tienda
         self.set_fill_color(240, 240, 240)
         self.set_font('Arial', 'B', 14)
-        self.cell(0, 12, f" {store_data['name']}", 0, 1, 'L', 1)
+        title = f" {store_data['name']}"
+        if store_data.get('currency'):
+            title += f" ({store_data['currency']})"
+        self.cell(0, 12, title, 0, 1, 'L', 1)
         self.ln(2)
         
         # Leyenda Narrativa (estilo Shopify)
@@ -465,42 +890,69 @@ class PDFReport(FPDF):
             self.ln(2)
 
         # Tabla Atribución (Canales de Marketing)
-        self.set_font('Arial', 'B', 10)
-        self.cell(0, 8, "Attribution - Marketing Channels", 0, 1)
-        self.ln(2)
+        if 'attribution' in store_data.get('sections', DEFAULT_SECTIONS):
+            self.set_font('Arial', 'B', 10)
+            self.cell(0, 8, "Attribution - Marketing Channels", 0, 1)
+            self.ln(2)
         
-        # Header Tabla (simplificada)
-        self.set_fill_color(245, 245, 245)
-        self.set_font('Arial', 'B', 9)
-        col_w = [80, 40, 50]  # Channel, Orders, Sales
-        headers = ["Channel", "Orders", "Sales"]
-        for i, h in enumerate(headers):
-            self.cell(col_w[i], 7, h, 1, 0, 'C', 1)
-        self.ln()
+            # Header Tabla (simplificada)
+            self.set_fill_color(245, 245, 245)
+            self.set_font('Arial', 'B', 9)
+            col_w = [80, 40, 50]  # Channel, Orders, Sales
+            headers = ["Channel", "Orders", "Sales"]
+            for i, h in enumerate(headers):
+                self.cell(col_w[i], 7, h, 1, 0, 'C', 1)
+            self.ln()
 
-        # Filas Tabla
-        self.set_font('Arial', '', 9)
-        self.set_fill_color(255, 255, 255)
-        attribution_data = store_data['stats']['attribution']
+            # Filas Tabla
+            self.set_font('Arial', '', 9)
+            self.set_fill_color(255, 255, 255)
+            attribution_data = store_data['stats']['attribution']
         
-        if not attribution_data:
-            self.cell(sum(col_w), 7, "No order data", 1, 1, 'C')
-        else:
-            # Ordenar por ventas (mayor a menor)
-            sorted_channels = sorted(attribution_data.items(), key=lambda x: x[1]['sales'], reverse=True)
+            if not attribution_data:
+                self.cell(sum(col_w), 7, "No order data", 1, 1, 'C')
+            else:
+                # Ordenar por ventas (mayor a menor)
+                sorted_channels = sorted(attribution_data.items(), key=lambda x: x[1]['sales'], reverse=True)
             
-            for channel_name, data in sorted_channels:
-                orders = data.get('orders', data.get('count', 0))
-                sales = data.get('sales', 0.0)
+                for channel_name, data in sorted_channels:
+                    orders = data.get('orders', data.get('count', 0))
+                    sales = data.get('sales', 0.0)
                 
-                # Alternar color de fondo
-                self.set_fill_color(250, 250, 250)
+                    # Alternar color de fondo
+                    self.set_fill_color(250, 250, 250)
                 
-                self.cell(col_w[0], 7, str(channel_name)[:35], 1, 0, 'L', 1)
-                self.cell(col_w[1], 7, str(orders), 1, 0, 'C', 1)
-                self.cell(col_w[2], 7, f"${sales:.2f}", 1, 1, 'R', 1)
+                    self.cell(col_w[0], 7, str(channel_name)[:35], 1, 0, 'L', 1)
+                    self.cell(col_w[1], 7, str(orders), 1, 0, 'C', 1)
+                    self.cell(col_w[2], 7, f"${sales:.2f}", 1, 1, 'R', 1)
         
-        self.ln(10)
+            self.ln(10)
+
+        # Productos más vendidos (por ingresos)
+        top_products = store_data['stats'].get('top_products')
+        if 'top_products' in store_data.get('sections', DEFAULT_SECTIONS) and top_products and top_products['by_revenue']:
+            self.set_font('Arial', 'B', 10)
+            self.cell(0, 8, "Top Products", 0, 1)
+            self.ln(2)
+
+            self.set_fill_color(245, 245, 245)
+            self.set_font('Arial', 'B', 9)
+            col_w = [10, 100, 30, 50]  # #, Product, Units, Revenue
+            headers = ["#", "Product", "Units", "Revenue"]
+            for i, h in enumerate(headers):
+                self.cell(col_w[i], 7, h, 1, 0, 'C', 1)
+            self.ln()
+
+            self.set_font('Arial', '', 9)
+            self.set_fill_color(250, 250, 250)
+            for rank, product in enumerate(top_products['by_revenue'], 1):
+                title = product['title'].encode('latin-1', 'replace').decode('latin-1')
+                self.cell(col_w[0], 7, str(rank), 1, 0, 'C', 1)
+                self.cell(col_w[1], 7, title[:50], 1, 0, 'L', 1)
+                self.cell(col_w[2], 7, str(product['units']), 1, 0, 'C', 1)
+                self.cell(col_w[3], 7, f"${product['revenue']:.2f}", 1, 1, 'R', 1)
+
+            self.ln(10)
         
         # Sección de Carritos Abandonados - SOLO en modo día único
         if 'abandoned_carts' in store_data and store_data['abandoned_carts'] is not None:
@@ -567,8 +1019,287 @@ class PDFReport(FPDF):
             
             self.ln(5)
 
+# --- ETAPAS DEL PIPELINE ---
+
+def fetch_stage(shop_conf, pipeline):
+    """Órdenes del período y del período anterior (y carritos si el tipo de reporte los usa)"""
+    with profile_stage('fetch'):
+        return _fetch_shop_data(shop_conf, pipeline)
+
+def _fetch_shop_data(shop_conf, pipeline):
+    print(f"Procesando {shop_conf['name']}...")
+    period = pipeline.period
+    fetcher = ShopifyFetcher(shop_conf)
+    shop_data = {'shop': shop_conf, 'fetcher': fetcher, 'abandoned_checkouts': []}
+    
+    if ORDERS_SOURCE == 'events':
+        # Agregados precalculados a partir de los webhooks (sin consultar órdenes)
+        shop_data['current_stats'] = load_period_stats(shop_conf['url'], period.start_date, period.end_date)
+        shop_data['previous_stats'] = load_period_stats(shop_conf['url'], period.prev_start, period.prev_end if period.is_range else None)
+    else:
+        shop_data['current_orders'] = fetcher.get_orders_for_date(period.start_date, period.end_date)
+        shop_data['previous_orders'] = fetcher.get_previous_period_orders(period.start_date, period.end_date)
+    
+    # Carritos abandonados: SOLO en modo día único y si la tienda tiene la sección
+    if pipeline.report_type.include_abandoned_carts and 'abandoned_carts' in shop_conf['sections']:
+        shop_data['abandoned_checkouts'] = fetcher.get_abandoned_checkouts(period.start_date)
+    return shop_data
+
+def aggregate_stage(shop_data, pipeline):
+    """Estadísticas por hora (día único) o por día (rango) y resumen de carritos"""
+    period = pipeline.period
+    fetcher = shop_data['fetcher']
+    
+    if 'current_stats' not in shop_data:
+        if period.is_range:
+            shop_data['current_stats'] = fetcher.process_daily_stats(shop_data.pop('current_orders'), is_range=True, start_date=period.start_date, end_date=period.end_date)
+            shop_data['previous_stats'] = fetcher.process_daily_stats(shop_data.pop('previous_orders'), is_range=True, start_date=period.prev_start, end_date=period.prev_end)
+        else:
+            shop_data['current_stats'] = fetcher.process_daily_stats(shop_data.pop('current_orders'), is_range=False)
+            shop_data['previous_stats'] = fetcher.process_daily_stats(shop_data.pop('previous_orders'), is_range=False)
+    
+    abandoned_checkouts = shop_data.pop('abandoned_checkouts')
+    shop_data['abandoned_carts'] = None
+    if abandoned_checkouts:
+        total_value = sum(float(c.get('total_price', 0)) for c in abandoned_checkouts)
+        avg_value = total_value / len(abandoned_checkouts) if abandoned_checkouts else 0
+        
+        carts_list = []
+        for cart in abandoned_checkouts:
+            carts_list.append({
+                'email': cart.get('email', 'No email'),
+                'value': float(cart.get('total_price', 0)),
+                'date': cart.get('created_at', '')
+            })
+        
+        shop_data['abandoned_carts'] = {
+            'count': len(abandoned_checkouts),
+            'total_value': total_value,
+            'avg_value': avg_value,
+            'list': carts_list
+        }
+    return shop_data
+
+def compare_stage(shop_data, pipeline):
+    """Compara contra el período anterior y arma la sección de la tienda"""
+    shop_conf = shop_data['shop']
+    current_stats = shop_data['current_stats']
+    comparison = shop_data['fetcher'].compare_periods(current_stats, shop_data['previous_stats'])
+    
+    return {
+        "name": shop_conf['name'],
+        "stats": current_stats,
+        "comparison": comparison,
+        "chart_file": None,
+        "narrative": _build_narrative(shop_conf['name'], current_stats, comparison, pipeline.report_type.comparison_label),
+        "analytics": {'sessions': 0, 'conversion_rate': 0},
+        "abandoned_carts": shop_data['abandoned_carts'],
+        "sections": shop_conf['sections'],
+        "currency": shop_conf['currency']
+    }
+
+def render_pdf_stage(collected_data, pipeline, profile=None):
+    """Gráficos y PDF del reporte (profile: perfil de salida, ver utils/output_profiles.py)"""
+    filename = f"Reporte_Ventas_{pipeline.period.filename_suffix}.pdf"
+    return _render_pdf(collected_data, pipeline.period.title, filename, profile, pipeline.failed_shops)
+
+def _build_narrative(shop_name, stats, comparison, period_label):
+    """Leyenda narrativa (estilo Shopify) de una tienda"""
+    sales_val = stats['summary']['Ventas']
+    orders_count = stats['summary']['Ordenes']
+    sales_change = comparison['sales_change']
+    orders_change = comparison['orders_change']
+    sales_trend = "an increase" if sales_change >= 0 else "a decrease"
+    orders_trend = "showing" if orders_change >= 0 else "with"
+    
+    narrative = (
+        f"{shop_name} store generated total sales of {sales_val}, "
+        f"{sales_trend} of {abs(sales_change):.0f}% compared to the {period_label}. "
+        f"The store fulfilled {orders_count} orders, {orders_trend} "
+        f"{'+' if orders_change >= 0 else ''}{orders_change:.0f}% change in order volume."
+    )
+    
+    customers = stats.get('customers')
+    total_sales = sum(c['sales'] for c in customers.values()) if customers else 0
+    if total_sales > 0:
+        new, returning = customers['new'], customers['returning']
+        narrative += (
+            f" New customers placed {new['orders']} orders ({new['sales'] / total_sales * 100:.0f}% of sales) "
+            f"and returning customers {returning['orders']} ({returning['sales'] / total_sales * 100:.0f}% of sales)."
+        )
+    return narrative
+
+def shop_report_filename(shop_name, filename_suffix):
+    """Nombre del PDF individual de una tienda"""
+    return f"Reporte_Ventas_{shop_name.replace(' ', '_')}_{filename_suffix}.pdf"
+
+def render_shop_reports(collected_data, report_title_date, filename_suffix, on_ready=None, max_workers=None, profile=None):
+    """
+    Genera un PDF por tienda en paralelo a partir de los datos ya consultados.
+    Usa procesos (matplotlib no es thread-safe) y llama on_ready(store_data, filename)
+    apenas termina cada tienda, así una tienda pesada no demora la entrega de las demás.
+    Devuelve {nombre_tienda: archivo} (None si falló esa tienda).
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    max_workers = max_workers or int(os.getenv("REPORT_RENDER_WORKERS", "0")) or min(len(collected_data), os.cpu_count() or 1)
+    results = {}
+    if not collected_data:
+        return results
+
+    with ProcessPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(_render_pdf, [data], report_title_date, shop_report_filename(data['name'], filename_suffix), profile): data
+            for data in collected_data
+        }
+        for future in as_completed(futures):
+            data = futures[future]
+            try:
+                filename = future.result()
+            except Exception as e:
+                print(f"❌ Error generando el PDF de {data['name']}: {e}")
+                results[data['name']] = None
+                continue
+            results[data['name']] = filename
+            print(f"  📄 PDF de {data['name']} listo: {filename}")
+            if on_ready:
+                on_ready(data, filename)
+    return results
+
+def build_portfolio_summary(collected_data):
+    """
+    Total de todas las tiendas combinando sus agregados (sin volver a las
+    órdenes). Las ventas se suman por moneda; órdenes, distribución y
+    canales, para todas.
+    """
+    aggregates = [OrderAggregate.from_stats(data['stats']) for data in collected_data]
+    by_currency = {}
+    for data, aggregate in zip(collected_data, aggregates):
+        by_currency.setdefault(data.get('currency') or '', []).append(aggregate)
+    first_stats = collected_data[0]['stats']
+    return {
+        "stores": [{
+            "name": data['name'],
+            "currency": data.get('currency') or '',
+            "orders": aggregate.total_orders,
+            "sales": aggregate.total_sales
+        } for data, aggregate in zip(collected_data, aggregates)],
+        "total": OrderAggregate.combine(aggregates),
+        "by_currency": {currency: OrderAggregate.combine(group).summary() for currency, group in by_currency.items()},
+        "currency_totals": {currency: sum(a.total_sales for a in group) for currency, group in by_currency.items()},
+        "is_range": first_stats['is_range'],
+        "start_date": first_stats['start_date'],
+        "end_date": first_stats['end_date'],
+        "chart_file": None
+    }
+
+def _render_pdf(collected_data, report_title_date, filename, profile=None, failed_shops=()):
+    """
+    Genera los gráficos y el PDF a partir de los datos recolectados.
+    failed_shops: [(nombre, error)] de las tiendas que no se pudieron consultar
+    (se avisan al principio del reporte).
+    """
+    profile = get_profile(profile)
+    portfolio = None
+    if REPORT_SUMMARY_PAGE and len(collected_data) > 1:
+        portfolio = build_portfolio_summary(collected_data)
+        portfolio['chart_file'] = create_chart(
+            portfolio['total'].bucket_counts, "All Stores", is_range=portfolio['is_range'],
+            start_date=portfolio['start_date'], end_date=portfolio['end_date'],
+            filename=f"temp_chart_all_stores_{os.getpid()}.{profile.chart_extension}", profile=profile
+        )
+    
+    for data in collected_data:
+        if 'chart' not in data['sections']:
+            continue
+        stats = data['stats']
+        if stats['is_range']:
+            # Gráfico POR DÍA
+            data['chart_file'] = create_chart(stats['daily_orders'], data['name'], is_range=True, start_date=stats['start_date'], end_date=stats['end_date'], profile=profile)
+        else:
+            # Gráfico POR HORA (24 barras)
+            data['chart_file'] = create_chart(stats['hourly_orders'], data['name'], is_range=False, profile=profile)
+    
+    with profile_stage('PDFReport'):
+        with PDFReport(report_date=report_title_date, stream_to=filename, profile=profile) as pdf:
+            pdf.add_page()
+        
+            if failed_shops:
+                pdf.add_failed_shops_notice(failed_shops)
+        
+            if portfolio:
+                pdf.add_portfolio_summary(portfolio)
+                os.remove(portfolio['chart_file'])
+        
+            for idx, data in enumerate(collected_data):
+                if idx > 0 or portfolio:
+                    pdf.add_page()
+                pdf.add_store_section(data)
+                if data['chart_file'] and os.path.exists(data['chart_file']):
+                    os.remove(data['chart_file'])
+        
+            pdf.output(filename)
+    print(f"  📦 {filename}: {os.path.getsize(filename) / 1024:.0f} KB (perfil {profile.name})")
+    return filename
+
+# --- TIPOS DE REPORTE ---
+
+REPORT_TYPES = {
+    # Día único: gráfico por hora y carritos abandonados
+    "daily": ReportType("daily", lambda date, end=None: ReportPeriod(date),
+                        include_abandoned_carts=True, comparison_label="previous day"),
+    # Rango libre: gráfico por día, SIN carritos abandonados
+    "range": ReportType("range", lambda date, end: ReportPeriod(date, end)),
+    # Últimos 7 días terminando en la fecha
+    "weekly": ReportType("weekly", lambda date, end=None: ReportPeriod(date - timedelta(days=6), date)),
+    # Últimos 30 días terminando en la fecha
+    "last_30_days": ReportType("last_30_days", lambda date, end=None: ReportPeriod(date - timedelta(days=29), date)),
+    # Desde el 1 del mes hasta la fecha
+    "month_to_date": ReportType("month_to_date", lambda date, end=None: ReportPeriod(date.replace(day=1), date)),
+}
+
+DEFAULT_STAGES = {
+    "fetch": fetch_stage,
+    "aggregate": aggregate_stage,
+    "compare": compare_stage,
+    "render": render_pdf_stage,
+    "deliver": None
+}
+
+def active_shops():
+    """Tiendas configuradas con token"""
+    return [shop_conf for shop_conf in SHOPS if shop_conf["token"]]
+
+def build_pipeline(report_type_name, date, end_date=None, isolate_shop_errors=True, **stages):
+    """
+    Arma el pipeline de un tipo de reporte. Las etapas se pueden
+    reemplazar por nombre (ej: render=None para obtener solo los datos).
+    Con isolate_shop_errors (default) una tienda cuya consulta falla
+    (ShopifyAPIError) queda fuera y marcada en el reporte; sin él, el error
+    corta el reporte (el job diario, para no guardar datos incompletos).
+    """
+    report_type = REPORT_TYPES[report_type_name]
+    period = report_type.period_fn(date, end_date)
+    return ReportPipeline(report_type, period, active_shops(), {**DEFAULT_STAGES, **stages},
+                          isolated_errors=(ShopifyAPIError,) if isolate_shop_errors else ())
+
+def collect_report_data(start_date, end_date=None):
+    """
+    Consulta y agrega los datos de todas las tiendas, sin gráficos ni PDF.
+    Es la entrada común de todos los formatos de salida (PDF, JSON, CSV, HTML).
+    """
+    report_type_name = "range" if end_date else "daily"
+    return build_pipeline(report_type_name, start_date, end_date, render=None).run()
+
 # --- EJECUCIÓN PRINCIPAL ---
 
+def generate_report(report_type_name, date, end_date=None, isolate_shop_errors=True, **stages):
+    """Genera el PDF de un tipo de reporte. Devuelve el nombre del archivo o None."""
+    filename = build_pipeline(report_type_name, date, end_date, isolate_shop_errors, **stages).run()
+    if filename:
+        print(f"\n✅ Reporte {report_type_name} generado: {filename}")
+        return filename
+    return None
+
 def generate_report_for_date(target_date_str, end_date_str=None):
     """Genera el reporte para una fecha o rango específico (YYYY-MM-DD)"""
     try:
@@ -578,12 +1309,12 @@ def generate_report_for_date(target_date_str, end_date_str=None):
         if end_date_str and end_date_str.strip():
             end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
             print(f"\n🔹 MODO RANGO: Generando reporte para {target_date} - {end_date}...")
-            return _generate_range_report(target_date, end_date)
+            return generate_report("range", target_date, end_date)
         
         # CASO 2: DÍA ÚNICO  
         else:
             print(f"\n🔹 MODO DÍA ÚNICO: Generando reporte para {target_date}...")
-            return _generate_single_day_report(target_date)
+            return generate_report("daily", target_date)
             
     except ValueError as e:
         print(f"Error de formato de fecha: {e}")
@@ -594,178 +1325,13 @@ def generate_report_for_date(target_date_str, end_date_str=None):
         traceback.print_exc()
         return None
 
-def _generate_single_day_report(target_date):
-    """Genera reporte de un día con gráfico por hora y carritos abandonados"""
-    report_title_date = target_date
-    filename_date = target_date.strftime('%Y-%m-%d')
-    
-    collected_data = []
-    
-    for shop_conf in SHOPS:
-        if not shop_conf["token"]: continue
-        
-        print(f"Procesando {shop_conf['name']}...")
-        fetcher = ShopifyFetcher(shop_conf)
-        
-        # Obtener órdenes del día y del día anterior
-        current_orders = fetcher.get_orders_for_date(target_date)
-        previous_orders = fetcher.get_previous_period_orders(target_date)
-        
-        # Procesar estadísticas (POR HORA para día único)
-        current_stats = fetcher.process_daily_stats(current_orders, is_range=False)
-        previous_stats = fetcher.process_daily_stats(previous_orders, is_range=False)
-        
-        # Obtener carritos abandonados (SOLO en modo día único)
-        abandoned_checkouts = fetcher.get_abandoned_checkouts(target_date)
-        abandoned_carts_data = None
-        
-        if abandoned_checkouts:
-            total_value = sum(float(c.get('total_price', 0)) for c in abandoned_checkouts)
-            avg_value = total_value / len(abandoned_checkouts) if abandoned_checkouts else 0
-            
-            carts_list = []
-            for cart in abandoned_checkouts:
-                carts_list.append({
-                    'email': cart.get('email', 'No email'),
-                    'value': float(cart.get('total_price', 0)),
-                    'date': cart.get('created_at', '')
-                })
-            
-            abandoned_carts_data = {
-                'count': len(abandoned_checkouts),
-                'total_value': total_value,
-                'avg_value': avg_value,
-                'list': carts_list
-            }
-        
-        # Comparar períodos
-        comparison = fetcher.compare_periods(current_stats, previous_stats)
-        
-        # Generar gráfico POR HORA (24 barras)
-        chart_path = create_chart(current_stats['hourly_orders'], shop_conf['name'], is_range=False)
-        
-        # Narrativa
-        sales_val = current_stats['summary']['Ventas']
-        orders_count = current_stats['summary']['Ordenes']
-        sales_change = comparison['sales_change']
-        orders_change = comparison['orders_change']
-        sales_trend = "an increase" if sales_change >= 0 else "a decrease"
-        orders_trend = "showing" if orders_change >= 0 else "with"
-        
-        narrative = (
-            f"{shop_conf['name']} store generated total sales of {sales_val}, "
-            f"{sales_trend} of {abs(sales_change):.0f}% compared to the previous day. "
-            f"The store fulfilled {orders_count} orders, {orders_trend} "
-            f"{'+' if orders_change >= 0 else ''}{orders_change:.0f}% change in order volume."
-        )
-        
-        collected_data.append({
-            "name": shop_conf['name'],
-            "stats": current_stats,
-            "comparison": comparison,
-            "chart_file": chart_path,
-            "narrative": narrative,
-            "analytics": {'sessions': 0, 'conversion_rate': 0},
-            "abandoned_carts": abandoned_carts_data  # INCLUIDO en día único
-        })
-    
-    # Generar PDF
-    if collected_data:
-        pdf = PDFReport(report_date=report_title_date)
-        pdf.add_page()
-        
-        for idx, data in enumerate(collected_data):
-            if idx > 0:
-                pdf.add_page()
-            pdf.add_store_section(data)
-            if os.path.exists(data['chart_file']):
-                os.remove(data['chart_file'])
-        
-        filename = f"Reporte_Ventas_{filename_date}.pdf"
-        pdf.output(filename)
-        print(f"\n✅ Reporte de día único generado: {filename}")
-        return filename
-    return None
-
-def _generate_range_report(start_date, end_date):
-    """Genera reporte de rango con gráfico por día y SIN carritos abandonados"""
-    report_title_date = f"{start_date.strftime('%b %d')} - {end_date.strftime('%b %d, %Y')}"
-    filename_date = f"{start_date.strftime('%Y-%m-%d')}_to_{end_date.strftime('%Y-%m-%d')}"
-    
-    collected_data = []
-    
-    for shop_conf in SHOPS:
-        if not shop_conf["token"]: continue
-        
-        print(f"Procesando {shop_conf['name']}...")
-        fetcher = ShopifyFetcher(shop_conf)
-        
-        # Obtener órdenes del rango y del período anterior
-        current_orders = fetcher.get_orders_for_date(start_date, end_date)
-        previous_orders = fetcher.get_previous_period_orders(start_date, end_date)
-        
-        # Procesar estadísticas (POR DÍA para rangos)
-        current_stats = fetcher.process_daily_stats(current_orders, is_range=True, start_date=start_date, end_date=end_date)
-        
-        # Calcular fechas del período anterior
-        duration = (end_date - start_date).days + 1
-        prev_end = start_date - timedelta(days=1)
-        prev_start = prev_end - timedelta(days=duration - 1)
-        previous_stats = fetcher.process_daily_stats(previous_orders, is_range=True, start_date=prev_start, end_date=prev_end)
-        
-        # NO obtener carritos abandonados en modo rango
-        abandoned_carts_data = None
-        
-        # Comparar períodos
-        comparison = fetcher.compare_periods(current_stats, previous_stats)
-        
-        # Generar gráfico POR DÍA
-        chart_path = create_chart(current_stats['daily_orders'], shop_conf['name'], is_range=True, start_date=start_date, end_date=end_date)
-        
-        # Narrativa
-        sales_val = current_stats['summary']['Ventas']
-        orders_count = current_stats['summary']['Ordenes']
-        sales_change = comparison['sales_change']
-        orders_change = comparison['orders_change']
-        sales_trend = "an increase" if sales_change >= 0 else "a decrease"
-        orders_trend = "showing" if orders_change >= 0 else "with"
-        
-        narrative = (
-            f"{shop_conf['name']} store generated total sales of {sales_val}, "
-            f"{sales_trend} of {abs(sales_change):.0f}% compared to the previous period. "
-            f"The store fulfilled {orders_count} orders, {orders_trend} "
-            f"{'+' if orders_change >= 0 else ''}{orders_change:.0f}% change in order volume."
-        )
-        
-        collected_data.append({
-            "name": shop_conf['name'],
-            "stats": current_stats,
-            "comparison": comparison,
-            "chart_file": chart_path,
-            "narrative": narrative,
-            "analytics": {'sessions': 0, 'conversion_rate': 0},
-            "abandoned_carts": None  # EXCLUIDO en rangos
-        })
-    
-    # Generar PDF
-    if collected_data:
-        pdf = PDFReport(report_date=report_title_date)
-        pdf.add_page()
-        
-        for idx, data in enumerate(collected_data):
-            if idx > 0:
-                pdf.add_page()
-            pdf.add_store_section(data)
-            if os.path.exists(data['chart_file']):
-                os.remove(data['chart_file'])
-        
-        filename = f"Reporte_Ventas_{filename_date}.pdf"
-        pdf.output(filename)
-        print(f"\n✅ Reporte de rango generado: {filename}")
-        return filename
-    return None
-
 if __name__ == "__main__":
+    import sys
     # Por defecto genera el reporte de ayer
+    # Uso: python main.py [daily|weekly|last_30_days|month_to_date] [YYYY-MM-DD]
     yesterday = datetime.now() - timedelta(days=1)
-    generate_report_for_date(yesterday.strftime('%Y-%m-%d'))
+    if len(sys.argv) > 1 and sys.argv[1] in REPORT_TYPES:
+        anchor = datetime.strptime(sys.argv[2], '%Y-%m-%d').date() if len(sys.argv) > 2 else yesterday.date()
+        generate_report(sys.argv[1], anchor)
+    else:
+        generate_report_for_date(yesterday.strftime('%Y-%m-%d'))
@@ -0,0 +1,75 @@
+"""
+Herramienta local para reproducir webhooks de órdenes sin Shopify.
+
+Lee un archivo JSONL (un evento por línea) y envía cada evento firmado con
+SHOPIFY_WEBHOOK_SECRET al receptor de app.py usando el cliente de pruebas
+de Flask, de modo que todo el camino (HMAC, log de eventos y agregados)
+se puede probar offline.
+
+Formato de cada línea:
+    {"topic": "orders/create", "shop": "mitienda.myshopify.com", "order": {...}}
+
+Uso:
+    python replay_webhooks.py eventos.jsonl
+"""
+
+import os
+import sys
+import json
+import hmac
+import base64
+import hashlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Sin secreto configurado se usa uno local para poder firmar
+os.environ.setdefault("SHOPIFY_WEBHOOK_SECRET", "replay-secret")
+
+from app import app
+
+
+def sign(raw_body, secret):
+    digest = hmac.new(secret.encode('utf-8'), raw_body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def replay_file(path):
+    """Envía todos los eventos del archivo. Devuelve (ok, fallidos)."""
+    secret = os.environ["SHOPIFY_WEBHOOK_SECRET"]
+    client = app.test_client()
+    ok = failed = 0
+
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            raw_body = json.dumps(event['order']).encode('utf-8')
+            response = client.post(
+                f"/webhooks/{event['topic']}",
+                data=raw_body,
+                content_type='application/json',
+                headers={
+                    'X-Shopify-Hmac-Sha256': sign(raw_body, secret),
+                    'X-Shopify-Shop-Domain': event['shop'],
+                    'X-Shopify-Webhook-Id': event.get('webhook_id', f"replay-{line_number}")
+                }
+            )
+            if response.status_code == 200:
+                ok += 1
+            else:
+                failed += 1
+                print(f"  ❌ Línea {line_number}: {response.status_code}")
+
+    return ok, failed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    ok, failed = replay_file(sys.argv[1])
+    print(f"✅ Eventos procesados: {ok}  ❌ Fallidos: {failed}")
+
@@ -0,0 +1,58 @@
+"""
+Prueba del detector de anomalías (utils/anomaly.py).
+
+- Durante el calentamiento (ANOMALY_MIN_SAMPLES días) no hay alertas.
+- Un salto grande sobre una serie estable alerta; una variación chica no.
+- Re-ejecutar el job para un día ya observado no vuelve a sumar el valor a
+  la media EWMA ni repite la alerta.
+
+Uso:
+    python test_anomaly.py      (o con pytest)
+"""
+
+import os
+import tempfile
+from datetime import date, timedelta
+
+from utils.anomaly import MIN_SAMPLES, AnomalyMonitor
+
+START = date(2025, 11, 1)
+
+
+def _warm_up(monitor, days=MIN_SAMPLES + 3):
+    for i in range(days):
+        # Serie estable: 40 o 42 órdenes por día
+        assert monitor.observe("Shop A", START + timedelta(days=i), {"orders": 40 + 2 * (i % 2)}) == []
+    return START + timedelta(days=days)
+
+
+def test_spike_alerts_after_warm_up():
+    with tempfile.TemporaryDirectory() as tmp:
+        monitor = AnomalyMonitor(os.path.join(tmp, "anomaly_state.json"))
+        day = _warm_up(monitor)
+
+        assert monitor.observe("Shop A", day, {"orders": 43}) == []
+        (alert,) = monitor.observe("Shop A", day + timedelta(days=1), {"orders": 120})
+        assert alert["metric"] == "orders" and alert["direction"] == "spike"
+
+
+def test_rerun_of_an_observed_day_is_ignored():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "anomaly_state.json")
+        monitor = AnomalyMonitor(path)
+        day = _warm_up(monitor)
+
+        assert monitor.observe("Shop A", day, {"orders": 120})
+        series = list(monitor.state["shops"]["Shop A"]["series"]["orders"])
+
+        # Mismo día (o uno anterior) en una nueva corrida: sin alerta ni cambios en la serie
+        rerun = AnomalyMonitor(path)
+        assert rerun.observe("Shop A", day, {"orders": 120}) == []
+        assert rerun.observe("Shop A", day - timedelta(days=1), {"orders": 500}) == []
+        assert rerun.state["shops"]["Shop A"]["series"]["orders"] == series
+
+
+if __name__ == "__main__":
+    for test in (test_spike_alerts_after_warm_up, test_rerun_of_an_observed_day_is_ignored):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,117 @@
+"""
+Prueba de la reanudación con checkpoint (utils/checkpoint.py).
+
+Una corrida del pipeline en la que falla la consulta de una tienda se corta
+sin guardarla; la siguiente corrida para la misma fecha recupera las
+tiendas ya guardadas (sin volver a consultarlas), consulta solo la que
+faltó y genera el PDF. Una tercera corrida no repite nada, y las entregas
+marcadas como hechas no se vuelven a hacer.
+
+Uso:
+    python test_checkpoint.py      (o con pytest)
+"""
+
+import os
+import tempfile
+from datetime import date
+
+from utils.checkpoint import RunCheckpoint, checkpointed_stages
+from utils.pipeline import ReportPeriod, ReportPipeline, ReportType
+
+RUN_DATE = date(2025, 11, 27)
+SHOPS = [{"name": "Shop A"}, {"name": "Shop B"}, {"name": "Shop C"}]
+
+
+class FakeStages:
+    """Etapas que registran qué tiendas se consultaron y cuántas veces se renderizó"""
+
+    def __init__(self, output_dir, failing=()):
+        self.output_dir = output_dir
+        self.failing = set(failing)
+        self.fetched = []
+        self.renders = 0
+
+    def fetch(self, shop_conf, pipeline):
+        self.fetched.append(shop_conf["name"])
+        if shop_conf["name"] in self.failing:
+            raise RuntimeError(f"Error en {shop_conf['name']}: 503")
+        return {"name": shop_conf["name"], "orders": len(shop_conf["name"])}
+
+    def aggregate(self, shop_data, pipeline):
+        return {**shop_data, "start_date": RUN_DATE}
+
+    def compare(self, shop_data, pipeline):
+        return shop_data
+
+    def render(self, collected_data, pipeline):
+        self.renders += 1
+        filename = os.path.join(self.output_dir, "Reporte.pdf")
+        with open(filename, "w") as f:
+            f.write(",".join(data["name"] for data in collected_data))
+        return filename
+
+    def as_dict(self):
+        return {"fetch": self.fetch, "aggregate": self.aggregate, "compare": self.compare, "render": self.render}
+
+
+def _run(checkpoint_dir, stages):
+    checkpoint = RunCheckpoint("daily", RUN_DATE, checkpoint_dir)
+    checkpoint.start_attempt()
+    pipeline = ReportPipeline(ReportType("daily", ReportPeriod), ReportPeriod(RUN_DATE), SHOPS,
+                              checkpointed_stages(checkpoint, stages.as_dict()))
+    return pipeline.run(), pipeline
+
+
+def test_resume_skips_saved_shops_and_report():
+    with tempfile.TemporaryDirectory() as tmp:
+        # 1ra corrida: Shop B falla y corta la corrida sin PDF
+        first = FakeStages(tmp, failing={"Shop B"})
+        try:
+            _run(tmp, first)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("La falla de Shop B tenía que cortar la corrida")
+        assert first.renders == 0
+        saved = RunCheckpoint("daily", RUN_DATE, tmp)
+        assert saved.get_shop("Shop B") is None
+        assert saved.get_shop("Shop A")["start_date"] == RUN_DATE  # Las fechas sobreviven al JSON
+
+        # 2da corrida: solo se consulta lo que faltó
+        second = FakeStages(tmp)
+        output, pipeline = _run(tmp, second)
+        assert set(second.fetched) == {"Shop B"} | ({"Shop C"} - set(saved.data["shops"]))
+        assert second.renders == 1
+        assert [data["name"] for data in pipeline.collected_data] == ["Shop A", "Shop B", "Shop C"]
+        with open(output) as f:
+            assert f.read() == "Shop A,Shop B,Shop C"
+
+        # 3ra corrida: todo recuperado del checkpoint
+        third = FakeStages(tmp)
+        assert _run(tmp, third)[0] == output
+        assert third.fetched == [] and third.renders == 0
+        assert RunCheckpoint("daily", RUN_DATE, tmp).data["attempts"] == 3
+
+
+def test_delivered_sinks_are_not_repeated():
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = RunCheckpoint("daily", RUN_DATE, tmp)
+        checkpoint.mark_sink("email", "done")
+        checkpoint.mark_sink("monday", "failed", "timeout")
+
+        resumed = RunCheckpoint("daily", RUN_DATE, tmp)
+        assert resumed.sink_done("email")
+        assert not resumed.sink_done("monday")
+        assert resumed.failed_sinks() == ["monday"]
+
+        # --force: se descarta el progreso pero se conserva la cuenta de intentos
+        resumed.start_attempt()
+        resumed.reset()
+        assert not RunCheckpoint("daily", RUN_DATE, tmp).sink_done("email")
+        assert RunCheckpoint("daily", RUN_DATE, tmp).data["attempts"] == 1
+
+
+if __name__ == "__main__":
+    for test in (test_resume_skips_saved_shops_and_report, test_delivered_sinks_are_not_repeated):
+        test()
+        print(f"✅ {test.__name__}")
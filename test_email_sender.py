@@ -0,0 +1,113 @@
+"""
+Prueba de los reintentos de SMTPMailer (utils/email_sender.py) con un
+servidor SMTP falso que responde un guion de resultados por envío.
+
+- 4xx: error temporal, se reintenta por la misma conexión.
+- 5xx: error permanente, no se reintenta.
+- Conexión caída: se cierra el socket y se reconecta.
+- Destinatarios rechazados (todos o algunos): no se reintenta, para no
+  duplicar el correo a los que sí lo recibieron.
+
+Uso:
+    python test_email_sender.py      (o con pytest)
+"""
+
+import smtplib
+
+from utils import email_sender
+from utils.email_sender import SMTPMailer
+
+
+class FakeSMTP:
+    """Reemplaza a smtplib.SMTP: cada send_message consume el próximo resultado del guion"""
+
+    script = []
+    instances = []
+
+    def __init__(self, host, port, timeout=None):
+        self.sent = 0
+        self.closed = False
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg):
+        self.sent += 1
+        result = FakeSMTP.script.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+def _send(script, recipients=("a@example.com", "b@example.com")):
+    """Envía un mensaje con el guion dado. Devuelve (resultado, conexiones abiertas)."""
+    FakeSMTP.script = list(script)
+    FakeSMTP.instances = []
+    real_smtp, real_sleep = email_sender.smtplib.SMTP, email_sender.time.sleep
+    email_sender.smtplib.SMTP = FakeSMTP
+    email_sender.time.sleep = lambda seconds: None
+    try:
+        with SMTPMailer("smtp.example.com", 587, "user", "password", max_retries=2) as mailer:
+            ok = mailer.send(list(recipients), "Reporte")
+    finally:
+        email_sender.smtplib.SMTP, email_sender.time.sleep = real_smtp, real_sleep
+    assert not FakeSMTP.script, "Quedaron resultados sin consumir"
+    return ok, FakeSMTP.instances
+
+
+def test_temporary_error_is_retried_on_the_same_connection():
+    ok, connections = _send([smtplib.SMTPResponseException(451, b"Try again later"), {}])
+    assert ok
+    assert len(connections) == 1 and connections[0].sent == 2
+
+
+def test_permanent_error_is_not_retried():
+    ok, connections = _send([smtplib.SMTPResponseException(550, b"Mailbox unavailable")])
+    assert not ok
+    assert connections[0].sent == 1
+
+
+def test_temporary_errors_give_up_after_max_retries():
+    error = smtplib.SMTPResponseException(421, b"Service not available")
+    ok, connections = _send([error, error, error])
+    assert not ok
+    assert connections[0].sent == 3
+
+
+def test_disconnect_reconnects_and_closes_the_old_socket():
+    ok, connections = _send([smtplib.SMTPServerDisconnected("Connection unexpectedly closed"), {}])
+    assert ok
+    assert len(connections) == 2
+    assert connections[0].closed and connections[0].sent == 1
+    assert connections[1].sent == 1
+
+
+def test_some_recipients_refused_is_not_retried():
+    ok, connections = _send([{"b@example.com": (550, b"No such user")}])
+    assert ok
+    assert connections[0].sent == 1
+
+
+def test_all_recipients_refused_is_not_retried():
+    refused = {"a@example.com": (550, b"No such user"), "b@example.com": (550, b"No such user")}
+    ok, connections = _send([smtplib.SMTPRecipientsRefused(refused)])
+    assert not ok
+    assert connections[0].sent == 1
+
+
+if __name__ == "__main__":
+    for test in (test_temporary_error_is_retried_on_the_same_connection, test_permanent_error_is_not_retried,
+                 test_temporary_errors_give_up_after_max_retries, test_disconnect_reconnects_and_closes_the_old_socket,
+                 test_some_recipients_refused_is_not_retried, test_all_recipients_refused_is_not_retried):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,22 @@
+"""
+Regresión del backend GraphQL contra el simulador local de Shopify.
+
+Una tienda chica (~50 órdenes/día, algunas con más líneas de las que entran
+en la página de órdenes): el reporte diario tiene que salir con pocas
+queries y sin respuestas THROTTLED (ver load_test.check_graphql_usage).
+
+Uso:
+    python test_graphql_backend.py      (o con pytest)
+"""
+
+from load_test import run_load_test
+
+
+def test_graphql_queries_and_throttles():
+    result = run_load_test(shops=1, orders_per_day=50, report_type="daily", backend="graphql", check=True)
+    assert result["orders"] > 0
+
+
+if __name__ == "__main__":
+    test_graphql_queries_and_throttles()
+    print("✅ test_graphql_queries_and_throttles")
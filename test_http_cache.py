@@ -0,0 +1,108 @@
+"""
+Prueba del caché HTTP (utils/http_cache.py) contra el simulador local.
+
+- ttl_for: shop.json y los días cerrados tienen TTL; el día en curso y las
+  consultas incrementales (updated_at_min) siempre se revalidan.
+- Una entrada fresca se sirve sin request; una vencida se revalida con
+  If-None-Match y el 304 reutiliza el cuerpo guardado.
+- En disco queda solo el cuerpo reducido (sin email ni datos del cliente).
+
+Uso:
+    python test_http_cache.py      (o con pytest)
+"""
+
+import os
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from main import ShopifyFetcher
+from utils import http_cache
+from utils.http_cache import HTTPCache, ttl_for, transfer_stats
+from utils.shopify_simulator import start_simulator
+from utils.shop_registry import _normalize
+
+NOW = datetime(2025, 11, 27, 12, 0, tzinfo=timezone.utc)
+
+
+def _orders_params(created_at_max, **extra):
+    return {"status": "any", "created_at_min": (created_at_max - timedelta(days=1)).isoformat(),
+            "created_at_max": created_at_max.isoformat(), "limit": 250, **extra}
+
+
+def test_ttl_for_closed_and_open_periods():
+    closed = NOW - timedelta(hours=http_cache.SETTLE_HOURS + 1)
+    recent = NOW - timedelta(hours=1)
+
+    assert ttl_for("shop.json", now=NOW) == http_cache.SHOP_TTL
+    assert ttl_for("orders.json", _orders_params(closed), now=NOW) == http_cache.CLOSED_TTL
+    assert ttl_for("checkouts.json", _orders_params(closed), now=NOW) == http_cache.CLOSED_TTL
+    # Día todavía abierto: pueden entrar órdenes nuevas
+    assert ttl_for("orders.json", _orders_params(recent), now=NOW) == 0
+    # Consulta incremental: el resultado cambia aunque el período esté cerrado
+    assert ttl_for("orders.json", _orders_params(closed, updated_at_min=closed.isoformat()), now=NOW) == 0
+    # Sin created_at_max o en otros endpoints no hay TTL
+    assert ttl_for("orders.json", {"status": "any"}, now=NOW) == 0
+    assert ttl_for("products.json", _orders_params(closed), now=NOW) == 0
+
+
+def _fetcher(base_url, cache_dir):
+    fetcher = ShopifyFetcher(_normalize({"name": "Cache Shop", "url": "cache-shop.myshopify.com",
+                                         "token": "simulated", "api_base_url": base_url}))
+    fetcher.http_cache = HTTPCache(cache_dir)
+    return fetcher
+
+
+def test_etag_revalidation_and_fresh_hits():
+    server, base_url = start_simulator(orders_per_day=30)
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            fetcher = _fetcher(base_url, cache_dir)
+            url = f"{fetcher.base_url}/orders.json"
+            params = _orders_params(datetime.now(timezone.utc) - timedelta(days=5))
+
+            transfer_stats.reset()
+            status, first, _, _ = fetcher._get_json(url, "orders.json", params, ttl=0)
+            assert status == 200 and first["orders"]
+
+            # TTL 0: se revalida con el ETag y el 304 devuelve el mismo cuerpo
+            status, second, _, _ = fetcher._get_json(url, "orders.json", params, ttl=0)
+            assert status == 200 and second == first
+            assert server.state.stats["not_modified"] == 1
+            assert transfer_stats.summary()["requests"] == 2
+
+            # Tras el 304 la entrada queda con el TTL nuevo: se sirve sin request
+            fetcher._get_json(url, "orders.json", params, ttl=3600)
+            status, third, _, _ = fetcher._get_json(url, "orders.json", params, ttl=3600)
+            assert status == 200 and third == first
+            summary = transfer_stats.summary()
+            assert summary["requests"] == 3 and summary["fresh_hits"] == 1
+    finally:
+        server.shutdown()
+
+
+def test_cache_stores_slim_payload():
+    server, base_url = start_simulator(orders_per_day=30)
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            fetcher = _fetcher(base_url, cache_dir)
+            url = f"{fetcher.base_url}/orders.json"
+            fetcher._get_json(url, "orders.json", _orders_params(datetime.now(timezone.utc) - timedelta(days=5)),
+                              ttl=3600)
+
+            (name,) = os.listdir(cache_dir)
+            assert os.stat(os.path.join(cache_dir, name)).st_mode & 0o777 == 0o600
+            with open(os.path.join(cache_dir, name)) as f:
+                entry = json.load(f)
+            order = entry["data"]["orders"][0]
+            assert "email" not in order and "customer" not in order
+            assert set(order) == set(http_cache.ORDER_FIELDS) | {"line_items", "customer_key"}
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    for test in (test_ttl_for_closed_and_open_periods, test_etag_revalidation_and_fresh_hits,
+                 test_cache_stores_slim_payload):
+        test()
+        print(f"✅ {test.__name__}")
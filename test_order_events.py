@@ -0,0 +1,85 @@
+"""
+Prueba del webhook de órdenes (app.py) y del log de eventos
+(utils/order_events.py).
+
+- Sin firma, o con una firma HMAC inválida, el webhook responde 401 y no
+  guarda nada.
+- Un reintento de Shopify (mismo X-Shopify-Webhook-Id) no se suma dos veces.
+- Una actualización reemplaza la contribución anterior de la orden, y una
+  versión más vieja que llega tarde se ignora.
+
+Uso:
+    python test_order_events.py      (o con pytest)
+"""
+
+import os
+import hmac
+import json
+import base64
+import hashlib
+import tempfile
+from datetime import date
+
+import app as webapp
+from utils import order_events
+
+SECRET = "test-secret"
+SHOP = "events-shop.myshopify.com"
+DAY = date(2025, 11, 27)
+
+
+def _order(total, updated_at):
+    return {"id": 1001, "created_at": "2025-11-27T10:15:00-06:00", "updated_at": updated_at,
+            "total_price": total, "referring_site": "", "source_name": "web"}
+
+
+def _post(client, order, webhook_id, signature=None, action="create"):
+    body = json.dumps(order).encode()
+    if signature is None:
+        signature = base64.b64encode(hmac.new(SECRET.encode(), body, hashlib.sha256).digest()).decode()
+    headers = {"X-Shopify-Shop-Domain": SHOP, "X-Shopify-Webhook-Id": webhook_id}
+    if signature:
+        headers["X-Shopify-Hmac-Sha256"] = signature
+    return client.post(f"/webhooks/orders/{action}", data=body, headers=headers)
+
+
+def _day_stats(db_path):
+    return order_events.load_period_stats(SHOP, DAY, db_path=db_path)["summary"]
+
+
+def test_webhook_signature_replay_and_out_of_order_updates():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "events.db")
+        real_db, real_secret = order_events.DB_PATH, os.environ.get("SHOPIFY_WEBHOOK_SECRET")
+        order_events.DB_PATH = db_path
+        os.environ["SHOPIFY_WEBHOOK_SECRET"] = SECRET
+        try:
+            client = webapp.app.test_client()
+
+            assert _post(client, _order("10.00", "2025-11-27T10:15:00-06:00"), "w1", signature="").status_code == 401
+            assert _post(client, _order("10.00", "2025-11-27T10:15:00-06:00"), "w1", signature="bm9wZQ==").status_code == 401
+            assert order_events.load_daily_aggregates(SHOP, DAY, DAY, db_path) == {}
+
+            assert _post(client, _order("10.00", "2025-11-27T10:15:00-06:00"), "w1").status_code == 200
+            # Reintento del mismo webhook: no se suma de nuevo
+            assert _post(client, _order("10.00", "2025-11-27T10:15:00-06:00"), "w1").status_code == 200
+            assert _day_stats(db_path)["Ordenes"] == 1
+
+            # Actualización: reemplaza la contribución anterior
+            assert _post(client, _order("25.00", "2025-11-27T11:00:00-06:00"), "w2", action="updated").status_code == 200
+            # Versión vieja que llega tarde: se ignora
+            assert _post(client, _order("12.00", "2025-11-27T10:30:00-06:00"), "w3", action="updated").status_code == 200
+            summary = _day_stats(db_path)
+            assert summary["Ordenes"] == 1
+            assert summary["Ventas"] == "$25.00"
+        finally:
+            order_events.DB_PATH = real_db
+            if real_secret is None:
+                os.environ.pop("SHOPIFY_WEBHOOK_SECRET", None)
+            else:
+                os.environ["SHOPIFY_WEBHOOK_SECRET"] = real_secret
+
+
+if __name__ == "__main__":
+    test_webhook_signature_replay_and_out_of_order_updates()
+    print("✅ test_webhook_signature_replay_and_out_of_order_updates")
@@ -0,0 +1,77 @@
+"""
+Prueba de SingleFlight (utils/single_flight.py): llamadas concurrentes con
+la misma clave ejecutan la función una sola vez y comparten el resultado o
+la excepción; al terminar, la clave se libera.
+
+Uso:
+    python test_single_flight.py      (o con pytest)
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.single_flight import SingleFlight
+
+CALLERS = 8
+
+
+def _concurrent_calls(flight, key, fn):
+    """Lanza CALLERS llamadas a la vez; devuelve (resultado o excepción, compartido) de cada una"""
+    barrier = threading.Barrier(CALLERS)
+
+    def call():
+        barrier.wait()
+        try:
+            return flight.do(key, fn)
+        except Exception as e:
+            return e, None
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+        return list(executor.map(lambda _: call(), range(CALLERS)))
+
+
+def _slow(result, calls, release):
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fn
+
+
+def test_concurrent_calls_share_one_execution():
+    flight, calls, release = SingleFlight(), [], threading.Event()
+    threading.Timer(0.2, release.set).start()
+    results = _concurrent_calls(flight, "report", _slow("Reporte.pdf", calls, release))
+
+    assert len(calls) == 1
+    assert all(result == "Reporte.pdf" for result, _ in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * (CALLERS - 1)
+
+    # La clave quedó libre: la próxima llamada vuelve a ejecutar
+    assert flight.do("report", lambda: "nuevo") == ("nuevo", False)
+
+
+def test_errors_are_shared_and_not_cached():
+    flight, calls, release = SingleFlight(), [], threading.Event()
+    threading.Timer(0.2, release.set).start()
+    error = RuntimeError("Shopify no respondió")
+    results = _concurrent_calls(flight, "report", _slow(error, calls, release))
+
+    assert len(calls) == 1
+    assert all(result is error for result, _ in results)
+    assert flight.do("report", lambda: "ok") == ("ok", False)
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("b", lambda: 2) == (2, False)
+
+
+if __name__ == "__main__":
+    for test in (test_concurrent_calls_share_one_execution, test_errors_are_shared_and_not_cached,
+                 test_different_keys_run_separately):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,98 @@
+"""
+Prueba del top de productos (utils/topk.py) contra los totales exactos.
+
+Simula un período con 1500 SKUs aleatorios de 8 caracteres (ventas con
+distribución de cola larga) y compara el top por ingresos y por unidades
+contra un conteo exacto, en modo exacto y forzando los count-min sketch.
+
+Uso:
+    python test_topk.py      (o con pytest)
+"""
+
+import math
+import random
+import string
+from collections import defaultdict
+
+from utils.topk import CountMinSketch, TopProducts
+
+NUM_SKUS = 1500
+NUM_LINES = 20000
+K = 10
+
+
+def _period(seed=7, skew=0.8):
+    rng = random.Random(seed)
+    skus = [''.join(rng.choices(string.ascii_uppercase + string.digits, k=8)) for _ in range(NUM_SKUS)]
+    weights = [1 / (i + 1) ** skew for i in range(NUM_SKUS)]
+    lines = []
+    exact = defaultdict(lambda: [0, 0.0])
+    for sku in rng.choices(skus, weights, k=NUM_LINES):
+        quantity = rng.randint(1, 3)
+        revenue = round(rng.uniform(5, 80), 2) * quantity
+        lines.append((sku, f"Producto {sku}", quantity, revenue))
+        exact[sku][0] += quantity
+        exact[sku][1] += revenue
+    return lines, exact
+
+
+def _top(lines, **kwargs):
+    top = TopProducts(k=K, **kwargs)
+    for line in lines:
+        top.add(*line)
+    return top
+
+
+def test_exact_totals():
+    lines, exact = _period()
+    top = _top(lines)
+    assert top.is_exact
+    result = top.result()
+    expected = sorted(exact, key=lambda sku: exact[sku][1], reverse=True)[:K]
+    assert [p['sku'] for p in result['by_revenue']] == expected
+    for product in result['by_revenue'] + result['by_units']:
+        assert product['units'] == exact[product['sku']][0]
+        assert product['revenue'] == round(exact[product['sku']][1], 2)
+
+
+def test_sketch_within_bound():
+    # Sin sesgo: el peor caso para el sketch (ningún producto domina)
+    lines, exact = _period(skew=0.0)
+    top = _top(lines, exact_limit=0)
+    assert not top.is_exact
+    total = sum(revenue for _, revenue in exact.values())
+    bound = math.e / top.width * total
+    for product in top.result()['by_revenue']:
+        actual = exact[product['sku']][1]
+        assert actual - 0.01 <= product['revenue'] <= actual + bound, (product, actual, bound)
+
+
+def test_rows_are_independent():
+    # Dos claves que chocan en una fila casi nunca chocan en todas
+    rng = random.Random(1)
+    sketch = CountMinSketch()
+    first_row = {}
+    row0_collisions = all_rows = 0
+    for _ in range(20000):
+        key = ''.join(rng.choices(string.ascii_uppercase + string.digits, k=8))
+        indexes = sketch.indexes(key)
+        other = first_row.setdefault(indexes[0], (key, indexes))
+        if other[0] != key:
+            row0_collisions += 1
+            all_rows += other[1] == indexes
+    assert row0_collisions > 1000
+    assert all_rows == 0
+
+
+def test_merge_matches_single_pass():
+    lines, _ = _period()
+    half = len(lines) // 2
+    merged = _top(lines[:half])
+    merged.merge(_top(lines[half:]))
+    assert merged.result() == _top(lines).result()
+
+
+if __name__ == "__main__":
+    for test in (test_exact_totals, test_sketch_within_bound, test_rows_are_independent, test_merge_matches_single_pass):
+        test()
+        print(f"✅ {test.__name__}")
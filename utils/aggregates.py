@@ -0,0 +1,170 @@
+"""
+Agregados incrementales de órdenes.
+
+Permite sumar (y restar) la contribución de cada orden a los buckets
+por hora o por día, al total de ventas y a la atribución por canal,
+sin volver a recorrer la lista completa de órdenes.
+
+Dos agregados del mismo período se combinan con merge (asociativo y
+conmutativo): así se arma el total de varias tiendas, o se juntan los
+resultados parciales de workers con shards (to_dict / from_dict), sin
+volver a las órdenes.
+"""
+
+
+def parse_price(value):
+    """Convierte un precio de Shopify (string) a float, 0.0 si no es válido"""
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def classify_channel(referring_site, source_name):
+    """
+    Determina el canal de marketing y su tipo a partir de referring_site
+    y source_name de la orden.
+
+    Returns:
+        tuple: (canal, tipo) donde tipo es organic, paid, direct o unknown.
+    """
+    referring_site = referring_site or ''
+    source_name = source_name or ''
+
+    if referring_site:
+        # Limpiar y categorizar
+        site = referring_site.lower()
+        if 'google' in site:
+            channel_type = 'organic' if 'search' in site or '/url?' in referring_site else 'unknown'
+            return 'Google Search', channel_type
+        if 'facebook' in site or 'fb' in site:
+            return 'Facebook', 'paid'  # Facebook suele ser tráfico pago
+        if 'instagram' in site:
+            return 'Instagram', 'paid'
+        if 'tiktok' in site:
+            return 'TikTok', 'paid'
+        if 'pinterest' in site:
+            return 'Pinterest', 'organic'
+        if 'youtube' in site:
+            return 'YouTube', 'organic'
+        if 'twitter' in site or 't.co' in site:
+            return 'Twitter/X', 'organic'
+        # Mostrar el dominio limpio
+        domain = referring_site.replace('https://', '').replace('http://', '').split('/')[0]
+        return domain, 'unknown'
+
+    # Sin referring_site = tráfico directo o app
+    if source_name == 'web':
+        return 'Direct', 'direct'
+    if source_name in ['iphone', 'android', 'mobile_app']:
+        return f'App ({source_name.title()})', 'direct'
+    return (source_name if source_name else 'Direct'), 'direct'
+
+
+def build_summary(total_sales, total_orders):
+    """Arma el bloque 'summary' con el mismo formato que usa el PDF"""
+    return {
+        "Ventas": f"${total_sales:.2f}",
+        "Ordenes": total_orders,
+        "Ticket Prom": f"${(total_sales/total_orders):.2f}" if total_orders > 0 else "$0.00"
+    }
+
+
+class OrderAggregate:
+    """
+    Totales de un período: conteo y ventas por bucket (hora o día),
+    totales generales y atribución por canal.
+    """
+
+    def __init__(self, num_buckets=24):
+        self.bucket_counts = [0] * num_buckets
+        self.bucket_sales = [0.0] * num_buckets
+        self.total_sales = 0.0
+        self.total_orders = 0
+        self.channels = {}
+
+    def add(self, bucket, total_price, channel, channel_type, sign=1):
+        """Suma (sign=1) o resta (sign=-1) la contribución de una orden"""
+        self.total_orders += sign
+        self.total_sales += sign * total_price
+
+        if bucket is not None and 0 <= bucket < len(self.bucket_counts):
+            self.bucket_counts[bucket] += sign
+            self.bucket_sales[bucket] += sign * total_price
+
+        if channel not in self.channels:
+            self.channels[channel] = {'count': 0, 'sales': 0.0, 'type': channel_type}
+        self.channels[channel]['count'] += sign
+        self.channels[channel]['sales'] += sign * total_price
+        if self.channels[channel]['count'] <= 0:
+            del self.channels[channel]
+
+    def remove(self, bucket, total_price, channel, channel_type):
+        self.add(bucket, total_price, channel, channel_type, sign=-1)
+
+    def merge(self, other):
+        """
+        Suma otro agregado con los mismos buckets. El resultado no depende del
+        orden ni del agrupamiento de los merges. Devuelve self.
+        """
+        if len(other.bucket_counts) != len(self.bucket_counts):
+            raise ValueError(f"Buckets distintos: {len(self.bucket_counts)} vs {len(other.bucket_counts)}")
+        self.bucket_counts = [a + b for a, b in zip(self.bucket_counts, other.bucket_counts)]
+        self.bucket_sales = [a + b for a, b in zip(self.bucket_sales, other.bucket_sales)]
+        self.total_sales += other.total_sales
+        self.total_orders += other.total_orders
+        for channel, values in other.channels.items():
+            entry = self.channels.setdefault(channel, {'count': 0, 'sales': 0.0, 'type': values['type']})
+            entry['count'] += values['count']
+            entry['sales'] += values['sales']
+        return self
+
+    @classmethod
+    def combine(cls, aggregates, num_buckets=24):
+        """Nuevo agregado con la suma de todos (no modifica los originales)"""
+        aggregates = list(aggregates)
+        result = cls(num_buckets=len(aggregates[0].bucket_counts) if aggregates else num_buckets)
+        for aggregate in aggregates:
+            result.merge(aggregate)
+        return result
+
+    def summary(self):
+        return build_summary(self.total_sales, self.total_orders)
+
+    def to_dict(self):
+        """Representación serializable a JSON"""
+        return {
+            'bucket_counts': self.bucket_counts,
+            'bucket_sales': self.bucket_sales,
+            'total_sales': self.total_sales,
+            'total_orders': self.total_orders,
+            'channels': self.channels
+        }
+
+    @classmethod
+    def from_stats(cls, stats):
+        """
+        Reconstruye el agregado desde las estadísticas de un período
+        (process_daily_stats / load_period_stats), por ejemplo las guardadas
+        en un checkpoint. Todas las órdenes tienen canal, así que el total de
+        ventas sale exacto de la atribución.
+        """
+        counts = stats['daily_orders'] if stats['is_range'] else stats['hourly_orders']
+        sales = stats.get('daily_sales' if stats['is_range'] else 'hourly_sales') or [0.0] * len(counts)
+        aggregate = cls(num_buckets=len(counts))
+        aggregate.bucket_counts = list(counts)
+        aggregate.bucket_sales = list(sales)
+        aggregate.channels = {name: dict(values) for name, values in stats['attribution'].items()}
+        aggregate.total_orders = stats['summary']['Ordenes']
+        aggregate.total_sales = sum(values['sales'] for values in aggregate.channels.values())
+        return aggregate
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls(num_buckets=len(data['bucket_counts']))
+        aggregate.bucket_counts = list(data['bucket_counts'])
+        aggregate.bucket_sales = list(data['bucket_sales'])
+        aggregate.total_sales = data['total_sales']
+        aggregate.total_orders = data['total_orders']
+        aggregate.channels = {name: dict(values) for name, values in data['channels'].items()}
+        return aggregate
@@ -0,0 +1,212 @@
+"""
+Alertas de anomalías en ventas, órdenes y carritos abandonados.
+
+Por cada tienda se mantienen series con media y varianza exponenciales
+(EWMA) que se actualizan en línea con cada día cerrado, sin releer
+historia: órdenes y ventas del día, por hora y por canal, y cantidad de
+carritos abandonados. Un valor se marca como anómalo si se aleja de la
+media más de ANOMALY_Z_THRESHOLD desvíos.
+
+Se engancha a la etapa aggregate del pipeline (with_anomaly_alerts), así
+que la alerta sale por email apenas se agregan los datos de la tienda, antes
+de que se genere y envíe el PDF.
+
+Variables de entorno:
+    ANOMALY_STATE_PATH         Estado de las series (default: anomaly_state.json)
+    ANOMALY_ALPHA              Peso del último día en la EWMA (default: 0.1)
+    ANOMALY_Z_THRESHOLD        Desvíos para marcar una anomalía (default: 3)
+    ANOMALY_MIN_SAMPLES        Días de historia antes de alertar (default: 7)
+    ANOMALY_ALERT_RECIPIENTS   Destinatarios (default: los de la tienda o EMAIL_RECIPIENTS)
+"""
+
+import os
+import json
+import math
+import threading
+
+from utils.email_sender import SMTPMailer
+
+STATE_PATH = os.getenv("ANOMALY_STATE_PATH", "anomaly_state.json")
+ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.1"))
+Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3"))
+MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "7"))
+
+# Anomalías por email (las de mayor desvío primero)
+MAX_ALERTS_PER_EMAIL = 10
+
+
+class EWMAStats:
+    """Media y varianza exponenciales de una serie, actualizadas en O(1)"""
+
+    __slots__ = ('mean', 'var', 'count')
+
+    def __init__(self, mean=0.0, var=0.0, count=0):
+        self.mean = mean
+        self.var = var
+        self.count = count
+
+    def score(self, value, unit=1.0):
+        """
+        Desvíos respecto de la media (None durante el calentamiento). `unit`
+        es el tamaño de un evento (1 para conteos, el ticket promedio para
+        ventas): el desvío nunca es menor que el de un conteo Poisson, así una
+        serie casi siempre en cero no alerta por una sola orden.
+        """
+        if self.count < MIN_SAMPLES:
+            return None
+        std = max(math.sqrt(self.var), math.sqrt(max(abs(self.mean), unit) * unit))
+        return (value - self.mean) / std
+
+    def update(self, value, alpha=ALPHA):
+        if self.count == 0:
+            self.mean = float(value)
+        else:
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.var = (1 - alpha) * (self.var + diff * increment)
+        self.count += 1
+
+    def to_list(self):
+        return [self.mean, self.var, self.count]
+
+
+def shop_metrics(shop_data, include_carts=False):
+    """Valores del día a vigilar y tamaño de un evento por serie: ({serie: valor}, {serie: unidad})"""
+    stats = shop_data['current_stats']
+    summary = stats['summary']
+    metrics = {
+        'orders': summary['Ordenes'],
+        'sales': float(summary['Ventas'].replace('$', '').replace(',', ''))
+    }
+    average_ticket = metrics['sales'] / metrics['orders'] if metrics['orders'] else 1.0
+    for hour, count in enumerate(stats.get('hourly_orders') or ()):
+        metrics[f'orders@{hour:02d}h'] = count
+    for hour, sales in enumerate(stats.get('hourly_sales') or ()):
+        metrics[f'sales@{hour:02d}h'] = sales
+    for channel, values in (stats.get('attribution') or {}).items():
+        metrics[f'orders[{channel}]'] = values['count']
+        metrics[f'sales[{channel}]'] = values['sales']
+    if include_carts:
+        metrics['abandoned_carts'] = (shop_data.get('abandoned_carts') or {}).get('count', 0)
+    units = {name: average_ticket for name in metrics if name.startswith('sales')}
+    return metrics, units
+
+
+class AnomalyMonitor:
+    """
+    Estado persistente de las series de todas las tiendas.
+
+    Uso:
+        monitor = AnomalyMonitor()
+        anomalies = monitor.observe("Tienda A", date, {"orders": 42, "sales": 1800.0}, {"sales": 45.0})
+    """
+
+    def __init__(self, path=None):
+        self.path = path or STATE_PATH
+        self.lock = threading.Lock()
+        self.state = {"shops": {}}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.state = json.load(f)
+
+    def _save(self):
+        """Escritura atómica para no dejar el estado a medias"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    def observe(self, shop_name, day, metrics, units=None):
+        """
+        Compara los valores del día contra sus series y los incorpora.
+        `units` da el tamaño de un evento por serie (default 1).
+        Un día ya observado no se vuelve a sumar (re-ejecuciones del job) y
+        no genera alertas. Devuelve la lista de anomalías.
+        """
+        with self.lock:
+            shop_state = self.state["shops"].setdefault(shop_name, {"last_date": None, "series": {}})
+            if shop_state["last_date"] and day.isoformat() <= shop_state["last_date"]:
+                return []
+
+            series = shop_state["series"]
+            # Las series conocidas que no aparecen hoy (ej: un canal sin órdenes) valen 0
+            values = {name: 0 for name in series}
+            values.update(metrics)
+
+            anomalies = []
+            for name, value in values.items():
+                stats = EWMAStats(*series.get(name, ()))
+                z = stats.score(value, (units or {}).get(name, 1.0))
+                if z is not None and abs(z) >= Z_THRESHOLD:
+                    anomalies.append({
+                        "metric": name,
+                        "value": value,
+                        "expected": stats.mean,
+                        "z": z,
+                        "direction": "spike" if z > 0 else "drop"
+                    })
+                stats.update(value)
+                series[name] = stats.to_list()
+
+            shop_state["last_date"] = day.isoformat()
+            self._save()
+        return sorted(anomalies, key=lambda a: abs(a["z"]), reverse=True)
+
+
+def format_alert(shop_name, day, anomalies):
+    """Asunto y cuerpo (texto plano) del email de alerta"""
+    subject = f"⚠️ Shopify alert - {shop_name} - {day.isoformat()}: {len(anomalies)} unusual metrics"
+    lines = [f"Unusual values detected for {shop_name} on {day.isoformat()}:", ""]
+    for a in anomalies[:MAX_ALERTS_PER_EMAIL]:
+        lines.append(f"- {a['metric']}: {a['value']:,.2f} ({a['direction']}, expected ~{a['expected']:,.2f}, {a['z']:+.1f}σ)")
+    if len(anomalies) > MAX_ALERTS_PER_EMAIL:
+        lines.append(f"... and {len(anomalies) - MAX_ALERTS_PER_EMAIL} more")
+    lines += ["", "The full report will follow."]
+    return subject, "\n".join(lines)
+
+
+def send_alert(shop_conf, day, anomalies):
+    """Envía la alerta por email (o la imprime si no hay SMTP configurado)"""
+    subject, body = format_alert(shop_conf['name'], day, anomalies)
+    recipients = ([r.strip() for r in os.getenv("ANOMALY_ALERT_RECIPIENTS", "").split(",") if r.strip()]
+                  or shop_conf.get('recipients')
+                  or [r.strip() for r in os.getenv("EMAIL_RECIPIENTS", "").split(",") if r.strip()])
+    mailer = SMTPMailer()
+    if not mailer.configured or not recipients:
+        print(f"  🚨 {subject}\n{body}")
+        return False
+    try:
+        with mailer:
+            return mailer.send(recipients, subject, body)
+    except Exception as e:
+        print(f"  ⚠️  Error enviando alerta de {shop_conf['name']}: {e}")
+        return False
+
+
+def with_anomaly_alerts(stages, monitor=None):
+    """
+    Envuelve la etapa aggregate para vigilar cada tienda apenas se agregan sus
+    datos. Solo aplica a reportes de un día (los rangos no actualizan las series).
+    """
+    monitor = monitor or AnomalyMonitor()
+    aggregate = stages["aggregate"]
+
+    def aggregate_stage(shop_data, pipeline):
+        shop_data = aggregate(shop_data, pipeline)
+        if pipeline.period.is_range or "current_stats" not in shop_data:
+            return shop_data
+        shop_conf = shop_data['shop']
+        try:
+            include_carts = pipeline.report_type.include_abandoned_carts and 'abandoned_carts' in shop_conf['sections']
+            anomalies = monitor.observe(shop_conf['name'], pipeline.period.start_date,
+                                        *shop_metrics(shop_data, include_carts))
+            if anomalies:
+                print(f"  🚨 {shop_conf['name']}: {len(anomalies)} métricas fuera de lo normal")
+                send_alert(shop_conf, pipeline.period.start_date, anomalies)
+        except Exception as e:
+            # Una alerta nunca frena el reporte
+            print(f"  ⚠️  Error evaluando anomalías de {shop_conf['name']}: {e}")
+        return shop_data
+
+    return {**stages, "aggregate": aggregate_stage}
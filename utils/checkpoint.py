@@ -0,0 +1,183 @@
+"""
+Checkpoints de ejecución para jobs reanudables.
+
+Cada corrida (ej: el job diario de una fecha) guarda en un JSON lo que ya
+terminó: la sección agregada de cada tienda, el PDF generado y el estado de
+cada destino de entrega (email, Monday, ...). Si el job falla a mitad de
+camino, la siguiente corrida para la misma fecha retoma desde ahí y solo
+repite lo que faltó.
+
+Variables de entorno:
+    CHECKPOINT_DIR              Carpeta de checkpoints (default: checkpoints)
+    CHECKPOINT_RETENTION_DAYS   Días que se conservan (default: 7)
+"""
+
+import os
+import json
+import threading
+from datetime import date, datetime, timedelta
+
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "checkpoints")
+RETENTION_DAYS = int(os.getenv("CHECKPOINT_RETENTION_DAYS", "7"))
+
+
+def _encode(value):
+    """Las fechas se guardan marcadas para poder restaurarlas al leer"""
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"No serializable: {type(value).__name__}")
+
+
+def _decode(obj):
+    if set(obj) == {"__date__"}:
+        return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+class RunCheckpoint:
+
+    def __init__(self, job_name, run_date, checkpoint_dir=None):
+        self.checkpoint_dir = checkpoint_dir or CHECKPOINT_DIR
+        self.path = os.path.join(self.checkpoint_dir, f"{job_name}_{run_date}.json")
+        self._lock = threading.Lock()
+        self.data = self._load() or {
+            "job": job_name,
+            "run_date": str(run_date),
+            "attempts": 0,
+            "shops": {},
+            "report": None,
+            "sinks": {},
+            "completed": False
+        }
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return json.load(f, object_hook=_decode)
+
+    def _save(self):
+        """Escritura atómica: un corte a mitad de la escritura no corrompe el checkpoint"""
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, default=_encode)
+        os.replace(tmp_path, self.path)
+
+    def start_attempt(self):
+        with self._lock:
+            self.data["attempts"] += 1
+            self.data["last_attempt_at"] = datetime.now().isoformat(timespec='seconds')
+            self._save()
+        return self.data["attempts"]
+
+    @property
+    def completed(self):
+        return self.data["completed"]
+
+    def mark_completed(self):
+        with self._lock:
+            self.data["completed"] = True
+            self._save()
+
+    def reset(self):
+        """Descarta el progreso guardado (para forzar una corrida completa)"""
+        with self._lock:
+            attempts = self.data["attempts"]
+            self.data.update({"shops": {}, "report": None, "sinks": {}, "completed": False, "attempts": attempts})
+            self._save()
+
+    # --- Tiendas ---
+
+    def get_shop(self, shop_name):
+        return self.data["shops"].get(shop_name)
+
+    def save_shop(self, shop_name, store_data):
+        # Se llama desde los threads del pipeline
+        with self._lock:
+            self.data["shops"][shop_name] = dict(store_data)
+            self._save()
+
+    # --- PDF ---
+
+    def get_report(self):
+        """Ruta del PDF ya generado en una corrida anterior (si sigue existiendo)"""
+        report = self.data["report"]
+        return report if report and os.path.exists(report) else None
+
+    def save_report(self, filename):
+        with self._lock:
+            self.data["report"] = filename
+            self._save()
+
+    # --- Entregas ---
+
+    def sink_done(self, sink):
+        return self.data["sinks"].get(sink, {}).get("status") in ("done", "skipped")
+
+    def mark_sink(self, sink, status, error=None):
+        with self._lock:
+            self.data["sinks"][sink] = {
+                "status": status,
+                "error": error,
+                "at": datetime.now().isoformat(timespec='seconds')
+            }
+            self._save()
+
+    def failed_sinks(self):
+        return [name for name, sink in self.data["sinks"].items() if sink["status"] == "failed"]
+
+
+def checkpointed_stages(checkpoint, stages):
+    """
+    Envuelve las etapas del pipeline para que las tiendas y el PDF ya
+    guardados en el checkpoint no se vuelvan a consultar ni renderizar.
+    Una tienda se guarda recién al terminar compare: si su consulta falla
+    (ShopifyAPIError) la excepción corta la corrida antes de guardarla y el
+    próximo intento la vuelve a consultar.
+    """
+    fetch, aggregate, compare, render = stages["fetch"], stages["aggregate"], stages["compare"], stages["render"]
+
+    def fetch_stage(shop_conf, pipeline):
+        saved = checkpoint.get_shop(shop_conf['name'])
+        if saved is not None:
+            print(f"  ♻️  {shop_conf['name']}: recuperada del checkpoint")
+            return {"checkpointed": saved}
+        return fetch(shop_conf, pipeline)
+
+    def aggregate_stage(shop_data, pipeline):
+        if "checkpointed" in shop_data:
+            return shop_data
+        return aggregate(shop_data, pipeline)
+
+    def compare_stage(shop_data, pipeline):
+        if "checkpointed" in shop_data:
+            return shop_data["checkpointed"]
+        store_data = compare(shop_data, pipeline)
+        checkpoint.save_shop(store_data['name'], store_data)
+        return store_data
+
+    def render_stage(collected_data, pipeline):
+        saved = checkpoint.get_report()
+        if saved:
+            print(f"  ♻️  PDF recuperado del checkpoint: {saved}")
+            return saved
+        filename = render(collected_data, pipeline)
+        checkpoint.save_report(filename)
+        return filename
+
+    return {"fetch": fetch_stage, "aggregate": aggregate_stage, "compare": compare_stage,
+            "render": render_stage if render else None}
+
+
+def prune_checkpoints(checkpoint_dir=None, retention_days=None):
+    """Borra los checkpoints más viejos que la retención"""
+    checkpoint_dir = checkpoint_dir or CHECKPOINT_DIR
+    retention_days = RETENTION_DAYS if retention_days is None else retention_days
+    if not os.path.isdir(checkpoint_dir):
+        return
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    for name in os.listdir(checkpoint_dir):
+        path = os.path.join(checkpoint_dir, name)
+        if name.endswith(".json") and datetime.fromtimestamp(os.path.getmtime(path)) < cutoff:
+            os.remove(path)
@@ -0,0 +1,153 @@
+"""
+Índice local de la primera orden de cada cliente, en SQLite.
+
+Para separar ventas de clientes nuevos y recurrentes no se consulta el
+historial de cada cliente en Shopify: cada vez que se consultan órdenes se
+registra, por tienda y cliente, la orden más antigua vista. Clasificar una
+orden es entonces una búsqueda por clave primaria: es "nueva" si es la
+primera orden conocida del cliente.
+
+El cliente se identifica por su id de Shopify o, en compras como invitado,
+por un hash del email (no se guarda el email en claro). Las órdenes sin
+ninguno de los dos se cuentan aparte como "guest".
+
+El índice solo conoce la historia desde que empezó a alimentarse: hasta
+cubrir la antigüedad de los clientes, parte de los "nuevos" pueden ser
+recurrentes. Se completa solo a medida que se generan reportes (cada
+reporte consulta también el período anterior).
+
+Variables de entorno:
+    CUSTOMER_INDEX_DB   Ruta de la base (ej: customer_index.db). Sin configurar
+                        el índice está desactivado y el reporte no muestra la
+                        sección de clientes nuevos vs. recurrentes.
+"""
+
+import os
+import hashlib
+import sqlite3
+from datetime import datetime, timezone
+
+from utils.aggregates import parse_price
+
+DB_PATH = os.getenv("CUSTOMER_INDEX_DB", "")
+
+# Límite de parámetros por consulta IN (...) de SQLite
+LOOKUP_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS customer_first_orders (
+    shop TEXT NOT NULL,
+    customer_key TEXT NOT NULL,
+    first_order_at TEXT NOT NULL,
+    first_order_id TEXT NOT NULL,
+    PRIMARY KEY (shop, customer_key)
+);
+"""
+
+
+def customer_key(customer_id=None, email=None):
+    """Clave estable del cliente: su id o, si no hay, el hash del email"""
+    if customer_id:
+        return f"id:{str(customer_id).rsplit('/', 1)[-1]}"
+    if email:
+        return "email:" + hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()[:32]
+    return None
+
+
+def enabled(db_path=None):
+    return bool(db_path or DB_PATH)
+
+
+def get_connection(db_path=None):
+    """Abre la base (creando la tabla si hace falta)"""
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _utc_iso(created_at):
+    # created_at viene con el offset de la tienda: se normaliza para comparar como texto
+    return datetime.fromisoformat(created_at.replace('Z', '+00:00')).astimezone(timezone.utc).isoformat()
+
+
+def record_orders(shop, orders, db_path=None):
+    """
+    Registra las órdenes en el índice. Para cada cliente queda la orden más
+    antigua vista, sin importar en qué orden se consulten los períodos.
+
+    Returns:
+        int: Órdenes con cliente identificado.
+    """
+    # Primero la más antigua de cada cliente dentro del lote
+    firsts = {}
+    for order in orders:
+        key = order.get('customer_key')
+        if not key:
+            continue
+        created = _utc_iso(order['created_at'])
+        if key not in firsts or created < firsts[key][0]:
+            firsts[key] = (created, str(order.get('id')))
+    if not firsts:
+        return 0
+
+    conn = get_connection(db_path)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO customer_first_orders (shop, customer_key, first_order_at, first_order_id) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (shop, customer_key) DO UPDATE SET "
+                "first_order_at = excluded.first_order_at, first_order_id = excluded.first_order_id "
+                "WHERE excluded.first_order_at < customer_first_orders.first_order_at",
+                [(shop, key, created, order_id) for key, (created, order_id) in firsts.items()]
+            )
+    finally:
+        conn.close()
+    return len(firsts)
+
+
+def first_orders(shop, keys, db_path=None):
+    """Devuelve {customer_key: id de su primera orden} de las claves conocidas"""
+    keys = list(set(keys))
+    result = {}
+    conn = get_connection(db_path)
+    try:
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            rows = conn.execute(
+                "SELECT customer_key, first_order_id FROM customer_first_orders "
+                f"WHERE shop = ? AND customer_key IN ({', '.join('?' * len(chunk))})",
+                [shop, *chunk]
+            ).fetchall()
+            result.update(rows)
+    finally:
+        conn.close()
+    return result
+
+
+def split_new_returning(shop, orders, db_path=None):
+    """
+    Separa órdenes y ventas entre clientes nuevos, recurrentes e invitados
+    sin identificar. Devuelve None si ninguna orden trae cliente (por
+    ejemplo, órdenes reconstruidas desde snapshots).
+    """
+    keys = [order.get('customer_key') for order in orders]
+    if not any(keys):
+        return None
+    firsts = first_orders(shop, [key for key in keys if key], db_path)
+
+    split = {kind: {'orders': 0, 'sales': 0.0} for kind in ('new', 'returning', 'guest')}
+    for order, key in zip(orders, keys):
+        if not key:
+            kind = 'guest'
+        elif firsts.get(key, str(order.get('id'))) == str(order.get('id')):
+            # Sin registro previo también es nuevo (primera vez que se lo ve)
+            kind = 'new'
+        else:
+            kind = 'returning'
+        split[kind]['orders'] += 1
+        split[kind]['sales'] += parse_price(order.get('total_price', 0))
+    for values in split.values():
+        values['sales'] = round(values['sales'], 2)
+    return split
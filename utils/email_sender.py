@@ -1,52 +1,174 @@
 import smtplib
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 import os
 
+DEFAULT_BODY = "Adjunto encontrarás el reporte diario de ventas de Shopify."
+
+# Errores en los que vale la pena reconectar y reintentar
+TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+
+class SMTPMailer:
+    """
+    Conexión SMTP autenticada que se reutiliza para varios mensajes.
+
+    Uso:
+        with SMTPMailer() as mailer:
+            mailer.send(["gerente@tienda.com"], "Reporte Tienda A", attachments=["a.pdf"])
+            mailer.send(["otro@tienda.com"], "Reporte Tienda B", attachments=["b.pdf"])
+
+    Se hace un solo handshake (conexión + STARTTLS + login) para todo el lote.
+    Si el servidor corta la conexión o responde con un error temporal (4xx),
+    se reconecta y se reintenta el mensaje. Los destinatarios rechazados no
+    se reintentan: reenviar no cambia la respuesta y, si algunos sí lo
+    recibieron, les llegaría duplicado.
+    """
+
+    def __init__(self, smtp_server=None, smtp_port=None, smtp_user=None, smtp_password=None, max_retries=3, timeout=30):
+        self.smtp_server = smtp_server or os.getenv("SMTP_SERVER", "smtp.gmail.com")
+        self.smtp_port = int(smtp_port or os.getenv("SMTP_PORT", "587"))
+        self.smtp_user = smtp_user or os.getenv("SMTP_USER")
+        self.smtp_password = smtp_password or os.getenv("SMTP_PASSWORD")
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.server = None
+        self._attachments = {}  # Un mismo PDF se lee una sola vez por lote
+
+    @property
+    def configured(self):
+        return bool(self.smtp_user and self.smtp_password)
+
+    def connect(self):
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        try:
+            server.starttls()
+            server.login(self.smtp_user, self.smtp_password)
+        except BaseException:
+            server.close()  # Sin esto el socket queda abierto si falla STARTTLS o el login
+            raise
+        self.server = server
+
+    def _drop_connection(self):
+        """Cierra el socket de una conexión caída (sin QUIT) para reconectar"""
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:
+                self.server.close()
+            self.server = None
+        self._attachments.clear()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _read_attachment(self, path):
+        if path not in self._attachments:
+            with open(path, "rb") as f:
+                self._attachments[path] = f.read()
+        return self._attachments[path]
+
+    def build_message(self, recipients, subject, body=DEFAULT_BODY, attachments=()):
+        msg = MIMEMultipart()
+        msg['From'] = self.smtp_user
+        msg['To'] = ", ".join(recipients)
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+
+        for path in attachments:
+            attach = MIMEApplication(self._read_attachment(path), _subtype="pdf")
+            attach.add_header('Content-Disposition', 'attachment', filename=os.path.basename(path))
+            msg.attach(attach)
+        return msg
+
+    def send(self, recipients, subject, body=DEFAULT_BODY, attachments=()):
+        """Envía un mensaje por la conexión abierta. Devuelve True si se envió."""
+        try:
+            msg = self.build_message(recipients, subject, body, attachments)
+        except FileNotFoundError as e:
+            print(f"❌ Error: No se encontró el archivo {e.filename}")
+            return False
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.server is None:
+                    self.connect()
+                refused = self.server.send_message(msg)
+                if refused:
+                    # Entregado al resto: reintentar lo duplicaría
+                    print(f"⚠️  Destinatarios rechazados: {', '.join(refused)}")
+                    accepted = [r for r in recipients if r not in refused]
+                    print(f"✅ Correo enviado a: {', '.join(accepted)}")
+                else:
+                    print(f"✅ Correo enviado a: {', '.join(recipients)}")
+                return True
+            except smtplib.SMTPRecipientsRefused as e:
+                print(f"❌ Todos los destinatarios fueron rechazados ({', '.join(e.recipients)}): no se reintenta")
+                return False
+            except smtplib.SMTPResponseException as e:
+                # 4xx = temporal (reintentar), 5xx = permanente
+                if not 400 <= e.smtp_code < 500 or attempt == self.max_retries:
+                    print(f"❌ Error al enviar correo a {', '.join(recipients)}: {e}")
+                    return False
+                error = e
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    print(f"❌ Error al enviar correo a {', '.join(recipients)}: {e}")
+                    return False
+                error = e
+                self._drop_connection()  # Reconectar en el próximo intento
+            wait = 2 ** attempt
+            print(f"  ⚠️  Error temporal de SMTP ({error}). Reintentando en {wait}s...")
+            time.sleep(wait)
+        return False
+
+    def send_batch(self, messages):
+        """
+        Envía varios mensajes por la misma conexión.
+
+        Args:
+            messages (list): dicts con recipients, subject y opcionalmente body y attachments.
+
+        Returns:
+            list: True/False por mensaje, en el mismo orden.
+        """
+        return [self.send(m['recipients'], m['subject'], m.get('body', DEFAULT_BODY), m.get('attachments', ()))
+                for m in messages]
+
+
 def send_email_report(pdf_path, recipients, subject="Shopify Daily Report"):
     """
     Envía el reporte PDF por correo electrónico.
-    
+
     Args:
         pdf_path (str): Ruta al archivo PDF.
         recipients (list): Lista de correos destinatarios.
         subject (str): Asunto del correo.
     """
-    smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", "587"))
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_password = os.getenv("SMTP_PASSWORD")
-    
-    if not all([smtp_user, smtp_password]):
+    mailer = SMTPMailer()
+    if not mailer.configured:
         print("⚠️  Credenciales SMTP no configuradas. Saltando envío de correo.")
         return False
 
-    msg = MIMEMultipart()
-    msg['From'] = smtp_user
-    msg['To'] = ", ".join(recipients)
-    msg['Subject'] = subject
-
-    body = "Adjunto encontrarás el reporte diario de ventas de Shopify."
-    msg.attach(MIMEText(body, 'plain'))
-
-    try:
-        with open(pdf_path, "rb") as f:
-            attach = MIMEApplication(f.read(), _subtype="pdf")
-            attach.add_header('Content-Disposition', 'attachment', filename=os.path.basename(pdf_path))
-            msg.attach(attach)
-    except FileNotFoundError:
+    if not os.path.exists(pdf_path):
         print(f"❌ Error: No se encontró el archivo {pdf_path}")
         return False
 
     try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.send_message(msg)
-        server.quit()
-        print(f"✅ Correo enviado a: {', '.join(recipients)}")
-        return True
+        with mailer:
+            return mailer.send(recipients, subject, attachments=[pdf_path])
     except Exception as e:
         print(f"❌ Error al enviar correo: {e}")
         return False
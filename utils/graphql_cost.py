@@ -0,0 +1,166 @@
+"""
+Costo de una query GraphQL de Shopify, calculado sobre el texto de la query.
+
+Shopify valida cada query contra su costo pedido (requestedQueryCost) antes
+de ejecutarla: la rechaza si pasa de MAX_QUERY_COST y la frena (THROTTLED)
+si el bucket no tiene esos puntos. El costo real (actualQueryCost), que
+cuenta los nodos que de verdad vinieron, se cobra después. Por eso el
+tamaño de página se calcula con el costo pedido.
+
+Reglas (las de Shopify, simplificadas):
+    escalar                          0
+    objeto                           1 + sus campos
+    conexión (first / last)          2 + first x costo de cada nodo
+                                     (pageInfo no suma)
+
+Con `data` (la respuesta) calcula el costo real: cada conexión cuenta los
+nodos que vinieron en lugar de `first`.
+"""
+
+import re
+
+MAX_QUERY_COST = 1000
+
+_TOKEN = re.compile(r'\s*(?:(\.\.\.|[{}():!,\[\]=])|(\$?[A-Za-z_][A-Za-z0-9_]*)|(-?\d+(?:\.\d+)?)|("(?:[^"\\]|\\.)*"))')
+
+
+def _tokenize(query):
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = _TOKEN.match(query, position)
+        if not match:
+            raise ValueError(f"Query inválida cerca de: {query[position:position + 20]!r}")
+        tokens.append(next(group for group in match.groups() if group is not None))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+
+    def __init__(self, query):
+        self.tokens = _tokenize(query)
+        self.position = 0
+
+    def _next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _skip_group(self, opening, closing):
+        depth = 0
+        while True:
+            token = self._next()
+            depth += (token == opening) - (token == closing)
+            if depth == 0:
+                return
+
+    def operation(self):
+        """Selección raíz: se salta `query Nombre ($vars)` hasta la primera llave"""
+        while self._peek() != '{':
+            if self._peek() == '(':
+                self._skip_group('(', ')')
+            else:
+                self._next()
+        return self.selection()
+
+    def selection(self):
+        """[(clave en la respuesta, campo, argumentos, sub-selección o None)]"""
+        self._next()  # {
+        fields = []
+        while self._peek() != '}':
+            key = name = self._next()
+            if self._peek() == ':':  # alias: la respuesta viene bajo el alias
+                self._next()
+                name = self._next()
+            arguments = {}
+            if self._peek() == '(':
+                self._next()
+                while self._peek() != ')':
+                    argument = self._next()
+                    self._next()  # :
+                    arguments[argument] = self._value()
+                    if self._peek() == ',':
+                        self._next()
+                self._next()
+            children = self.selection() if self._peek() == '{' else None
+            fields.append((key, name, arguments, children))
+            if self._peek() == ',':
+                self._next()
+        self._next()  # }
+        return fields
+
+    def _value(self):
+        token = self._peek()
+        if token in ('[', '{'):
+            start = self.position
+            self._skip_group(token, ']' if token == '[' else '}')
+            return self.tokens[start:self.position]
+        return self._next()
+
+
+def _resolve(value, variables):
+    if isinstance(value, str) and value.startswith('$'):
+        return variables.get(value[1:])
+    if isinstance(value, str) and re.fullmatch(r'-?\d+', value):
+        return int(value)
+    return value
+
+
+def _connection_size(arguments, variables):
+    for key in ('first', 'last'):
+        if key in arguments:
+            return int(_resolve(arguments[key], variables) or 0)
+    return None
+
+
+def _selection_cost(fields, variables, data):
+    total = 0
+    for key, _, arguments, children in fields:
+        if children is None:
+            continue
+        value = data.get(key) if isinstance(data, dict) else None
+        size = _connection_size(arguments, variables)
+        if size is not None:
+            total += _connection_cost(children, variables, size, value if data is not None else None)
+        elif isinstance(value, list):
+            total += sum(1 + _selection_cost(children, variables, item) for item in value)
+        elif data is not None and value is None:
+            continue  # Objeto nulo en la respuesta: no se cobra
+        else:
+            total += 1 + _selection_cost(children, variables, value)
+    return total
+
+
+def _connection_cost(children, variables, size, data):
+    per_node = []
+    for key, name, arguments, grandchildren in children:
+        if name == 'pageInfo' or grandchildren is None:
+            continue
+        if data is None:
+            per_node.append((1 + _selection_cost(grandchildren, variables, None)) * size)
+            continue
+        items = data.get(key) or []
+        if name == 'edges':
+            items = [edge.get('node') for edge in items]
+            grandchildren = next((c for k, _, _, c in grandchildren if k == 'node'), [])
+        per_node.append(sum(1 + _selection_cost(grandchildren, variables, item) for item in items))
+    return 2 + sum(per_node)
+
+
+def query_cost(query, variables=None, data=None):
+    """Costo pedido de la query (o el real, si se pasa `data` de la respuesta)"""
+    return _selection_cost(_Parser(query).operation(), variables or {}, data)
+
+
+def max_page_size(query, variables, budget, variable='first', maximum=250):
+    """Mayor valor de `variable` con el que la query cuesta a lo sumo `budget` (0 si ni uno entra)"""
+    base = query_cost(query, {**variables, variable: 0})
+    per_node = query_cost(query, {**variables, variable: 1}) - base
+    if per_node <= 0:
+        return maximum
+    return max(0, min(maximum, int((budget - base) // per_node)))
@@ -0,0 +1,253 @@
+"""
+Caché HTTP local para las lecturas REST de Shopify.
+
+Cada respuesta 200 se guarda en disco con su ETag / Last-Modified. En la
+siguiente lectura de la misma URL:
+
+    - si la entrada sigue fresca (TTL del endpoint) no se hace la request;
+    - si no, se hace una request condicional (If-None-Match /
+      If-Modified-Since) y un 304 reutiliza el cuerpo guardado.
+
+TTL por endpoint (ttl_for):
+    shop.json                        HTTP_CACHE_SHOP_TTL_HOURS (default: 24)
+    orders/checkouts de días cerrados HTTP_CACHE_CLOSED_TTL_HOURS (default: 6)
+    todo lo demás                    0 (siempre se revalida)
+
+Un período cuenta como cerrado cuando su created_at_max quedó más de
+HTTP_CACHE_SETTLE_HOURS (default: 48) en el pasado: ya no entran órdenes
+nuevas y las ediciones tardías son raras.
+
+Del cuerpo se guardan solo los campos que usan los reportes (slim_payload):
+nada de direcciones, teléfonos, nombres ni notas. Del cliente de una orden
+queda solo su clave del índice de clientes (id o hash del email); de un
+carrito abandonado, el email que muestra el reporte. Los archivos se crean
+con permisos 0600 en un directorio 0700. Las entradas de versiones
+anteriores (con el payload completo) se borran al leerlas.
+
+Además pide el cuerpo comprimido (gzip, y br si está instalado brotli) y
+lleva la cuenta de bytes transferidos (transfer_stats).
+
+Variables de entorno:
+    HTTP_CACHE_DIR            Directorio del caché (default: http_cache; vacío = desactivado)
+    HTTP_CACHE_MAX_AGE_DAYS   Entradas sin uso que borra prune (default: 14)
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+
+from utils.customer_index import customer_key
+
+try:
+    import brotli  # Opcional: habilita Content-Encoding br
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "http_cache")
+SHOP_TTL = float(os.getenv("HTTP_CACHE_SHOP_TTL_HOURS", "24")) * 3600
+CLOSED_TTL = float(os.getenv("HTTP_CACHE_CLOSED_TTL_HOURS", "6")) * 3600
+SETTLE_HOURS = float(os.getenv("HTTP_CACHE_SETTLE_HOURS", "48"))
+MAX_AGE_DAYS = float(os.getenv("HTTP_CACHE_MAX_AGE_DAYS", "14"))
+
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli is not None else "gzip, deflate"
+
+# 2: cuerpos reducidos con slim_payload
+CACHE_VERSION = 2
+
+# Campos que leen los reportes (Order.from_payload, carritos abandonados, zona horaria)
+ORDER_FIELDS = ('id', 'created_at', 'updated_at', 'total_price', 'referring_site', 'source_name')
+LINE_ITEM_FIELDS = ('sku', 'title', 'quantity', 'price')
+CHECKOUT_FIELDS = ('id', 'created_at', 'total_price', 'email')
+SHOP_FIELDS = ('iana_timezone',)
+
+
+def ttl_for(endpoint, params=None, now=None):
+    """Segundos que una respuesta del endpoint puede usarse sin revalidar"""
+    if endpoint == "shop.json":
+        return SHOP_TTL
+    created_max = (params or {}).get("created_at_max")
+    if endpoint in ("orders.json", "checkouts.json") and created_max and "updated_at_min" not in params:
+        now = now or datetime.now(timezone.utc)
+        created_max = datetime.fromisoformat(created_max.replace('Z', '+00:00'))
+        if created_max < now - timedelta(hours=SETTLE_HOURS):
+            return CLOSED_TTL
+    return 0
+
+
+def _pick(item, fields):
+    return {field: item.get(field) for field in fields}
+
+
+def slim_payload(endpoint, data):
+    """Copia del cuerpo con solo los campos que usan los reportes (lo que se guarda en disco)"""
+    if endpoint == "orders.json":
+        return {"orders": [{
+            **_pick(order, ORDER_FIELDS),
+            "line_items": [_pick(item, LINE_ITEM_FIELDS) for item in order.get('line_items') or ()],
+            # Order.from_payload usa esta clave en lugar de customer / email
+            "customer_key": customer_key((order.get('customer') or {}).get('id'), order.get('email'))
+        } for order in data.get('orders', [])]}
+    if endpoint == "checkouts.json":
+        return {"checkouts": [_pick(checkout, CHECKOUT_FIELDS) for checkout in data.get('checkouts', [])]}
+    if endpoint == "shop.json":
+        return {"shop": _pick(data.get('shop') or {}, SHOP_FIELDS)}
+    return data
+
+
+class CountingReader:
+    """Envuelve response.raw para contar los bytes ya descomprimidos que lee ijson"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes += len(data)
+        return data
+
+
+class TransferStats:
+    """Contadores de red compartidos por todos los fetchers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0       # Requests hechas (incluye condicionales)
+            self.not_modified = 0   # Respuestas 304
+            self.fresh_hits = 0     # Lecturas servidas del caché sin request
+            self.wire_bytes = 0     # Bytes recibidos (comprimidos)
+            self.body_bytes = 0     # Bytes del cuerpo ya descomprimido
+
+    def record(self, wire_bytes=0, body_bytes=0, not_modified=False, fresh_hit=False):
+        with self.lock:
+            if fresh_hit:
+                self.fresh_hits += 1
+                return
+            self.requests += 1
+            self.not_modified += int(not_modified)
+            self.wire_bytes += wire_bytes
+            self.body_bytes += body_bytes
+
+    def summary(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "not_modified": self.not_modified,
+                "fresh_hits": self.fresh_hits,
+                "wire_bytes": self.wire_bytes,
+                "body_bytes": self.body_bytes
+            }
+
+
+transfer_stats = TransferStats()
+
+
+def record_response(response, body_bytes=None):
+    """Suma una respuesta ya leída a transfer_stats (bytes en el cable vs. descomprimidos)"""
+    raw = getattr(response, "raw", None)
+    try:
+        wire_bytes = int(raw.tell()) if raw is not None else 0
+    except (AttributeError, TypeError, ValueError, OSError):
+        wire_bytes = 0
+    if body_bytes is None:
+        body_bytes = len(response.content or b"")
+    transfer_stats.record(wire_bytes or body_bytes, body_bytes, not_modified=response.status_code == 304)
+
+
+class HTTPCache:
+    """
+    Entradas en {cache_dir}/{sha1}.json con la URL, los validadores, el
+    momento de la última validación, el TTL, el link a la página siguiente y
+    el cuerpo JSON.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or CACHE_DIR
+
+    def _path(self, url, params=None):
+        key = json.dumps([url, sorted((params or {}).items())], default=str)
+        return os.path.join(self.cache_dir, f"{hashlib.sha1(key.encode()).hexdigest()}.json")
+
+    def get(self, url, params=None):
+        path = self._path(url, params)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("version") != CACHE_VERSION:
+            # Entrada vieja con el payload completo: se borra
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    @staticmethod
+    def is_fresh(entry, now=None):
+        return entry["ttl"] > 0 and (now or time.time()) - entry["validated_at"] < entry["ttl"]
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _write(self, url, params, entry):
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        path = self._path(url, params)
+        # Escritura atómica: varios hilos pueden leer la misma entrada
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def store(self, url, params, response, data, ttl, next_url=None):
+        """Guarda una respuesta 200 si se puede reutilizar (TTL o validadores). `data` ya reducido con slim_payload."""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if ttl <= 0 and not etag and not last_modified:
+            return
+        self._write(url, params, {
+            "version": CACHE_VERSION,
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "validated_at": time.time(),
+            "ttl": ttl,
+            "next_url": next_url,
+            "data": data
+        })
+
+    def touch(self, url, params, entry, ttl):
+        """Tras un 304: la entrada vuelve a estar fresca"""
+        entry["validated_at"] = time.time()
+        entry["ttl"] = ttl
+        self._write(url, params, entry)
+
+    def prune(self, max_age_days=None):
+        """Borra las entradas que no se validaron en los últimos días"""
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        cutoff = time.time() - (MAX_AGE_DAYS if max_age_days is None else max_age_days) * 86400
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".json") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        return removed
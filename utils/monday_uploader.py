@@ -1,68 +1,321 @@
 import requests
 import os
 import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-def upload_to_monday(pdf_path, item_name):
+MONDAY_API_URL = "https://api.monday.com/v2"
+MONDAY_FILE_URL = "https://api.monday.com/v2/file"
+
+# Items por request en create_items (cada alias suma complejidad)
+CREATE_BATCH_SIZE = 25
+
+
+class MultipartFileStream:
+    """
+    Cuerpo multipart/form-data que lee el archivo desde disco a medida que
+    se envía (no lo carga completo en memoria). Implementa read() y __len__
+    para que requests lo mande en streaming con Content-Length conocido.
+    """
+
+    def __init__(self, fields, file_field, file_path, content_type='application/pdf'):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+        head = b""
+        for name, value in fields.items():
+            head += (f"--{self.boundary}\r\n"
+                     f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                     f"{value}\r\n").encode("utf-8")
+        head += (f"--{self.boundary}\r\n"
+                 f'Content-Disposition: form-data; name="{file_field}"; filename="{os.path.basename(file_path)}"\r\n'
+                 f"Content-Type: {content_type}\r\n\r\n").encode("utf-8")
+        self._parts = [head, None, f"\r\n--{self.boundary}--\r\n".encode("utf-8")]
+        self._file_path = file_path
+        self._file = None
+        self._index = 0
+        self._offset = 0
+        self._length = len(head) + os.path.getsize(file_path) + len(self._parts[2])
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._index < len(self._parts):
+            part = self._parts[self._index]
+            if part is None:
+                # Parte del archivo: se lee directo de disco
+                if self._file is None:
+                    self._file = open(self._file_path, "rb")
+                data = self._file.read(size)
+                if not data:
+                    self._file.close()
+                    self._index += 1
+                    continue
+            else:
+                data = part[self._offset:self._offset + size]
+                self._offset += len(data)
+                if self._offset >= len(part):
+                    self._index += 1
+                    self._offset = 0
+            chunks.append(data)
+            size -= len(data)
+        return b"".join(chunks)
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+
+class MondayClient:
+    """
+    Cliente de la API de Monday.com con una sesión HTTP reutilizada.
+
+    - create_items: crea muchos items en una sola mutation (aliases GraphQL).
+      Crear items no es idempotente: si Monday no confirma el lote (5xx o
+      timeout) no se reenvía a ciegas, se buscan por nombre los que ya se
+      crearon y solo se crean los que faltan.
+    - upload_file: sube un archivo en streaming desde disco.
+    - Cada request pide el campo complexity; si el presupuesto restante no
+      alcanza para la próxima request, espera a que se reinicie en lugar de
+      recibir un error de complejidad. Las subidas corren en paralelo, así
+      que el presupuesto se lee y actualiza bajo un lock.
+    - Cada request tiene timeout (conexión, lectura): una request colgada no
+      frena el job, y en create_items cuenta como un lote sin confirmar.
+    """
+
+    def __init__(self, api_key=None, file_column_id=None, max_retries=3, timeout=(10, 120)):
+        self.api_key = api_key or os.getenv("MONDAY_API_TOKEN")
+        self.file_column_id = file_column_id or os.getenv("MONDAY_FILE_COLUMN_ID", "files")
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Authorization": self.api_key or "", "API-Version": "2024-10"})
+        self.budget_after = None      # Complejidad disponible tras la última request
+        self.budget_reset_in = 0      # Segundos hasta que se reinicia el presupuesto
+        self.last_query_cost = 0
+        self._budget_lock = threading.Lock()
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _throttle(self):
+        """Espera el reinicio del presupuesto si la próxima request no entra"""
+        with self._budget_lock:
+            if self.budget_after is None or self.budget_after >= self.last_query_cost:
+                return
+            wait = max(1, self.budget_reset_in)
+        print(f"  ⏳ Presupuesto de complejidad de Monday agotado. Esperando {wait}s...")
+        time.sleep(wait)
+        with self._budget_lock:
+            self.budget_after = None
+
+    def _track_complexity(self, data):
+        complexity = (data or {}).get("data", {}) or {}
+        complexity = complexity.get("complexity")
+        if complexity:
+            with self._budget_lock:
+                self.budget_after = complexity.get("after")
+                self.budget_reset_in = complexity.get("reset_in_x_seconds", 0)
+                self.last_query_cost = complexity.get("query", self.last_query_cost)
+
+    def _post(self, url, retry_server_errors=True, **kwargs):
+        """
+        POST con reintento en 429/5xx, timeouts y errores de complejidad. Con
+        retry_server_errors=False un 5xx o un timeout no se reintentan (lanzan
+        HTTPError / Timeout): la mutation pudo haberse ejecutado igual. 429 y
+        complejidad sí se reintentan porque Monday los rechaza sin ejecutar nada.
+        """
+        rebuild = kwargs.pop("rebuild", None)
+        for attempt in range(self.max_retries + 1):
+            self._throttle()
+            if rebuild and attempt > 0:
+                # El stream ya se consumió: se rearma para el reintento
+                kwargs["data"].close()
+                kwargs["data"] = rebuild()
+            try:
+                response = self.session.post(url, timeout=self.timeout, **kwargs)
+            except requests.Timeout:
+                if not retry_server_errors or attempt == self.max_retries:
+                    raise
+                wait = 2 ** attempt
+                print(f"  ⚠️  Monday no respondió a tiempo. Reintentando en {wait}s...")
+                time.sleep(wait)
+                continue
+            if response.status_code >= 500 and not retry_server_errors:
+                response.raise_for_status()
+            if response.status_code == 429 or response.status_code >= 500:
+                wait = float(response.headers.get("Retry-After", 2 ** attempt))
+            else:
+                data = response.json()
+                errors = data.get("errors") or []
+                complexity_error = next((e for e in errors if "complexity" in json.dumps(e).lower()), None)
+                if not complexity_error:
+                    self._track_complexity(data)
+                    return data
+                with self._budget_lock:
+                    reset_in = self.budget_reset_in
+                wait = complexity_error.get("extensions", {}).get("retry_in_seconds") or reset_in or 2 ** attempt
+            if attempt == self.max_retries:
+                response.raise_for_status()
+                return response.json()
+            print(f"  ⚠️  Monday respondió {response.status_code}. Reintentando en {wait}s...")
+            time.sleep(float(wait))
+
+    def execute(self, query, variables=None, retry_server_errors=True):
+        """Ejecuta una query/mutation GraphQL incluyendo el costo de complejidad"""
+        return self._post(MONDAY_API_URL, json={"query": query, "variables": variables or {}},
+                          retry_server_errors=retry_server_errors)
+
+    def find_items_by_name(self, board_id, item_names):
+        """Items del board con esos nombres: {nombre: [ids]}"""
+        query = ('query ($board_id: ID!, $names: [String]!) { items_page_by_column_values (board_id: $board_id, '
+                 'limit: 500, columns: [{column_id: "name", column_values: $names}]) { items { id name } }\n'
+                 'complexity { query after reset_in_x_seconds } }')
+        data = self.execute(query, {"board_id": int(board_id), "names": list(set(item_names))})
+        if data.get("errors"):
+            raise RuntimeError(f"Error buscando items en Monday: {data['errors']}")
+        found = {}
+        for item in ((data.get("data") or {}).get("items_page_by_column_values") or {}).get("items", []):
+            found.setdefault(item["name"], []).append(item["id"])
+        return found
+
+    def _recover_batch(self, board_id, batch, recoveries):
+        """Ids de un lote sin confirmar: los que ya existen y, para el resto, items nuevos"""
+        existing = self.find_items_by_name(board_id, batch)
+        found = [existing[name].pop(0) if existing.get(name) else None for name in batch]
+        missing = [name for name, item_id in zip(batch, found) if item_id is None]
+        print(f"  🔎 {len(batch) - len(missing)} de {len(batch)} items ya estaban creados")
+        created = iter(self.create_items(board_id, missing, recoveries - 1) if missing else [])
+        return [item_id or next(created) for item_id in found]
+
+    def create_items(self, board_id, item_names, recoveries=None):
+        """
+        Crea varios items en el board con una mutation por lote.
+        Devuelve la lista de ids (None para los que fallaron), en el mismo orden.
+        recoveries: veces que se puede recuperar un lote sin confirmar
+        (default: max_retries).
+        """
+        recoveries = self.max_retries if recoveries is None else recoveries
+        ids = []
+        for start in range(0, len(item_names), CREATE_BATCH_SIZE):
+            batch = item_names[start:start + CREATE_BATCH_SIZE]
+            params = ", ".join(f"$name{i}: String!" for i in range(len(batch)))
+            aliases = "\n".join(
+                f"item{i}: create_item (board_id: $board_id, item_name: $name{i}) {{ id }}" for i in range(len(batch))
+            )
+            query = f"mutation ($board_id: ID!, {params}) {{\n{aliases}\ncomplexity {{ query after reset_in_x_seconds }}\n}}"
+            variables = {"board_id": int(board_id), **{f"name{i}": name for i, name in enumerate(batch)}}
+
+            try:
+                data = self.execute(query, variables, retry_server_errors=False)
+            except requests.RequestException as e:
+                if recoveries <= 0:
+                    raise
+                print(f"  ⚠️  Monday no confirmó el lote ({e}). Buscando items ya creados antes de reintentar...")
+                ids.extend(self._recover_batch(board_id, batch, recoveries))
+                continue
+            if data.get("errors"):
+                print(f"❌ Error creando items en Monday: {data['errors']}")
+            items = data.get("data") or {}
+            ids.extend((items.get(f"item{i}") or {}).get("id") for i in range(len(batch)))
+        return ids
+
+    def upload_file(self, item_id, file_path):
+        """Sube un archivo a la columna de archivos del item, en streaming desde disco"""
+        query = (f'mutation ($item_id: ID!, $file: File!) {{ add_file_to_column (item_id: $item_id, '
+                 f'column_id: "{self.file_column_id}", file: $file) {{ id }} }}')
+
+        def build():
+            return MultipartFileStream({
+                "query": query,
+                "variables": json.dumps({"item_id": int(item_id)}),
+                "map": json.dumps({"0": ["variables.file"]})
+            }, "0", file_path)
+
+        stream = build()
+        request = {"data": stream, "rebuild": build, "headers": {"Content-Type": stream.content_type}}
+        try:
+            data = self._post(MONDAY_FILE_URL, **request)
+        finally:
+            request["data"].close()
+        return bool(data.get("data")) and not data.get("errors")
+
+    def upload_reports(self, reports, max_workers=4):
+        """
+        Crea un item por reporte (en lote por board) y sube los PDFs en paralelo.
+
+        Args:
+            reports (list): tuplas (pdf_path, item_name, board_id).
+
+        Returns:
+            list: True/False por reporte, en el mismo orden.
+        """
+        item_ids = [None] * len(reports)
+        by_board = {}
+        for idx, (_, item_name, board_id) in enumerate(reports):
+            by_board.setdefault(str(board_id), []).append((idx, item_name))
+        for board_id, entries in by_board.items():
+            ids = self.create_items(board_id, [name for _, name in entries])
+            for (idx, _), item_id in zip(entries, ids):
+                item_ids[idx] = item_id
+                if item_id:
+                    print(f"✅ Item creado en Monday (ID: {item_id})")
+
+        def upload(idx):
+            if not item_ids[idx]:
+                return False
+            pdf_path, item_name, _ = reports[idx]
+            try:
+                ok = self.upload_file(item_ids[idx], pdf_path)
+            except Exception as e:
+                print(f"❌ Error subiendo {item_name} a Monday: {e}")
+                return False
+            print(f"✅ Archivo subido exitosamente a Monday! ({item_name})" if ok
+                  else f"❌ Error subiendo archivo a Monday: {item_name}")
+            return ok
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(reports)))) as executor:
+            return list(executor.map(upload, range(len(reports))))
+
+
+def upload_to_monday(pdf_path, item_name, board_id=None):
     """
     Sube el reporte PDF a Monday.com.
-    
+
     Args:
         pdf_path (str): Ruta al archivo PDF.
         item_name (str): Nombre del item a crear (ej: "Reporte 2025-11-27").
+        board_id (str): Board destino (default: MONDAY_BOARD_ID).
     """
     api_key = os.getenv("MONDAY_API_TOKEN")
-    board_id = os.getenv("MONDAY_BOARD_ID")
-    
+    board_id = board_id or os.getenv("MONDAY_BOARD_ID")
+
     if not all([api_key, board_id]):
         print("⚠️  Credenciales de Monday.com no configuradas. Saltando subida.")
         return False
 
-    url = "https://api.monday.com/v2"
-    headers = {"Authorization": api_key}
-
-    # 1. Crear un nuevo item
-    query_create = """
-    mutation ($board_id: ID!, $item_name: String!) {
-        create_item (board_id: $board_id, item_name: $item_name) {
-            id
-        }
-    }
-    """
-    vars_create = {"board_id": int(board_id), "item_name": item_name}
-    
     try:
-        response = requests.post(url, json={"query": query_create, "variables": vars_create}, headers=headers)
-        response_json = response.json()
-        
-        if "errors" in response_json:
-            print(f"❌ Error creando item en Monday: {response_json['errors']}")
-            return False
-            
-        item_id = response_json['data']['create_item']['id']
-        print(f"✅ Item creado en Monday (ID: {item_id})")
-        
-        # 2. Subir archivo al item
-        # Nota: La subida de archivos en Monday usa un endpoint diferente y multipart/form-data
-        file_url = "https://api.monday.com/v2/file"
-        
-        with open(pdf_path, 'rb') as f:
-            files = {'query': (None, f'mutation ($item_id: ID!, $file: File!) {{ add_file_to_column (item_id: $item_id, column_id: "files", file: $file) {{ id }} }}'),
-                     'variables': (None, json.dumps({"item_id": int(item_id)})),
-                     'map': (None, json.dumps({"0": ["variables.file"]})),
-                     '0': (os.path.basename(pdf_path), f, 'application/pdf')}
-            
-            # Nota: Requests maneja el boundary automáticamente si no setteamos Content-Type
-            headers_file = {"Authorization": api_key} 
-            
-            response_file = requests.post(file_url, files=files, headers=headers_file)
-            
-            if response_file.status_code == 200 and "data" in response_file.json():
-                print(f"✅ Archivo subido exitosamente a Monday!")
-                return True
-            else:
-                print(f"❌ Error subiendo archivo a Monday: {response_file.text}")
-                return False
-                
+        with MondayClient(api_key) as client:
+            return client.upload_reports([(pdf_path, item_name, board_id)])[0]
     except Exception as e:
         print(f"❌ Error en integración con Monday: {e}")
         return False
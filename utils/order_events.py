@@ -0,0 +1,190 @@
+"""
+Log local de eventos de órdenes (webhooks de Shopify) en SQLite.
+
+Cada webhook se agrega a la tabla append-only `order_events` y actualiza
+en la misma transacción el agregado por tienda y día (`daily_aggregates`).
+Así los reportes diarios se arman leyendo datos precalculados, sin
+consultar la API de órdenes al momento de generar el reporte.
+"""
+
+import os
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from utils.aggregates import OrderAggregate, classify_channel, parse_price
+
+DB_PATH = os.getenv("ORDER_EVENTS_DB", "order_events.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    shop TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    webhook_id TEXT UNIQUE,
+    received_at TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    shop TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    local_date TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    total_price REAL NOT NULL,
+    channel TEXT NOT NULL,
+    channel_type TEXT NOT NULL,
+    updated_at TEXT,
+    PRIMARY KEY (shop, order_id)
+);
+CREATE TABLE IF NOT EXISTS daily_aggregates (
+    shop TEXT NOT NULL,
+    local_date TEXT NOT NULL,
+    aggregate TEXT NOT NULL,
+    PRIMARY KEY (shop, local_date)
+);
+"""
+
+
+def get_connection(db_path=None):
+    """Abre la base (creando las tablas si hace falta)"""
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _order_row(order):
+    """Extrae de la orden solo lo que usan los reportes"""
+    # created_at viene con el offset de la tienda: fecha y hora ya son locales
+    created_at = datetime.fromisoformat(order['created_at'].replace('Z', '+00:00'))
+    channel, channel_type = classify_channel(order.get('referring_site', ''), order.get('source_name', ''))
+    return {
+        'local_date': created_at.date().isoformat(),
+        'hour': created_at.hour,
+        'total_price': parse_price(order.get('total_price', 0)),
+        'channel': channel,
+        'channel_type': channel_type,
+        'updated_at': order.get('updated_at')
+    }
+
+
+def record_event(shop, topic, order, webhook_id=None, db_path=None):
+    """
+    Agrega un evento al log y actualiza el agregado diario de la tienda.
+
+    Args:
+        shop (str): Dominio de la tienda (X-Shopify-Shop-Domain).
+        topic (str): orders/create u orders/updated.
+        order (dict): Payload de la orden.
+        webhook_id (str): X-Shopify-Webhook-Id, para descartar reintentos duplicados.
+
+    Returns:
+        bool: True si el evento era nuevo.
+    """
+    conn = get_connection(db_path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO order_events (shop, topic, order_id, webhook_id, received_at, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (shop, topic, str(order['id']), webhook_id,
+                 datetime.now(timezone.utc).isoformat(), json.dumps(order))
+            )
+            if cursor.rowcount == 0:
+                # Shopify reintenta webhooks: ya lo teníamos
+                return False
+
+            new = _order_row(order)
+            old = conn.execute(
+                "SELECT local_date, hour, total_price, channel, channel_type, updated_at "
+                "FROM orders WHERE shop = ? AND order_id = ?",
+                (shop, str(order['id']))
+            ).fetchone()
+
+            # Los webhooks pueden llegar fuera de orden: ignorar versiones viejas
+            if old and old[5] and new['updated_at'] and new['updated_at'] < old[5]:
+                return True
+
+            if old:
+                _apply_to_aggregate(conn, shop, old[0], (old[1], old[2], old[3], old[4]), sign=-1)
+            _apply_to_aggregate(conn, shop, new['local_date'],
+                                (new['hour'], new['total_price'], new['channel'], new['channel_type']))
+
+            conn.execute(
+                "INSERT OR REPLACE INTO orders "
+                "(shop, order_id, local_date, hour, total_price, channel, channel_type, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (shop, str(order['id']), new['local_date'], new['hour'], new['total_price'],
+                 new['channel'], new['channel_type'], new['updated_at'])
+            )
+        return True
+    finally:
+        conn.close()
+
+
+def _apply_to_aggregate(conn, shop, local_date, contribution, sign=1):
+    row = conn.execute(
+        "SELECT aggregate FROM daily_aggregates WHERE shop = ? AND local_date = ?",
+        (shop, local_date)
+    ).fetchone()
+    aggregate = OrderAggregate.from_dict(json.loads(row[0])) if row else OrderAggregate(num_buckets=24)
+    aggregate.add(*contribution, sign=sign)
+    conn.execute(
+        "INSERT OR REPLACE INTO daily_aggregates (shop, local_date, aggregate) VALUES (?, ?, ?)",
+        (shop, local_date, json.dumps(aggregate.to_dict()))
+    )
+
+
+def load_daily_aggregates(shop, start_date, end_date, db_path=None):
+    """Devuelve {fecha: OrderAggregate} de los días con datos en el rango"""
+    conn = get_connection(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT local_date, aggregate FROM daily_aggregates "
+            "WHERE shop = ? AND local_date BETWEEN ? AND ?",
+            (shop, start_date.isoformat(), end_date.isoformat())
+        ).fetchall()
+    finally:
+        conn.close()
+    return {datetime.strptime(d, '%Y-%m-%d').date(): OrderAggregate.from_dict(json.loads(a)) for d, a in rows}
+
+
+def load_period_stats(shop, start_date, end_date=None, db_path=None):
+    """
+    Arma las estadísticas del período con el mismo formato que
+    ShopifyFetcher.process_daily_stats, leyendo solo los agregados.
+    Un día es por hora; un rango es por día.
+    """
+    is_range = end_date is not None
+    daily = load_daily_aggregates(shop, start_date, end_date or start_date, db_path)
+
+    if not is_range:
+        aggregate = daily.get(start_date, OrderAggregate(num_buckets=24))
+    else:
+        num_days = (end_date - start_date).days + 1
+        aggregate = OrderAggregate(num_buckets=num_days)
+        for i in range(num_days):
+            day_aggregate = daily.get(start_date + timedelta(days=i))
+            if not day_aggregate:
+                continue
+            aggregate.bucket_counts[i] = day_aggregate.total_orders
+            aggregate.bucket_sales[i] = day_aggregate.total_sales
+            aggregate.total_orders += day_aggregate.total_orders
+            aggregate.total_sales += day_aggregate.total_sales
+            for channel, values in day_aggregate.channels.items():
+                entry = aggregate.channels.setdefault(channel, {'count': 0, 'sales': 0.0, 'type': values['type']})
+                entry['count'] += values['count']
+                entry['sales'] += values['sales']
+
+    return {
+        "summary": aggregate.summary(),
+        "hourly_orders": aggregate.bucket_counts if not is_range else None,
+        "hourly_sales": aggregate.bucket_sales if not is_range else None,
+        "daily_sales": aggregate.bucket_sales if is_range else None,
+        "daily_orders": aggregate.bucket_counts if is_range else None,
+        "attribution": aggregate.channels,
+        "is_range": is_range,
+        "start_date": start_date if is_range else None,
+        "end_date": end_date
+    }
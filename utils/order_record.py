@@ -0,0 +1,93 @@
+"""
+Registro compacto de una orden.
+
+Los reportes solo leen unos pocos campos de cada orden, así que al parsear
+la respuesta de Shopify se extraen esos campos a un objeto con __slots__ y
+el payload completo (direcciones, cliente, impuestos) se descarta.
+
+De los line items se guarda solo (sku, título, cantidad, ingreso) por línea,
+como tuplas, para la sección de productos más vendidos. Del cliente, solo
+la clave del índice de clientes (id o hash del email).
+"""
+
+from datetime import datetime
+
+from utils.aggregates import parse_price
+from utils.customer_index import customer_key
+
+
+def _line_item(sku, title, quantity, revenue):
+    """(clave, título, cantidad, ingreso). Sin SKU se agrupa por título."""
+    title = title or sku or 'Unknown product'
+    return (sku or title, title, int(quantity or 0), float(revenue))
+
+
+class Order:
+    __slots__ = ('id', 'created_at', 'updated_at', 'total_price', 'referring_site', 'source_name', 'line_items', 'customer_key')
+
+    def __init__(self, id, created_at, updated_at=None, total_price=0.0, referring_site='', source_name='', line_items=(), customer_key=None):
+        self.id = id
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.total_price = total_price
+        self.referring_site = referring_site
+        self.source_name = source_name
+        self.line_items = line_items
+        self.customer_key = customer_key
+
+    @classmethod
+    def from_payload(cls, data):
+        """Crea el registro a partir del dict de la API REST"""
+        return cls(
+            id=data.get('id'),
+            created_at=data['created_at'],
+            updated_at=data.get('updated_at'),
+            total_price=parse_price(data.get('total_price', 0)),
+            referring_site=data.get('referring_site') or '',
+            source_name=data.get('source_name') or '',
+            line_items=tuple(
+                _line_item(item.get('sku'), item.get('title'), item.get('quantity', 0),
+                           parse_price(item.get('price', 0)) * int(item.get('quantity', 0)))
+                for item in data.get('line_items') or ()
+            ),
+            # Los cuerpos del caché HTTP ya traen la clave en lugar de customer / email
+            customer_key=data['customer_key'] if 'customer_key' in data
+            else customer_key((data.get('customer') or {}).get('id'), data.get('email'))
+        )
+
+    @classmethod
+    def from_graphql(cls, node, tz=None):
+        """
+        Crea el registro a partir de un nodo Order de GraphQL. createdAt viene
+        en UTC: se pasa a la zona de la tienda para que los buckets por hora
+        coincidan con los de REST.
+        """
+        created_at = node['createdAt']
+        if tz is not None:
+            created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00')).astimezone(tz).isoformat()
+        return cls(
+            id=int(str(node['id']).rsplit('/', 1)[-1]),
+            created_at=created_at,
+            updated_at=node.get('updatedAt'),
+            total_price=parse_price(node['totalPriceSet']['shopMoney']['amount']),
+            referring_site=node.get('referrerUrl') or '',
+            source_name=node.get('sourceName') or '',
+            line_items=tuple(
+                _line_item(item.get('sku'), item.get('title'), item.get('quantity', 0),
+                           parse_price(item['originalTotalSet']['shopMoney']['amount']))
+                for item in (node.get('lineItems') or {}).get('nodes', ())
+            ),
+            customer_key=customer_key((node.get('customer') or {}).get('id'), node.get('email'))
+        )
+
+    # Acceso estilo dict para el código que recibe tanto órdenes como payloads
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"Order(id={self.id}, created_at={self.created_at!r}, total_price={self.total_price})"
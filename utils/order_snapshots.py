@@ -0,0 +1,268 @@
+"""
+Snapshots columnares de órdenes por tienda y día.
+
+Cada día cerrado se guarda como un directorio con una columna por archivo
+.npy (numpy) más un meta.json con los diccionarios de strings:
+
+    {ORDER_SNAPSHOT_DIR}/{tienda}/{YYYY-MM-DD}/
+        id.npy, created_ts.npy, utc_offset.npy, total_price.npy,
+        referring_site.npy, source_name.npy, customer_key.npy,
+        line_offsets.npy, line_product.npy, line_quantity.npy,
+        line_revenue.npy, meta.json
+
+Se guardan los campos que lee process_daily_stats: los de la orden, la
+clave del cliente (para nuevos vs. recurrentes) y los line items (para
+productos más vendidos). Los line items van como arreglo "ragged": las
+líneas de la orden i son las posiciones line_offsets[i]:line_offsets[i+1]
+de las columnas line_*.
+
+Un snapshot se escribe únicamente con un día consultado completo (todas las
+páginas con 200; ante un error la consulta lanza ShopifyAPIError antes de
+llegar acá). Los snapshots de versiones anteriores (SNAPSHOT_VERSION), que
+podían guardar días truncados o no tenían line items ni clientes, se
+ignoran y el día se vuelve a consultar.
+Al leer, las columnas se abren con memory-map, así que re-agregar un año
+de historia no carga los payloads ni consulta la API.
+
+Uso:
+    python -m utils.order_snapshots mitienda.myshopify.com 2025-01-01 2025-12-31
+"""
+
+import os
+import re
+import sys
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from utils.aggregates import OrderAggregate, classify_channel, parse_price
+from utils.order_record import Order
+
+SNAPSHOT_DIR = os.getenv("ORDER_SNAPSHOT_DIR", "")
+
+# 2: solo días consultados completos (ver docstring)
+# 3: clave del cliente y line items
+SNAPSHOT_VERSION = 3
+
+COLUMNS = {
+    'id': np.int64,
+    'created_ts': np.int64,       # segundos epoch (UTC)
+    'utc_offset': np.int32,       # minutos, offset de la tienda
+    'total_price': np.float64,
+    'referring_site': np.int32,   # código en meta['vocab']['referring_site']
+    'source_name': np.int32,      # código en meta['vocab']['source_name']
+    'customer_key': np.int32,     # código en meta['vocab']['customer_key'] (-1: sin cliente)
+    'line_offsets': np.int64      # count + 1 posiciones en las columnas line_*
+}
+
+# Una fila por line item
+LINE_COLUMNS = {
+    'line_product': np.int32,     # código en meta['vocab']['product'] ([clave, título])
+    'line_quantity': np.int32,
+    'line_revenue': np.float64
+}
+
+
+def _snapshot_path(shop, day, base_dir=None):
+    slug = re.sub(r'[^A-Za-z0-9_.-]', '_', shop or 'shop')
+    return os.path.join(base_dir or SNAPSHOT_DIR, slug, day.isoformat())
+
+
+def write_snapshot(shop, day, orders, base_dir=None):
+    """Guarda las órdenes de un día como columnas"""
+    path = _snapshot_path(shop, day, base_dir)
+    os.makedirs(path, exist_ok=True)
+
+    vocab = {'referring_site': [], 'source_name': [], 'customer_key': [], 'product': []}
+    codes = {field: {} for field in vocab}
+    columns = {name: [] for name in (*COLUMNS, *LINE_COLUMNS)}
+
+    def encode(field, value):
+        if value not in codes[field]:
+            codes[field][value] = len(vocab[field])
+            vocab[field].append(list(value) if isinstance(value, tuple) else value)
+        return codes[field][value]
+
+    for order in orders:
+        created_at = datetime.fromisoformat(order['created_at'].replace('Z', '+00:00'))
+        columns['id'].append(int(order.get('id', 0)))
+        columns['created_ts'].append(int(created_at.timestamp()))
+        columns['utc_offset'].append(int(created_at.utcoffset().total_seconds() // 60))
+        columns['total_price'].append(parse_price(order.get('total_price', 0)))
+        for field in ('referring_site', 'source_name'):
+            columns[field].append(encode(field, order.get(field) or ''))
+        key = order.get('customer_key')
+        columns['customer_key'].append(encode('customer_key', key) if key else -1)
+        columns['line_offsets'].append(len(columns['line_product']))
+        for product_key, title, quantity, revenue in order.get('line_items') or ():
+            columns['line_product'].append(encode('product', (product_key, title)))
+            columns['line_quantity'].append(quantity)
+            columns['line_revenue'].append(revenue)
+    columns['line_offsets'].append(len(columns['line_product']))
+
+    for name, dtype in (*COLUMNS.items(), *LINE_COLUMNS.items()):
+        np.save(os.path.join(path, f"{name}.npy"), np.array(columns[name], dtype=dtype))
+
+    # meta.json se escribe al final: su presencia indica un snapshot completo
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({'version': SNAPSHOT_VERSION, 'count': len(orders), 'lines': len(columns['line_product']),
+                   'vocab': vocab, 'written_at': datetime.now(timezone.utc).isoformat()}, f)
+
+
+def write_period(shop, start_date, end_date, orders, local_today, base_dir=None):
+    """
+    Guarda un snapshot por cada día cerrado del período (los días sin
+    órdenes también, para distinguirlos de los días sin snapshot).
+    """
+    by_day = {}
+    for order in orders:
+        by_day.setdefault(order['created_at'][:10], []).append(order)
+
+    day = start_date
+    while day <= end_date:
+        if day < local_today:
+            write_snapshot(shop, day, by_day.get(day.isoformat(), []), base_dir)
+        day += timedelta(days=1)
+
+
+def _load_meta(path):
+    """meta.json del snapshot, o None si no existe o es de una versión anterior"""
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta if meta.get('version') == SNAPSHOT_VERSION else None
+
+
+def load_snapshot(shop, day, base_dir=None):
+    """Abre las columnas de un día con memory-map. None si no hay snapshot."""
+    path = _snapshot_path(shop, day, base_dir)
+    meta = _load_meta(path)
+    if meta is None:
+        return None
+    columns = {}
+    for names, rows in ((COLUMNS, meta['count']), (LINE_COLUMNS, meta['lines'])):
+        for name in names:
+            # np.load no permite mmap de arrays vacíos
+            mmap_mode = 'r' if rows else None
+            columns[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+    return columns, meta
+
+
+def has_period(shop, start_date, end_date, base_dir=None):
+    """True si hay snapshot (de la versión actual) para todos los días del período"""
+    day = start_date
+    while day <= end_date:
+        if _load_meta(_snapshot_path(shop, day, base_dir)) is None:
+            return False
+        day += timedelta(days=1)
+    return True
+
+
+def load_orders(shop, start_date, end_date, base_dir=None):
+    """
+    Reconstruye las órdenes del período como registros compactos (Order),
+    para pasarlas a process_daily_stats.
+    """
+    orders = []
+    day = start_date
+    while day <= end_date:
+        snapshot = load_snapshot(shop, day, base_dir)
+        day += timedelta(days=1)
+        if not snapshot:
+            continue
+        columns, meta = snapshot
+        vocab = meta['vocab']
+        offsets = columns['line_offsets']
+        for i in range(meta['count']):
+            tz = timezone(timedelta(minutes=int(columns['utc_offset'][i])))
+            key_code = int(columns['customer_key'][i])
+            orders.append(Order(
+                id=int(columns['id'][i]),
+                created_at=datetime.fromtimestamp(int(columns['created_ts'][i]), tz).isoformat(),
+                total_price=float(columns['total_price'][i]),
+                referring_site=vocab['referring_site'][columns['referring_site'][i]],
+                source_name=vocab['source_name'][columns['source_name'][i]],
+                line_items=tuple(
+                    (*vocab['product'][columns['line_product'][j]], int(columns['line_quantity'][j]),
+                     float(columns['line_revenue'][j]))
+                    for j in range(int(offsets[i]), int(offsets[i + 1]))
+                ),
+                customer_key=vocab['customer_key'][key_code] if key_code >= 0 else None
+            ))
+    return orders
+
+
+def aggregate_period(shop, start_date, end_date, is_range=False, base_dir=None):
+    """
+    Calcula el agregado del período directamente sobre las columnas (numpy),
+    sin reconstruir las órdenes. Un día agrupa por hora; un rango, por día.
+    """
+    num_buckets = (end_date - start_date).days + 1 if is_range else 24
+    aggregate = OrderAggregate(num_buckets=num_buckets)
+
+    day = start_date
+    while day <= end_date:
+        snapshot = load_snapshot(shop, day, base_dir)
+        day_index = (day - start_date).days
+        day += timedelta(days=1)
+        if not snapshot or not snapshot[1]['count']:
+            continue
+        columns, meta = snapshot
+        prices = np.asarray(columns['total_price'])
+
+        if is_range:
+            aggregate.bucket_counts[day_index] += len(prices)
+            aggregate.bucket_sales[day_index] += float(prices.sum())
+        else:
+            local_ts = columns['created_ts'] + columns['utc_offset'].astype(np.int64) * 60
+            hours = (local_ts // 3600) % 24
+            counts = np.bincount(hours, minlength=24)
+            sales = np.bincount(hours, weights=prices, minlength=24)
+            for h in range(24):
+                aggregate.bucket_counts[h] += int(counts[h])
+                aggregate.bucket_sales[h] += float(sales[h])
+
+        aggregate.total_orders += len(prices)
+        aggregate.total_sales += float(prices.sum())
+
+        # Atribución: se clasifica una vez por combinación distinta de strings
+        pair_codes = columns['referring_site'].astype(np.int64) * len(meta['vocab']['source_name']) + columns['source_name']
+        unique_pairs, inverse = np.unique(pair_codes, return_inverse=True)
+        pair_counts = np.bincount(inverse)
+        pair_sales = np.bincount(inverse, weights=prices)
+        for idx, pair in enumerate(unique_pairs):
+            ref_code, src_code = divmod(int(pair), len(meta['vocab']['source_name']))
+            channel, channel_type = classify_channel(meta['vocab']['referring_site'][ref_code],
+                                                     meta['vocab']['source_name'][src_code])
+            entry = aggregate.channels.setdefault(channel, {'count': 0, 'sales': 0.0, 'type': channel_type})
+            entry['count'] += int(pair_counts[idx])
+            entry['sales'] += float(pair_sales[idx])
+
+    return aggregate
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    shop = sys.argv[1]
+    start = datetime.strptime(sys.argv[2], '%Y-%m-%d').date()
+    end = datetime.strptime(sys.argv[3], '%Y-%m-%d').date() if len(sys.argv) > 3 else start
+    if not SNAPSHOT_DIR:
+        print("⚠️  Configura ORDER_SNAPSHOT_DIR en .env")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    result = aggregate_period(shop, start, end, is_range=end != start)
+    elapsed = (time.perf_counter() - t0) * 1000
+
+    print(f"📊 {shop}: {start} - {end}")
+    print(f"   Órdenes: {result.total_orders}  Ventas: ${result.total_sales:.2f}")
+    for channel, values in sorted(result.channels.items(), key=lambda x: x[1]['sales'], reverse=True):
+        print(f"   {channel:<30} {values['count']:>6}  ${values['sales']:.2f}")
+    print(f"⏱️  Agregado en {elapsed:.1f} ms")
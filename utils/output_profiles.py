@@ -0,0 +1,120 @@
+"""
+Perfiles de salida del PDF: cuánto pesa cada reporte según su destino.
+
+    screen    Para ver en la app (/generate): gráficos a 100 dpi a todo color
+    email     Para adjuntar y subir a Monday: gráficos con paleta de pocos
+              colores y compresión máxima (mismo tamaño en pantalla)
+    archive   Para guardar o imprimir: gráficos a 200 dpi a todo color
+
+Cada perfil define:
+    chart_dpi       Resolución de los gráficos
+    chart_format    "png" o "jpeg"
+    chart_colors    Colores de la paleta del PNG (None = color completo)
+    image_dpi       Resolución a la que se reducen las imágenes fijas (logo)
+    jpeg_quality    Calidad de los JPEG generados (gráficos en jpeg y logo)
+    compress_level  Nivel de zlib para las páginas del PDF (0-9)
+
+En todos los perfiles los gráficos se guardan sin canal alfa (el fondo de
+matplotlib ya es blanco opaco): FPDF 1.7 separa el alfa byte a byte y lo
+embebe como una segunda imagen. Las imágenes con el mismo contenido se
+embeben una sola vez (ver utils/streaming_pdf.py).
+
+Variables de entorno:
+    REPORT_OUTPUT_PROFILE   Perfil por defecto, el de /generate (default: screen)
+    DAILY_OUTPUT_PROFILE    Perfil de los PDFs que entrega daily_job (default: email)
+"""
+
+import io
+import os
+import tempfile
+
+from PIL import Image
+
+DEFAULT_PROFILE = os.getenv("REPORT_OUTPUT_PROFILE", "screen")
+DELIVERY_PROFILE = os.getenv("DAILY_OUTPUT_PROFILE", "email")
+
+MM_PER_INCH = 25.4
+
+
+class OutputProfile:
+
+    def __init__(self, name, chart_dpi, chart_format="png", chart_colors=None,
+                 image_dpi=150, jpeg_quality=85, compress_level=6):
+        self.name = name
+        self.chart_dpi = chart_dpi
+        self.chart_format = chart_format
+        self.chart_colors = chart_colors
+        self.image_dpi = image_dpi
+        self.jpeg_quality = jpeg_quality
+        self.compress_level = compress_level
+
+    @property
+    def chart_extension(self):
+        return "jpg" if self.chart_format == "jpeg" else "png"
+
+
+PROFILES = {
+    "screen": OutputProfile("screen", chart_dpi=100),
+    "email": OutputProfile("email", chart_dpi=100, chart_colors=32, image_dpi=120,
+                           jpeg_quality=80, compress_level=9),
+    "archive": OutputProfile("archive", chart_dpi=200, image_dpi=300, jpeg_quality=92, compress_level=9),
+}
+
+
+def get_profile(profile=None):
+    """Perfil por nombre (o el de REPORT_OUTPUT_PROFILE); acepta un OutputProfile ya resuelto"""
+    if isinstance(profile, OutputProfile):
+        return profile
+    name = profile or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Perfil de salida desconocido: {name} (opciones: {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+def save_chart(figure, filename, profile=None):
+    """Guarda una figura de matplotlib con la resolución, formato y paleta del perfil"""
+    profile = get_profile(profile)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png", dpi=profile.chart_dpi, bbox_inches='tight', facecolor='white')
+    buffer.seek(0)
+    with Image.open(buffer) as image:
+        image = image.convert("RGB")
+        if profile.chart_format == "jpeg":
+            image.save(filename, "JPEG", quality=profile.jpeg_quality, optimize=True)
+            return filename
+        if profile.chart_colors:
+            # Barras, ejes y texto entran en pocos colores sin que se note
+            image = image.quantize(colors=profile.chart_colors, method=Image.Quantize.MEDIANCUT,
+                                   dither=Image.Dither.NONE)
+        image.save(filename, "PNG", optimize=True)
+    return filename
+
+
+def fit_image(path, width_mm, profile=None):
+    """
+    Copia de la imagen reducida a lo que se ve en el PDF (width_mm al
+    image_dpi del perfil). Se genera una vez y se reutiliza entre reportes
+    mientras el original no cambie. Si el original ya es chico, lo devuelve tal cual.
+    """
+    profile = get_profile(profile)
+    max_width = round(width_mm / MM_PER_INCH * profile.image_dpi)
+    stat = os.stat(path)
+    base, extension = os.path.splitext(os.path.basename(path))
+    fitted_path = os.path.join(tempfile.gettempdir(),
+                               f"{base}_{max_width}px_q{profile.jpeg_quality}_{int(stat.st_mtime)}_{stat.st_size}{extension}")
+    if os.path.exists(fitted_path):
+        return fitted_path
+
+    with Image.open(path) as image:
+        if image.width <= max_width:
+            return path
+        height = round(image.height * max_width / image.width)
+        resized = image.resize((max_width, height), Image.Resampling.LANCZOS)
+        # Escritura atómica: varios procesos pueden generar el mismo reporte
+        tmp_path = f"{fitted_path}.{os.getpid()}.tmp"
+        if image.format == "JPEG":
+            resized.convert("RGB").save(tmp_path, "JPEG", quality=profile.jpeg_quality, optimize=True)
+        else:
+            resized.save(tmp_path, image.format, optimize=True)
+    os.replace(tmp_path, fitted_path)
+    return fitted_path
@@ -0,0 +1,136 @@
+"""
+Pipeline de reportes por etapas.
+
+Etapas por tienda (en paralelo entre tiendas):  fetch → aggregate → compare
+Etapas del reporte completo:                    render → deliver
+
+Cada etapa es una función reemplazable, así que se puede cachear,
+paralelizar o cambiar de backend de forma independiente. El pipeline
+mide el tiempo acumulado de cada etapa.
+
+Con isolated_errors, una tienda cuya etapa lanza uno de esos errores queda
+fuera del reporte (en failed_shops) y el resto se reporta igual. Sin ellos
+(ej: el job diario con checkpoint) el error corta la corrida.
+
+Firmas de las etapas:
+    fetch(shop_conf, pipeline)      -> shop_data (dict)
+    aggregate(shop_data, pipeline)  -> shop_data
+    compare(shop_data, pipeline)    -> store_data (una sección del reporte)
+    render(collected_data, pipeline) -> output (ej: nombre del PDF)
+    deliver(output, pipeline)       -> None
+"""
+
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from utils.shop_registry import run_for_shops
+
+SHOP_STAGES = ('fetch', 'aggregate', 'compare')
+REPORT_STAGES = ('render', 'deliver')
+
+
+class ReportPeriod:
+    """Período del reporte y su período anterior equivalente"""
+
+    def __init__(self, start_date, end_date=None):
+        self.start_date = start_date
+        self.end_date = end_date  # None = día único
+        if end_date:
+            duration = (end_date - start_date).days + 1
+            self.prev_end = start_date - timedelta(days=1)
+            self.prev_start = self.prev_end - timedelta(days=duration - 1)
+        else:
+            self.prev_start = self.prev_end = start_date - timedelta(days=1)
+
+    @property
+    def is_range(self):
+        return self.end_date is not None
+
+    @property
+    def title(self):
+        if self.is_range:
+            return f"{self.start_date.strftime('%b %d')} - {self.end_date.strftime('%b %d, %Y')}"
+        return self.start_date.strftime('%B %d, %Y')
+
+    @property
+    def filename_suffix(self):
+        if self.is_range:
+            return f"{self.start_date.strftime('%Y-%m-%d')}_to_{self.end_date.strftime('%Y-%m-%d')}"
+        return self.start_date.strftime('%Y-%m-%d')
+
+
+class ReportType:
+    """
+    Configuración de un tipo de reporte.
+
+    Args:
+        name (str): Identificador (daily, range, weekly, month_to_date...).
+        period_fn (callable): (fecha, fecha_fin) -> ReportPeriod.
+        include_abandoned_carts (bool): Consultar carritos abandonados.
+        comparison_label (str): Texto del período anterior en la narrativa.
+    """
+
+    def __init__(self, name, period_fn, include_abandoned_carts=False, comparison_label="previous period"):
+        self.name = name
+        self.period_fn = period_fn
+        self.include_abandoned_carts = include_abandoned_carts
+        self.comparison_label = comparison_label
+
+
+class ReportPipeline:
+
+    def __init__(self, report_type, period, shops, stages, isolated_errors=()):
+        self.report_type = report_type
+        self.period = period
+        self.shops = shops
+        self.stages = dict(stages)
+        self.isolated_errors = tuple(isolated_errors)
+        self.timings = defaultdict(float)
+        self.collected_data = []
+        self.failed_shops = []  # [(nombre, error)] de las tiendas que quedaron fuera
+        self._lock = threading.Lock()
+
+    def with_stage(self, name, fn):
+        """Reemplaza (o agrega) una etapa. Devuelve el pipeline para encadenar."""
+        if name not in SHOP_STAGES + REPORT_STAGES:
+            raise ValueError(f"Etapa desconocida: {name}")
+        self.stages[name] = fn
+        return self
+
+    def _run_stage(self, name, value):
+        start = time.perf_counter()
+        try:
+            return self.stages[name](value, self)
+        finally:
+            with self._lock:
+                self.timings[name] += time.perf_counter() - start
+
+    def _run_shop(self, shop_conf):
+        value = shop_conf
+        try:
+            for name in SHOP_STAGES:
+                value = self._run_stage(name, value)
+        except self.isolated_errors as e:
+            print(f"  ❌ {shop_conf['name']}: {e}. El reporte sigue sin esta tienda.")
+            return e
+        return value
+
+    def run(self):
+        """Ejecuta todas las etapas y devuelve la salida de render (o los datos si no hay render)"""
+        results = run_for_shops(self.shops, self._run_shop)
+        self.failed_shops = [(shop['name'], str(result)) for shop, result in zip(self.shops, results)
+                             if isinstance(result, Exception)]
+        self.collected_data = [result for result in results if not isinstance(result, Exception)]
+
+        output = self.collected_data
+        if self.stages.get('render') and self.collected_data:
+            output = self._run_stage('render', self.collected_data)
+        if self.stages.get('deliver') and output:
+            self._run_stage('deliver', output)
+
+        # Las etapas por tienda suman el tiempo de todas las tiendas
+        timings = ", ".join(f"{name}={self.timings[name]:.2f}s" for name in SHOP_STAGES + REPORT_STAGES if name in self.timings)
+        print(f"  ⏱️  Etapas ({self.report_type.name}): {timings}")
+        return output
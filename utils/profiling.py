@@ -0,0 +1,222 @@
+"""
+Perfilado a pedido de la generación de reportes.
+
+Con una sesión activa, cada etapa instrumentada (fetch, process_daily_stats,
+create_chart, PDFReport) corre bajo cProfile y entre dos snapshots de
+tracemalloc. Al cerrar la sesión se guardan en PROFILE_DIR:
+
+    {nombre}_{timestamp}.txt    Resumen por etapa: tiempo, funciones más
+                                costosas y líneas que más memoria asignaron
+    {nombre}_{timestamp}.prof   Estadísticas de cProfile de todas las etapas
+                                (para pstats / snakeviz)
+
+Sin sesión activa las etapas solo pagan una comparación contra None.
+
+La sesión activa es una ContextVar: solo se perfilan las etapas de la
+request (o corrida) que abrió la sesión, no las de otras requests que
+corren al mismo tiempo en otros hilos. Los hilos de un pool no heredan el
+contexto, así que las funciones que se mandan a un pool se envuelven con
+bind_session() para que sigan perfilándose.
+
+Durante una sesión las etapas instrumentadas corren de a una (aunque las
+tiendas se procesen en paralelo): así cProfile y tracemalloc atribuyen cada
+función y cada asignación a la etapa correcta. Los tiempos del perfil son
+por eso los de una ejecución secuencial. Los PDFs por tienda de
+SPLIT_REPORTS_BY_SHOP se generan en otros procesos y no aparecen.
+
+Uso:
+    with profile_session("daily_2025-11-27") as session:
+        generate_report("daily", date)
+    print(session.report_path)
+
+    # En un pool: la sesión se pasa explícitamente a cada tarea
+    executor.map(bind_session(fetch), windows)
+
+Variables de entorno:
+    PROFILE_DIR     Directorio de salida (default: profiles)
+    PROFILE_TOP_N   Funciones y líneas por etapa en el resumen (default: 25)
+"""
+
+import io
+import os
+import time
+import pstats
+import cProfile
+import contextvars
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+TOP_N = int(os.getenv("PROFILE_TOP_N", "25"))
+
+# Frames por asignación: el resumen agrupa por la línea que asigna, así que
+# alcanza con uno (más frames multiplican el costo de tracemalloc)
+TRACEMALLOC_FRAMES = 1
+
+_active = contextvars.ContextVar("profile_session", default=None)
+_session_lock = threading.Lock()
+
+
+class StageProfile:
+    """Acumulado de todas las llamadas a una etapa"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.profiles = []
+        self.memory = {}  # "archivo:línea" -> [bytes, bloques]
+        self.peak = 0
+
+
+class ProfileSession:
+
+    def __init__(self, name, top=TOP_N):
+        self.name = name
+        self.top = top
+        self.started_at = datetime.now()
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.stage_lock = threading.RLock()  # Una etapa perfilada a la vez
+        self.report_path = None
+        self.stats_path = None
+
+    def record(self, stage_name, elapsed, profiler, memory_stats, peak):
+        with self.lock:
+            stage = self.stages.setdefault(stage_name, StageProfile(stage_name))
+            stage.calls += 1
+            stage.seconds += elapsed
+            stage.peak = max(stage.peak, peak)
+            if profiler is not None:
+                stage.profiles.append(profiler)
+            for stat in memory_stats:
+                frame = stat.traceback[0]
+                entry = stage.memory.setdefault(f"{frame.filename}:{frame.lineno}", [0, 0])
+                entry[0] += stat.size
+                entry[1] += stat.count
+
+    def _stage_report(self, stage):
+        lines = [f"=== {stage.name}: {stage.calls} llamadas, {stage.seconds:.3f}s, "
+                 f"pico de memoria {stage.peak / 1024 / 1024:.1f} MiB ===", ""]
+        if stage.profiles:
+            out = io.StringIO()
+            stats = pstats.Stats(*stage.profiles, stream=out)
+            stats.sort_stats("cumulative").print_stats(self.top)
+            lines += ["-- CPU (cProfile, por tiempo acumulado) --", out.getvalue().strip(), ""]
+        top_memory = sorted(stage.memory.items(), key=lambda item: item[1][0], reverse=True)[:self.top]
+        if top_memory:
+            lines.append("-- Memoria (tracemalloc, asignado y aún vivo al terminar la etapa, por línea) --")
+            lines += [f"{size / 1024:>12.1f} KiB {count:>8} bloques  {location}"
+                      for location, (size, count) in top_memory if size > 0]
+            lines.append("")
+        return lines
+
+    def save(self, directory=None):
+        """Escribe el resumen (.txt) y las estadísticas de cProfile (.prof)"""
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{self.name}_{self.started_at.strftime('%Y%m%d_%H%M%S')}")
+
+        lines = [f"Perfil: {self.name}", f"Inicio: {self.started_at.isoformat()}",
+                 "Resumen: " + ", ".join(f"{s.name}={s.seconds:.2f}s" for s in self.stages.values()), ""]
+        for stage in self.stages.values():
+            lines += self._stage_report(stage)
+        self.report_path = f"{base}.txt"
+        with open(self.report_path, "w") as f:
+            f.write("\n".join(lines))
+
+        profiles = [p for stage in self.stages.values() for p in stage.profiles]
+        if profiles:
+            self.stats_path = f"{base}.prof"
+            pstats.Stats(*profiles).dump_stats(self.stats_path)
+        return self.report_path
+
+
+@contextmanager
+def profile_session(name):
+    """
+    Activa el perfilado de las etapas mientras dura el bloque. Si ya hay una
+    sesión en curso (otra request), el bloque corre sin perfilar.
+    """
+    if not _session_lock.acquire(blocking=False):
+        print("⚠️  Ya hay un perfilado en curso: esta generación no se perfila")
+        yield None
+        return
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    session = ProfileSession(name)
+    token = _active.set(session)
+    try:
+        yield session
+    finally:
+        _active.reset(token)
+        if started_tracemalloc:
+            tracemalloc.stop()
+        _session_lock.release()
+        path = session.save()
+        print(f"🔬 Perfil guardado en {path}")
+
+
+@contextmanager
+def stage(name):
+    """Perfila el bloque como parte de la etapa `name` (no hace nada sin sesión)"""
+    session = _active.get()
+    if session is None:
+        yield
+        return
+
+    with session.stage_lock:
+        # Solo quedan las asignaciones de esta etapa: el snapshot final es chico
+        tracemalloc.clear_traces()
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: no se puede anidar con otro profiler activo
+            profiler = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, __file__),))
+            session.record(name, elapsed, profiler, snapshot.statistics("lineno"), tracemalloc.get_traced_memory()[1])
+
+
+def profiled(name):
+    """Decorador: perfila cada llamada a la función como etapa `name`"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active.get() is None:
+                return fn(*args, **kwargs)
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind_session(fn):
+    """
+    Envuelve fn para que corra con la sesión activa de quien la envuelve
+    (llamar en el hilo que reparte el trabajo, antes de mandarla al pool)
+    """
+    session = _active.get()
+    if session is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _active.set(session)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _active.reset(token)
+    return wrapper
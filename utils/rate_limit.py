@@ -0,0 +1,115 @@
+"""
+Limitador de requests por tienda del lado del cliente.
+
+Replica el leaky bucket de la API REST de Shopify (40 requests de ráfaga,
+se vacía a 2 por segundo; 20 por segundo en Shopify Plus) para que varias
+consultas en paralelo de una misma tienda no terminen en 429. El nivel se
+sincroniza con el header X-Shopify-Shop-Api-Call-Limit de cada respuesta.
+
+Para GraphQL el límite es de puntos de costo: CostBudget guarda el último
+throttleStatus de la tienda y proyecta cuántos puntos hay ahora según el
+restoreRate, así el tamaño de la próxima query se elige sin adivinar
+(también entre fetchers distintos de la misma tienda).
+
+Variables de entorno:
+    SHOPIFY_REST_BUCKET_SIZE   Capacidad del bucket (default: 40)
+    SHOPIFY_REST_LEAK_RATE     Requests por segundo (default: 2)
+"""
+
+import os
+import time
+import threading
+
+BUCKET_SIZE = int(os.getenv("SHOPIFY_REST_BUCKET_SIZE", "40"))
+LEAK_RATE = float(os.getenv("SHOPIFY_REST_LEAK_RATE", "2"))
+
+# Margen que se deja libre en el bucket para otras apps de la tienda
+SAFETY_MARGIN = 2
+
+_limiters = {}
+_budgets = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+
+    def __init__(self, capacity=BUCKET_SIZE, leak_rate=LEAK_RATE):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _leak(self, now):
+        self.level = max(0.0, self.level - (now - self.updated) * self.leak_rate)
+        self.updated = now
+
+    def acquire(self):
+        """Bloquea hasta que la próxima request entre en el bucket"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._leak(now)
+                if self.level + 1 <= self.capacity - SAFETY_MARGIN:
+                    self.level += 1
+                    return
+                wait = (self.level + 1 - (self.capacity - SAFETY_MARGIN)) / self.leak_rate
+            time.sleep(wait)
+
+    def observe(self, call_limit_header):
+        """Ajusta el nivel con lo que reporta Shopify (ej: '32/40')"""
+        try:
+            used, capacity = (int(x) for x in call_limit_header.split("/"))
+        except (AttributeError, ValueError):
+            return
+        with self.lock:
+            self._leak(time.monotonic())
+            self.capacity = capacity
+            self.level = max(self.level, float(used))
+
+
+class CostBudget:
+    """Puntos de costo GraphQL disponibles en una tienda"""
+
+    def __init__(self):
+        self.status = None   # Último throttleStatus recibido
+        self.updated = None
+        self.lock = threading.Lock()
+
+    def observe(self, throttle_status):
+        """Actualiza con el extensions.cost.throttleStatus de una respuesta"""
+        if not throttle_status:
+            return
+        with self.lock:
+            self.status = dict(throttle_status)
+            self.updated = time.monotonic()
+
+    def available(self):
+        """Puntos disponibles ahora (None si todavía no hubo respuestas)"""
+        with self.lock:
+            if self.status is None:
+                return None
+            restored = (time.monotonic() - self.updated) * self.status['restoreRate']
+            return min(self.status['maximumAvailable'], self.status['currentlyAvailable'] + restored)
+
+    def wait_for(self, cost):
+        """Bloquea hasta que se recarguen `cost` puntos"""
+        available = self.available()
+        if available is not None and cost > available:
+            time.sleep((cost - available) / self.status['restoreRate'])
+
+
+def limiter_for(shop_key):
+    """Limitador compartido por todos los fetchers de una misma tienda"""
+    with _limiters_lock:
+        if shop_key not in _limiters:
+            _limiters[shop_key] = RateLimiter()
+        return _limiters[shop_key]
+
+
+def cost_budget_for(shop_key):
+    """Presupuesto de puntos GraphQL compartido por todos los fetchers de una tienda"""
+    with _limiters_lock:
+        if shop_key not in _budgets:
+            _budgets[shop_key] = CostBudget()
+        return _budgets[shop_key]
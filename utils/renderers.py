@@ -0,0 +1,92 @@
+"""
+Formatos de salida livianos para los datos agregados del reporte.
+
+Cada renderer recibe los datos de collect_report_data (una entrada por
+tienda) y devuelve (contenido, mimetype). No usan matplotlib ni fpdf, así
+que responden sin pasar por la generación de gráficos y PDF.
+
+Para agregar un formato nuevo se registra una función en RENDERERS.
+"""
+
+import io
+import csv
+import json
+import os
+from datetime import date
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+
+_jinja_env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=select_autoescape(['html']))
+
+
+def _to_serializable(value):
+    """Convierte fechas y estructuras anidadas a tipos JSON"""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: _to_serializable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_serializable(v) for v in value]
+    return value
+
+
+def serialize_report(collected_data, meta):
+    """Estructura común de los formatos: metadatos del reporte y una entrada por tienda"""
+    stores = []
+    for data in collected_data:
+        store = {k: v for k, v in data.items() if k not in ('chart_file', 'sections')}
+        stores.append(_to_serializable(store))
+    return {'report': _to_serializable(meta), 'stores': stores}
+
+
+def render_json(collected_data, meta):
+    return json.dumps(serialize_report(collected_data, meta), ensure_ascii=False), 'application/json'
+
+
+def render_csv(collected_data, meta):
+    """Una fila TOTAL por tienda seguida de una fila por canal de atribución"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["store", "channel", "type", "orders", "sales", "sales_change_pct", "orders_change_pct"])
+
+    for data in collected_data:
+        summary = data['stats']['summary']
+        comparison = data.get('comparison', {})
+        writer.writerow([
+            data['name'], "TOTAL", "",
+            summary['Ordenes'],
+            summary['Ventas'].replace('$', ''),
+            f"{comparison.get('sales_change', 0):.1f}",
+            f"{comparison.get('orders_change', 0):.1f}"
+        ])
+        channels = sorted(data['stats']['attribution'].items(), key=lambda x: x[1]['sales'], reverse=True)
+        for channel_name, values in channels:
+            writer.writerow([data['name'], channel_name, values.get('type', ''),
+                             values['count'], f"{values['sales']:.2f}", "", ""])
+
+    return output.getvalue(), 'text/csv'
+
+
+def render_html(collected_data, meta):
+    """Dashboard HTML con gráficos en el navegador (Chart.js)"""
+    template = _jinja_env.get_template('dashboard.html')
+    report = serialize_report(collected_data, meta)
+    # Escapar '</' para que el JSON no pueda cerrar el <script>
+    report_json = json.dumps(report).replace('</', '<\\/')
+    return template.render(report=report, report_json=report_json), 'text/html'
+
+
+RENDERERS = {
+    'json': render_json,
+    'csv': render_csv,
+    'html': render_html
+}
+
+
+def render_report(fmt, collected_data, meta):
+    """Renderiza los datos en el formato pedido (json, csv, html)"""
+    if fmt not in RENDERERS:
+        raise ValueError(f"Formato no soportado: {fmt}")
+    return RENDERERS[fmt](collected_data, meta)
@@ -0,0 +1,117 @@
+"""
+Caché de reportes PDF ya generados.
+
+El job diario pre-genera las vistas más pedidas (últimos 7 días, últimos
+30 días, mes a la fecha) y las guarda aquí; /generate las sirve sin volver
+a consultar Shopify. Las entradas se indexan por (fecha inicio, fecha fin,
+perfil de salida) en un manifest.json y solo valen para el mismo conjunto
+de tiendas. El perfil es parte de la clave: /generate busca primero el de
+pantalla y, si no hay, sirve el que entregó el job diario (mismo contenido,
+gráficos con paleta reducida) en lugar de volver a generarlo.
+
+Variables de entorno:
+    REPORT_CACHE_DIR             Carpeta del caché (default: report_cache)
+    REPORT_CACHE_MAX_AGE_HOURS   Antigüedad máxima de una entrada (default: 24)
+"""
+
+import os
+import json
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+from utils.output_profiles import get_profile
+
+CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "report_cache")
+MAX_AGE_HOURS = float(os.getenv("REPORT_CACHE_MAX_AGE_HOURS", "24"))
+
+_lock = threading.Lock()
+
+
+def _manifest_path(cache_dir):
+    return os.path.join(cache_dir, "manifest.json")
+
+
+def _cache_key(start_date, end_date=None, profile=None):
+    period = f"{start_date}_{end_date}" if end_date else f"{start_date}"
+    return f"{period}@{get_profile(profile).name}"
+
+
+def load_manifest(cache_dir=None):
+    path = _manifest_path(cache_dir or CACHE_DIR)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(cache_dir, manifest):
+    """Escritura atómica para que /generate nunca lea un manifest a medias"""
+    path = _manifest_path(cache_dir)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _is_fresh(entry, max_age_hours):
+    built_at = datetime.fromisoformat(entry['built_at'])
+    return datetime.now() - built_at <= timedelta(hours=max_age_hours)
+
+
+def store_report(pdf_path, start_date, end_date=None, view=None, shops=(), build_seconds=None,
+                 profile=None, cache_dir=None):
+    """
+    Copia un PDF generado al caché y lo registra en el manifest.
+    profile: perfil de salida con el que se generó (default: el de
+    REPORT_OUTPUT_PROFILE, el mismo que usa /generate).
+    Devuelve la ruta del PDF cacheado.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    profile_name = get_profile(profile).name
+    base, extension = os.path.splitext(os.path.basename(pdf_path))
+    cached_path = os.path.join(cache_dir, f"{base}_{profile_name}{extension}")
+    tmp_path = f"{cached_path}.tmp"
+    shutil.copyfile(pdf_path, tmp_path)
+    os.replace(tmp_path, cached_path)
+
+    with _lock:
+        manifest = load_manifest(cache_dir)
+        manifest[_cache_key(start_date, end_date, profile_name)] = {
+            "view": view,
+            "profile": profile_name,
+            "file": os.path.basename(cached_path),
+            "start_date": str(start_date),
+            "end_date": str(end_date) if end_date else None,
+            "shops": list(shops),
+            "built_at": datetime.now().isoformat(timespec='seconds'),
+            "build_seconds": round(build_seconds, 2) if build_seconds is not None else None
+        }
+        _prune(cache_dir, manifest)
+        _save_manifest(cache_dir, manifest)
+    return cached_path
+
+
+def _prune(cache_dir, manifest):
+    """Elimina las entradas vencidas (y sus PDFs)"""
+    for key, entry in list(manifest.items()):
+        if _is_fresh(entry, MAX_AGE_HOURS):
+            continue
+        del manifest[key]
+        if not any(e['file'] == entry['file'] for e in manifest.values()):
+            path = os.path.join(cache_dir, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def lookup_report(start_date, end_date=None, shops=(), profile=None, cache_dir=None):
+    """Ruta absoluta del PDF cacheado para el período y perfil, o None si no hay uno vigente"""
+    cache_dir = cache_dir or CACHE_DIR
+    entry = load_manifest(cache_dir).get(_cache_key(start_date, end_date, profile))
+    if not entry or not _is_fresh(entry, MAX_AGE_HOURS):
+        return None
+    if list(shops) != entry['shops']:
+        return None
+    path = os.path.abspath(os.path.join(cache_dir, entry['file']))
+    return path if os.path.exists(path) else None
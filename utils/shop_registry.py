@@ -0,0 +1,160 @@
+"""
+Registro de tiendas.
+
+Las tiendas se cargan desde un archivo JSON (SHOPS_CONFIG) con
+configuración por tienda, o, si no hay archivo, desde las variables de
+entorno SHOP{n}_NAME / SHOP{n}_URL / SHOP{n}_TOKEN (sin límite de n y
+con huecos permitidos: SHOP1 y SHOP4 sin SHOP2/SHOP3 cargan las dos).
+
+Ejemplo de SHOPS_CONFIG:
+    [
+        {"name": "Mi Tienda", "url": "mitienda.myshopify.com", "token_env": "MITIENDA_TOKEN",
+         "timezone": "America/Mexico_City", "currency": "MXN",
+         "sections": ["chart", "attribution"], "weight": 2,
+         "recipients": ["gerente@mitienda.com"], "monday_board_id": "123456"}
+    ]
+
+Para repartir cientos de tiendas entre varios workers o nodos se usa
+SHARD_INDEX / SHARD_COUNT: cada worker procesa solo las tiendas de su shard.
+
+"recipients" y "monday_board_id" se usan al separar el reporte por tienda
+(SPLIT_REPORTS_BY_SHOP): cada tienda recibe solo su PDF.
+
+"fetch_slices" consulta las órdenes de la tienda en varias ventanas en
+paralelo (útil para la tienda más grande; default: ORDER_FETCH_SLICES).
+
+Opcional por tienda: "api_base_url" para apuntar a otra base de la API
+(ej: el simulador local, ver utils/shopify_simulator.py).
+"""
+
+import os
+import re
+import json
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.profiling import bind_session
+
+# Variables que definen una tienda por entorno (SHOP{n}_NAME / SHOP{n}_URL)
+_ENV_SHOP_KEY = re.compile(r"SHOP([1-9]\d*)_(?:NAME|URL)")
+
+# Secciones del reporte que se pueden habilitar por tienda
+DEFAULT_SECTIONS = ["chart", "attribution", "top_products", "abandoned_carts"]
+
+
+def _normalize(shop):
+    """Completa los valores por defecto de una tienda"""
+    token = shop.get("token") or os.getenv(shop.get("token_env", ""), "")
+    recipients = shop.get("recipients") or []
+    if isinstance(recipients, str):
+        recipients = [r.strip() for r in recipients.split(",") if r.strip()]
+    return {
+        **shop,
+        "name": shop.get("name"),
+        "url": shop.get("url"),
+        "token": token,
+        "timezone": shop.get("timezone"),
+        "currency": shop.get("currency"),
+        "sections": shop.get("sections", DEFAULT_SECTIONS),
+        "weight": max(1, int(shop.get("weight", 1))),
+        "recipients": recipients,
+        "monday_board_id": shop.get("monday_board_id")
+    }
+
+
+def _shops_from_env():
+    """
+    Lee todos los SHOP{n}_* con nombre o URL, en orden de n. SHOP1-3 siempre
+    están (aunque vacías) como en la configuración original.
+    """
+    indexes = {1, 2, 3}
+    for key, value in os.environ.items():
+        match = _ENV_SHOP_KEY.fullmatch(key)
+        if match and value:
+            indexes.add(int(match.group(1)))
+    shops = []
+    for n in sorted(indexes):
+        shops.append({
+            "name": os.getenv(f"SHOP{n}_NAME"),
+            "url": os.getenv(f"SHOP{n}_URL"),
+            "token": os.getenv(f"SHOP{n}_TOKEN"),
+            "timezone": os.getenv(f"SHOP{n}_TIMEZONE"),
+            "currency": os.getenv(f"SHOP{n}_CURRENCY"),
+            "recipients": os.getenv(f"SHOP{n}_RECIPIENTS"),
+            "monday_board_id": os.getenv(f"SHOP{n}_MONDAY_BOARD_ID")
+        })
+    return shops
+
+
+def shard_shops(shops, shard_index, shard_count):
+    """Devuelve las tiendas asignadas a este shard (asignación estable por nombre)"""
+    if shard_count <= 1:
+        return shops
+    return [s for s in shops if zlib.crc32((s["name"] or "").encode("utf-8")) % shard_count == shard_index]
+
+
+def load_shops(config_path=None, shard_index=None, shard_count=None):
+    """
+    Carga el registro de tiendas.
+
+    Args:
+        config_path (str): Archivo JSON con la lista de tiendas (default: SHOPS_CONFIG).
+        shard_index (int): Shard de este worker (default: SHARD_INDEX o 0).
+        shard_count (int): Total de shards (default: SHARD_COUNT o 1).
+    """
+    config_path = config_path or os.getenv("SHOPS_CONFIG", "")
+    if config_path and os.path.exists(config_path):
+        with open(config_path) as f:
+            shops = json.load(f)
+    else:
+        shops = _shops_from_env()
+
+    shard_index = int(os.getenv("SHARD_INDEX", "0")) if shard_index is None else shard_index
+    shard_count = int(os.getenv("SHARD_COUNT", "1")) if shard_count is None else shard_count
+    return shard_shops([_normalize(s) for s in shops], shard_index, shard_count)
+
+
+class WeightedSemaphore:
+    """Semáforo donde cada tienda ocupa tantos lugares como su peso"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.available = capacity
+        self.condition = threading.Condition()
+
+    def acquire(self, weight):
+        # Una tienda más pesada que la capacidad total corre sola
+        weight = min(weight, self.capacity)
+        with self.condition:
+            self.condition.wait_for(lambda: self.available >= weight)
+            self.available -= weight
+        return weight
+
+    def release(self, weight):
+        with self.condition:
+            self.available += weight
+            self.condition.notify_all()
+
+
+def run_for_shops(shops, fn, max_concurrency=None):
+    """
+    Ejecuta fn(shop) para cada tienda en paralelo, respetando el peso de
+    concurrencia de cada una. Devuelve los resultados en el orden de `shops`.
+    """
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv("REPORT_MAX_CONCURRENCY", "4"))
+    if max_concurrency <= 1 or len(shops) <= 1:
+        return [fn(shop) for shop in shops]
+
+    semaphore = WeightedSemaphore(max_concurrency)
+
+    def run(shop):
+        weight = semaphore.acquire(shop.get("weight", 1))
+        try:
+            return fn(shop)
+        finally:
+            semaphore.release(weight)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        return list(executor.map(bind_session(run), shops))
@@ -0,0 +1,441 @@
+"""
+Simulador local de la API de Shopify para pruebas de carga.
+
+Imita los endpoints que usa ShopifyFetcher con datos sintéticos
+reproducibles (semilla por tienda y día):
+
+    /shops/{tienda}/admin/api/2025-10/shop.json
+    /shops/{tienda}/admin/api/2025-10/orders.json      (paginación con header Link)
+    /shops/{tienda}/admin/api/2025-10/checkouts.json
+    /shops/{tienda}/admin/api/2025-10/graphql.json     (órdenes y líneas de una orden + extensions.cost)
+    /_stats                                             (contadores del simulador)
+
+Aplica el leaky bucket de REST (40 requests, se vacía a 2 por segundo por
+tienda) respondiendo 429 con Retry-After, y el presupuesto de puntos de
+GraphQL (1000 puntos, 50 por segundo; el costo pedido se calcula con
+utils/graphql_cost.py y una query de más de 1000 puntos se rechaza con
+MAX_COST_EXCEEDED, como en Shopify). Las respuestas GET llevan ETag y
+responden 304 a If-None-Match; con Accept-Encoding: gzip el cuerpo va
+comprimido (bytes_sent cuenta lo que sale por el socket).
+
+Para apuntar el fetcher al simulador:
+    SHOPIFY_API_BASE_URL=http://127.0.0.1:8787/shops/{url}
+
+Uso:
+    python -m utils.shopify_simulator --port 8787 --orders-per-day 500
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from utils.graphql_cost import MAX_QUERY_COST, query_cost
+
+SHOP_TZ = timezone(timedelta(hours=-6))
+SHOP_TZ_NAME = "America/Mexico_City"
+
+REFERRERS = ['', '', '', 'https://www.google.com/search?q=x', 'https://l.facebook.com/',
+             'https://www.instagram.com/', 'https://www.tiktok.com/', 'https://t.co/abc']
+SOURCES = ['web', 'web', 'web', 'iphone', 'android', 'pos']
+
+# Peso relativo de cada hora del día (más ventas de tarde/noche)
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 3, 4, 5, 6, 6, 7, 7, 6, 6, 7, 8, 9, 10, 9, 7, 4, 2]
+
+# Productos por orden (la mayoría 1-2; algunas más de una página de GraphQL)
+LINE_ITEM_COUNTS = [1, 2, 3, 4, 6, 8, 12]
+LINE_ITEM_WEIGHTS = [55, 25, 8, 5, 4, 2, 1]
+
+
+class LeakyBucket:
+    """Balde con capacidad fija que se vacía a ritmo constante"""
+
+    def __init__(self, capacity, leak_rate):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _leak(self):
+        now = time.monotonic()
+        self.level = max(0.0, self.level - (now - self.updated) * self.leak_rate)
+        self.updated = now
+
+    def take(self, amount=1.0):
+        """Intenta agregar `amount`. Devuelve (ok, nivel, segundos para que entre)."""
+        with self.lock:
+            self._leak()
+            if self.level + amount > self.capacity:
+                wait = (self.level + amount - self.capacity) / self.leak_rate
+                return False, self.level, wait
+            self.level += amount
+            return True, self.level, 0.0
+
+
+class SimulatedShop:
+    """Genera órdenes y carritos sintéticos deterministas para una tienda"""
+
+    def __init__(self, name, orders_per_day=200, seed=0):
+        self.name = name
+        self.orders_per_day = orders_per_day
+        self.seed = seed
+        self.rest_bucket = LeakyBucket(40, 2.0)
+        self.graphql_bucket = LeakyBucket(1000, 50.0)
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def orders_for_day(self, day):
+        with self._cache_lock:
+            if day in self._cache:
+                return self._cache[day]
+        rnd = random.Random(f"{self.seed}-{self.name}-{day.isoformat()}")
+        count = max(0, int(rnd.gauss(self.orders_per_day, self.orders_per_day * 0.15)))
+        orders = []
+        for i in range(count):
+            hour = rnd.choices(range(24), weights=HOUR_WEIGHTS)[0]
+            created = datetime(day.year, day.month, day.day, hour, rnd.randint(0, 59), rnd.randint(0, 59), tzinfo=SHOP_TZ)
+            updated = created + timedelta(minutes=rnd.randint(0, 120))
+            # La mayoría de las órdenes tiene 1-2 productos; algunas, muchos
+            line_items = []
+            for _ in range(rnd.choices(LINE_ITEM_COUNTS, weights=LINE_ITEM_WEIGHTS)[0]):
+                product = rnd.randint(1, 300)
+                line_items.append({
+                    'sku': f"SKU-{product:04d}",
+                    'title': f"Product {product}",
+                    'quantity': rnd.randint(1, 3),
+                    'price': f"{rnd.uniform(10, 120):.2f}"
+                })
+            orders.append({
+                'id': int(f"{day.strftime('%Y%m%d')}{i:06d}"),
+                'created_at': created.isoformat(),
+                'updated_at': updated.isoformat(),
+                'total_price': f"{sum(float(item['price']) * item['quantity'] for item in line_items):.2f}",
+                'currency': 'MXN',
+                'referring_site': rnd.choice(REFERRERS),
+                'source_name': rnd.choice(SOURCES),
+                'email': f"customer{rnd.randint(1, self.orders_per_day * 20)}@example.com",
+                'customer': {'id': rnd.randint(1, self.orders_per_day * 20)},
+                'line_items': line_items,
+                # Relleno similar al payload real (direcciones, etc.)
+                'shipping_address': {'address1': 'Calle Falsa 123', 'city': 'CDMX', 'country': 'MX', 'zip': '01000'},
+                'note': None,
+                'tags': ''
+            })
+        orders.sort(key=lambda o: o['created_at'])
+        with self._cache_lock:
+            self._cache[day] = orders
+        return orders
+
+    def order_by_id(self, order_id):
+        day = datetime.strptime(str(order_id)[:8], '%Y%m%d').date()
+        return next((order for order in self.orders_for_day(day) if order['id'] == order_id), None)
+
+    def orders_between(self, created_min, created_max, updated_min=None):
+        day = created_min.astimezone(SHOP_TZ).date()
+        last = created_max.astimezone(SHOP_TZ).date()
+        result = []
+        while day <= last:
+            for order in self.orders_for_day(day):
+                created = datetime.fromisoformat(order['created_at'])
+                if not (created_min <= created <= created_max):
+                    continue
+                if updated_min and datetime.fromisoformat(order['updated_at']) < updated_min:
+                    continue
+                result.append(order)
+            day += timedelta(days=1)
+        return result
+
+    def checkouts_between(self, created_min, created_max):
+        rnd = random.Random(f"{self.seed}-{self.name}-checkouts-{created_min.isoformat()}")
+        checkouts = []
+        for i in range(max(0, self.orders_per_day // 5)):
+            created = created_min + timedelta(seconds=rnd.randint(0, max(1, int((created_max - created_min).total_seconds()))))
+            checkouts.append({
+                'id': i + 1,
+                'email': f"cart{rnd.randint(1, 9999)}@example.com",
+                'total_price': f"{rnd.uniform(10, 300):.2f}",
+                'created_at': created.astimezone(SHOP_TZ).isoformat()
+            })
+        return checkouts
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+
+
+def _to_utc(value):
+    return datetime.fromisoformat(value).astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _line_items_connection(items, first, after=None):
+    """Página de una conexión lineItems de GraphQL"""
+    offset = int(_decode_cursor(after)['offset']) if after else 0
+    page = items[offset:offset + first]
+    return {
+        'nodes': [{
+            'sku': item['sku'],
+            'title': item['title'],
+            'quantity': item['quantity'],
+            'originalTotalSet': {'shopMoney': {'amount': f"{float(item['price']) * item['quantity']:.2f}"}}
+        } for item in page],
+        'pageInfo': {'hasNextPage': offset + first < len(items),
+                     'endCursor': _encode_cursor({'offset': offset + len(page)}) if page else None}
+    }
+
+
+def _encode_cursor(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def _decode_cursor(value):
+    return json.loads(base64.urlsafe_b64decode(value.encode()).decode())
+
+
+class SimulatorState:
+
+    def __init__(self, orders_per_day=200, latency=0.0, seed=0):
+        self.orders_per_day = orders_per_day
+        self.latency = latency
+        self.seed = seed
+        self.shops = {}
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0, 'bytes_sent': 0, 'graphql_requests': 0, 'not_modified': 0}
+
+    def shop(self, name):
+        with self.lock:
+            if name not in self.shops:
+                self.shops[name] = SimulatedShop(name, self.orders_per_day, self.seed)
+            return self.shops[name]
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    state = None  # SimulatorState, se asigna al crear el servidor
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        headers = dict(headers or {})
+        if self.command == "GET" and status == 200 and self.path != "/_stats":
+            etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                self.state.count('not_modified')
+                self.send_response(304)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                return
+        if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.state.count('bytes_sent', len(body))
+
+    def _route(self):
+        parsed = urlparse(self.path)
+        match = re.match(r"^/shops/([^/]+)/admin/api/[^/]+/(.+)$", parsed.path)
+        if not match:
+            return None, None, parsed
+        return self.state.shop(match.group(1)), match.group(2), parsed
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            return self._send_json(200, self.state.stats)
+
+        shop, endpoint, parsed = self._route()
+        if not shop:
+            return self._send_json(404, {'errors': 'Not Found'})
+
+        self.state.count('requests')
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        ok, level, wait = shop.rest_bucket.take()
+        limit_header = {"X-Shopify-Shop-Api-Call-Limit": f"{int(level)}/{shop.rest_bucket.capacity}"}
+        if not ok:
+            self.state.count('throttled')
+            return self._send_json(429, {'errors': 'Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service.'},
+                                   {**limit_header, "Retry-After": f"{max(wait, 0.1):.1f}"})
+
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+
+        if endpoint == "shop.json":
+            return self._send_json(200, {'shop': {'name': shop.name, 'iana_timezone': SHOP_TZ_NAME, 'currency': 'MXN'}}, limit_header)
+
+        if endpoint in ("orders.json", "checkouts.json"):
+            limit = min(250, int(params.get('limit', 50)))
+            if 'page_info' in params:
+                # Con page_info los filtros vienen del cursor
+                cursor = _decode_cursor(params['page_info'])
+                filters, offset = cursor['filters'], cursor['offset']
+            else:
+                filters, offset = {k: v for k, v in params.items() if k != 'limit'}, 0
+
+            created_min = _parse_time(filters.get('created_at_min')) or datetime(2000, 1, 1, tzinfo=timezone.utc)
+            created_max = _parse_time(filters.get('created_at_max')) or datetime.now(timezone.utc)
+            if endpoint == "orders.json":
+                key = 'orders'
+                items = shop.orders_between(created_min, created_max, _parse_time(filters.get('updated_at_min')))
+            else:
+                key = 'checkouts'
+                items = shop.checkouts_between(created_min, created_max)
+
+            page = items[offset:offset + limit]
+            headers = dict(limit_header)
+            if offset + limit < len(items):
+                next_info = _encode_cursor({'filters': filters, 'offset': offset + limit})
+                next_url = f"http://{self.headers['Host']}{parsed.path}?{urlencode({'limit': limit, 'page_info': next_info})}"
+                headers["Link"] = f'<{next_url}>; rel="next"'
+            return self._send_json(200, {key: page}, headers)
+
+        return self._send_json(404, {'errors': 'Not Found'})
+
+    def do_POST(self):
+        shop, endpoint, parsed = self._route()
+        if not shop or endpoint != "graphql.json":
+            return self._send_json(404, {'errors': 'Not Found'})
+
+        self.state.count('requests')
+        self.state.count('graphql_requests')
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        variables = payload.get('variables') or {}
+        first = min(250, int(variables.get('first', 50)))
+
+        # Costo pedido según la query completa (conexiones anidadas incluidas)
+        query = payload.get('query', '')
+        requested_cost = query_cost(query, variables)
+        if requested_cost > MAX_QUERY_COST:
+            return self._send_json(200, {
+                'errors': [{'message': f'Query cost is {requested_cost}, which exceeds the single query max cost limit ({MAX_QUERY_COST}).',
+                            'extensions': {'code': 'MAX_COST_EXCEEDED', 'cost': requested_cost,
+                                           'maxCost': MAX_QUERY_COST}}]
+            })
+        ok, level, wait = shop.graphql_bucket.take(requested_cost)
+        throttle_status = {
+            'maximumAvailable': float(shop.graphql_bucket.capacity),
+            'currentlyAvailable': shop.graphql_bucket.capacity - level,
+            'restoreRate': shop.graphql_bucket.leak_rate
+        }
+        if not ok:
+            self.state.count('throttled')
+            return self._send_json(200, {
+                'errors': [{'message': 'Throttled', 'extensions': {'code': 'THROTTLED'}}],
+                'extensions': {'cost': {'requestedQueryCost': requested_cost, 'actualQueryCost': None,
+                                        'throttleStatus': throttle_status}}
+            })
+
+        orders_by_alias = re.findall(r'(\w+)\s*:\s*order\s*\(\s*id:\s*\$(\w+)\s*\)\s*\{\s*lineItems\s*\(\s*'
+                                     r'first:\s*\$(\w+)\s*,\s*after:\s*\$(\w+)', query)
+        if orders_by_alias:
+            # Resto de las líneas de varias órdenes (un alias por orden)
+            data = {}
+            for alias, id_var, first_var, after_var in orders_by_alias:
+                order = shop.order_by_id(int(str(variables[id_var]).rsplit('/', 1)[-1]))
+                data[alias] = {'lineItems': _line_items_connection(order['line_items'], min(250, int(variables[first_var])),
+                                                                   variables.get(after_var))} if order else None
+            return self._send_graphql(shop, query, variables, data, requested_cost, throttle_status)
+
+        # Filtro "created_at:>=... created_at:<=..." del argumento query
+        search = variables.get('query', '')
+        created_min = re.search(r"created_at:>=['\"]?([^'\" ]+)", search)
+        created_max = re.search(r"created_at:<=['\"]?([^'\" ]+)", search)
+        updated_min = re.search(r"updated_at:>=['\"]?([^'\" ]+)", search)
+        created_min = _parse_time(created_min.group(1)) if created_min else datetime(2000, 1, 1, tzinfo=timezone.utc)
+        created_max = _parse_time(created_max.group(1)) if created_max else datetime.now(timezone.utc)
+        updated_min = _parse_time(updated_min.group(1)) if updated_min else None
+
+        items = shop.orders_between(created_min, created_max, updated_min)
+        offset = int(_decode_cursor(variables['after'])['offset']) if variables.get('after') else 0
+        page = items[offset:offset + first]
+        line_items_first = re.search(r'lineItems\s*\(\s*first:\s*(\$?\w+)', query)
+        line_items_first = line_items_first.group(1) if line_items_first else '50'
+        line_items_first = int(variables[line_items_first[1:]] if line_items_first.startswith('$') else line_items_first)
+        nodes = [{
+            'id': f"gid://shopify/Order/{order['id']}",
+            # GraphQL devuelve las fechas en UTC
+            'createdAt': _to_utc(order['created_at']),
+            'updatedAt': _to_utc(order['updated_at']),
+            'totalPriceSet': {'shopMoney': {'amount': order['total_price']}},
+            'subtotalLineItemsQuantity': sum(item['quantity'] for item in order['line_items']),
+            'referrerUrl': order['referring_site'] or None,
+            'sourceName': order['source_name'],
+            'email': order['email'],
+            'customer': {'id': f"gid://shopify/Customer/{order['customer']['id']}"},
+            'lineItems': _line_items_connection(order['line_items'], line_items_first)
+        } for order in page]
+
+        data = {'orders': {
+            'nodes': nodes,
+            'pageInfo': {'hasNextPage': offset + first < len(items),
+                         'endCursor': _encode_cursor({'offset': offset + len(page)}) if page else None}
+        }}
+        return self._send_graphql(shop, query, variables, data, requested_cost, throttle_status)
+
+    def _send_graphql(self, shop, query, variables, data, requested_cost, throttle_status):
+        # El costo real cuenta solo los nodos que vinieron: se devuelve la diferencia
+        actual_cost = query_cost(query, variables, data)
+        shop.graphql_bucket.take(-(requested_cost - actual_cost))
+        throttle_status['currentlyAvailable'] += requested_cost - actual_cost
+        return self._send_json(200, {
+            'data': data,
+            'extensions': {'cost': {'requestedQueryCost': requested_cost, 'actualQueryCost': actual_cost,
+                                    'throttleStatus': throttle_status}}
+        })
+
+
+def start_simulator(port=0, orders_per_day=200, latency=0.0, seed=0):
+    """
+    Levanta el simulador en un thread. Devuelve (server, base_url) donde
+    base_url ya tiene el placeholder {url} para SHOPIFY_API_BASE_URL.
+    """
+    state = SimulatorState(orders_per_day, latency, seed)
+    handler = type("Handler", (SimulatorHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.state = state
+    return server, f"http://127.0.0.1:{server.server_address[1]}/shops/{{url}}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador local de la API de Shopify")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--orders-per-day", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="Segundos de latencia por request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server, base_url = start_simulator(args.port, args.orders_per_day, args.latency, args.seed)
+    print(f"🧪 Simulador escuchando. Configura SHOPIFY_API_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
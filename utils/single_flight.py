@@ -0,0 +1,68 @@
+"""
+Deduplicación de trabajos concurrentes ("single flight").
+
+Si llegan varias llamadas con la misma clave mientras una ya está en
+curso, solo la primera ejecuta la función; las demás esperan y reciben el
+mismo resultado (o la misma excepción). Cuando termina, la clave se libera
+y la siguiente llamada vuelve a ejecutar.
+
+La deduplicación es por proceso: con varios workers de gunicorn cada uno
+tiene su propio SingleFlight.
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) una sola vez por clave en vuelo.
+        Devuelve (resultado, compartido) donde compartido indica si el
+        resultado vino de una ejecución iniciada por otra llamada.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                print(f"  🔗 {call.waiters} solicitudes concurrentes reutilizaron el resultado de {key}")
+        return call.result, False
+
+    def in_flight(self):
+        """Claves que se están ejecutando en este momento"""
+        with self._lock:
+            return list(self._calls)
@@ -0,0 +1,262 @@
+"""
+FPDF con escritura progresiva a disco.
+
+FPDF 1.7 guarda todas las páginas e imágenes en memoria y arma el archivo
+completo en output(). Con `stream_to`, cada página se comprime y se escribe
+al archivo apenas termina, y cada imagen (logo, gráficos) se escribe una
+sola vez la primera vez que se usa y se libera de memoria. El diccionario
+de recursos compartido (objeto 2) se escribe al final, así que todas las
+páginas referencian las mismas fuentes e imágenes.
+
+Además, las imágenes se identifican por contenido: si dos archivos
+distintos tienen los mismos bytes se embeben una sola vez, y
+`compress_level` fija el nivel de zlib de las páginas escritas.
+
+Con `stream_to` las páginas van a un archivo temporal en la misma carpeta
+y output() lo renombra al nombre final (os.replace, atómico): quien lee el
+PDF mientras otro proceso lo regenera ve el anterior completo, dos
+generaciones del mismo período no se pisan el archivo, y un error a mitad
+de camino no deja un PDF roto con el nombre del reporte. Usado como
+context manager, el temporal se borra si no se llegó a output().
+
+Sin `stream_to` el documento se arma en memoria como en FPDF.
+"""
+
+import os
+import zlib
+import uuid
+import hashlib
+from fpdf import FPDF
+
+
+class StreamingFPDF(FPDF):
+
+    def __init__(self, *args, stream_to=None, compress_level=6, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compress_level = compress_level
+        self._image_aliases = {}  # archivo -> primer archivo con el mismo contenido
+        self._image_hashes = {}   # sha1 del contenido -> archivo
+        self._stream = None
+        self._offset = 0
+        self._direct = False
+        self._page_objs = []
+        self._stream_to = stream_to
+        self._tmp_path = None
+        if stream_to:
+            self._tmp_path = f"{stream_to}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+            self._stream = open(self._tmp_path, 'xb')
+            # El encabezado se escribe ahora: se fija la versión que
+            # admite imágenes con transparencia (PNG de matplotlib)
+            self.pdf_version = '1.4'
+            self._write('%PDF-' + self.pdf_version)
+
+    # --- Escritura
+
+    def _write(self, s):
+        """Escribe una línea directamente al archivo"""
+        if isinstance(s, str):
+            s = s.encode('latin1')
+        elif not isinstance(s, bytes):
+            s = str(s).encode('latin1')
+        self._stream.write(s + b"\n")
+        self._offset += len(s) + 1
+
+    def _out(self, s):
+        if self._stream and (self.state != 2 or self._direct):
+            self._write(s)
+        else:
+            super()._out(s)
+
+    def _newobj(self):
+        if not self._stream:
+            return super()._newobj()
+        self.n += 1
+        self.offsets[self.n] = self._offset
+        self._out(str(self.n) + ' 0 obj')
+
+    # --- Páginas
+
+    def _endpage(self):
+        super()._endpage()
+        if self._stream:
+            self._flush_page(self.page)
+
+    def _flush_page(self, n):
+        """Escribe la página terminada y libera su contenido"""
+        if self.def_orientation == 'P':
+            w_pt, h_pt = self.fw_pt, self.fh_pt
+        else:
+            w_pt, h_pt = self.fh_pt, self.fw_pt
+
+        self._newobj()
+        self._page_objs.append(self.n)
+        self._out('<</Type /Page')
+        self._out('/Parent 1 0 R')
+        if n in self.orientation_changes:
+            self._out('/MediaBox [0 0 %.2f %.2f]' % (h_pt, w_pt))
+        self._out('/Resources 2 0 R')
+        self._out('/Group <</Type /Group /S /Transparency /CS /DeviceRGB>>')
+        self._out('/Contents ' + str(self.n + 1) + ' 0 R>>')
+        self._out('endobj')
+
+        content = self.pages[n].encode('latin1')
+        if self.compress:
+            content = zlib.compress(content, self.compress_level)
+        self._newobj()
+        self._out('<<' + ('/Filter /FlateDecode ' if self.compress else '') + '/Length ' + str(len(content)) + '>>')
+        self._putstream(content)
+        self._out('endobj')
+        self.pages[n] = ''
+
+    def _putpages(self):
+        if not self._stream:
+            return super()._putpages()
+        # Las páginas ya están en el archivo: solo falta el nodo raíz
+        if self.def_orientation == 'P':
+            w_pt, h_pt = self.fw_pt, self.fh_pt
+        else:
+            w_pt, h_pt = self.fh_pt, self.fw_pt
+        self.offsets[1] = self._offset
+        self._out('1 0 obj')
+        self._out('<</Type /Pages')
+        self._out('/Kids [' + ''.join(f'{obj} 0 R ' for obj in self._page_objs) + ']')
+        self._out('/Count ' + str(len(self._page_objs)))
+        self._out('/MediaBox [0 0 %.2f %.2f]' % (w_pt, h_pt))
+        self._out('>>')
+        self._out('endobj')
+
+    # --- Recursos compartidos
+
+    def _dedupe_image(self, name):
+        """Archivo ya embebido con el mismo contenido que `name` (o el mismo name)"""
+        if name in self.images or name in self._image_aliases:
+            return self._image_aliases.get(name, name)
+        try:
+            with open(name, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+        except OSError:
+            return name  # FPDF reporta el error
+        canonical = self._image_hashes.setdefault(digest, name)
+        self._image_aliases[name] = canonical
+        return canonical
+
+    def image(self, name, *args, **kwargs):
+        name = self._dedupe_image(name)
+        is_new = name not in self.images
+        super().image(name, *args, **kwargs)
+        if self._stream and is_new:
+            # Primera vez que se usa: se escribe una sola vez y se libera
+            info = self.images[name]
+            self._direct = True
+            try:
+                self._putimage(info)
+            finally:
+                self._direct = False
+            info.pop('data', None)
+            info.pop('smask', None)
+
+    def _putimages(self):
+        if not self._stream:
+            return super()._putimages()
+        for info in sorted(self.images.values(), key=lambda info: info['i']):
+            if 'data' in info:
+                self._putimage(info)
+                del info['data']
+
+    def _putresources(self):
+        if not self._stream:
+            return super()._putresources()
+        self._putfonts()
+        self._putimages()
+        self.offsets[2] = self._offset
+        self._out('2 0 obj')
+        self._out('<<')
+        self._putresourcedict()
+        self._out('>>')
+        self._out('endobj')
+
+    def _putcatalog(self):
+        if not self._stream:
+            return super()._putcatalog()
+        # La primera página no es necesariamente el objeto 3
+        first_page = self._page_objs[0]
+        self._out('/Type /Catalog')
+        self._out('/Pages 1 0 R')
+        if self.zoom_mode == 'fullpage':
+            self._out(f'/OpenAction [{first_page} 0 R /Fit]')
+        elif self.zoom_mode == 'fullwidth':
+            self._out(f'/OpenAction [{first_page} 0 R /FitH null]')
+        elif self.zoom_mode == 'real':
+            self._out(f'/OpenAction [{first_page} 0 R /XYZ null null 1]')
+        if self.layout_mode == 'single':
+            self._out('/PageLayout /SinglePage')
+        elif self.layout_mode == 'continuous':
+            self._out('/PageLayout /OneColumn')
+        elif self.layout_mode == 'two':
+            self._out('/PageLayout /TwoColumnLeft')
+
+    # --- Cierre
+
+    def _enddoc(self):
+        if not self._stream:
+            return super()._enddoc()
+        self._putpages()
+        self._putresources()
+        # Info
+        self._newobj()
+        self._out('<<')
+        self._putinfo()
+        self._out('>>')
+        self._out('endobj')
+        # Catalog
+        self._newobj()
+        self._out('<<')
+        self._putcatalog()
+        self._out('>>')
+        self._out('endobj')
+        # Cross-ref
+        xref_offset = self._offset
+        self._out('xref')
+        self._out('0 ' + str(self.n + 1))
+        self._out('0000000000 65535 f ')
+        for i in range(1, self.n + 1):
+            self._out('%010d 00000 n ' % self.offsets[i])
+        # Trailer
+        self._out('trailer')
+        self._out('<<')
+        self._puttrailer()
+        self._out('>>')
+        self._out('startxref')
+        self._out(xref_offset)
+        self._out('%%EOF')
+        self.state = 3
+
+    def output(self, name='', dest=''):
+        if not self._stream:
+            return super().output(name, dest)
+        # El archivo ya se fue escribiendo: solo hay que cerrar el documento
+        # y publicarlo con su nombre final
+        if self.state < 3:
+            self.close()
+        self._stream.close()
+        os.replace(self._tmp_path, self._stream_to)
+        self._tmp_path = None
+        return ''
+
+    def discard(self):
+        """Cierra y borra el archivo temporal si el PDF no se llegó a publicar"""
+        if self._tmp_path is None:
+            return
+        self._stream.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+        self._tmp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.discard()
+        return False
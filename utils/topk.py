@@ -0,0 +1,226 @@
+"""
+Top-K de productos en una sola pasada y con memoria acotada.
+
+Mientras el período tenga hasta `exact_limit` SKUs distintos (default:
+TOP_PRODUCTS_EXACT_LIMIT = 50000, de sobra para una tienda normal) los
+totales son exactos. Si se pasa del límite, los totales pasan a dos
+count-min sketch (tablas fijas de depth x width contadores) y cada producto
+compite por un lugar en un conjunto acotado de candidatos por ranking: la
+memoria deja de depender de la cantidad de SKUs y las cifras pasan a ser
+estimaciones que nunca quedan por debajo del valor real (con error de a lo
+sumo e/width del total, con probabilidad 1 - e^-depth).
+"""
+
+import os
+import heapq
+import hashlib
+
+DEFAULT_WIDTH = 2048
+DEFAULT_DEPTH = 4
+EXACT_LIMIT = int(os.getenv("TOP_PRODUCTS_EXACT_LIMIT", "50000"))
+
+
+class CountMinSketch:
+
+    def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.tables = [[0.0] * width for _ in range(depth)]
+
+    def indexes(self, key):
+        """
+        Columna de la clave en cada fila. Las filas necesitan hashes
+        independientes (si dos claves chocan en una fila no deben chocar en
+        las demás): se toman 4 bytes distintos de un mismo digest blake2b.
+        """
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * self.depth, person=b"topk-cms").digest()
+        return [int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width for row in range(self.depth)]
+
+    def add(self, key, amount=1.0, indexes=None):
+        """Suma `amount` y devuelve la estimación actualizada"""
+        estimate = None
+        for row, idx in zip(self.tables, indexes or self.indexes(key)):
+            row[idx] += amount
+            estimate = row[idx] if estimate is None else min(estimate, row[idx])
+        return estimate
+
+    def estimate(self, key, indexes=None):
+        return min(row[idx] for row, idx in zip(self.tables, indexes or self.indexes(key)))
+
+    def merge(self, other):
+        """Suma otro sketch con las mismas dimensiones"""
+        for row, other_row in zip(self.tables, other.tables):
+            for i, value in enumerate(other_row):
+                row[i] += value
+
+
+class BoundedTopK:
+    """
+    Conjunto de como máximo `capacity` candidatos con su estimación.
+    El heap guarda (estimación, clave) y puede tener entradas viejas: se
+    descartan al sacar el mínimo (actualización perezosa).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.scores = {}
+        self.heap = []
+
+    def offer(self, key, score):
+        if key in self.scores or len(self.scores) < self.capacity:
+            self.scores[key] = score
+            heapq.heappush(self.heap, (score, key))
+        else:
+            min_score, min_key = self._peek_min()
+            if score <= min_score:
+                return
+            del self.scores[min_key]
+            self.scores[key] = score
+            heapq.heappush(self.heap, (score, key))
+        # Compactar si las entradas viejas crecen demasiado
+        if len(self.heap) > self.capacity * 4:
+            self.heap = [(s, k) for k, s in self.scores.items()]
+            heapq.heapify(self.heap)
+
+    def _peek_min(self):
+        while True:
+            score, key = self.heap[0]
+            if self.scores.get(key) == score:
+                return score, key
+            heapq.heappop(self.heap)
+
+    def keys(self):
+        return list(self.scores)
+
+
+class TopProducts:
+    """
+    Top-K de productos por ingresos y por unidades.
+
+    Uso:
+        top = TopProducts(k=10)
+        for order in orders:
+            for sku, title, quantity, revenue in order.line_items:
+                top.add(sku, title, quantity, revenue)
+        top.result()
+    """
+
+    def __init__(self, k=10, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, exact_limit=None):
+        self.k = k
+        self.width = width
+        self.depth = depth
+        self.exact_limit = EXACT_LIMIT if exact_limit is None else exact_limit
+        # Totales exactos {clave: [unidades, ingresos]} hasta exact_limit claves
+        self.exact = {}
+        self.revenue = None
+        self.units = None
+        # Se guardan más candidatos que k para que el orden final sea estable
+        self.by_revenue = BoundedTopK(k * 4)
+        self.by_units = BoundedTopK(k * 4)
+        self.titles = {}
+
+    @property
+    def is_exact(self):
+        return self.revenue is None
+
+    def _to_sketch(self):
+        """Pasa los totales exactos a los sketches (se superó exact_limit)"""
+        self.revenue = CountMinSketch(self.width, self.depth)
+        self.units = CountMinSketch(self.width, self.depth)
+        exact, self.exact = self.exact, {}
+        for key, (units, revenue) in exact.items():
+            indexes = self.revenue.indexes(key)
+            self.units.add(key, units, indexes)
+            self.revenue.add(key, revenue, indexes)
+        for key in self._exact_candidates(exact):
+            indexes = self.revenue.indexes(key)
+            self.by_revenue.offer(key, self.revenue.estimate(key, indexes))
+            self.by_units.offer(key, self.units.estimate(key, indexes))
+        self._trim_titles()
+
+    def _exact_candidates(self, exact):
+        top_revenue = heapq.nlargest(self.by_revenue.capacity, exact, key=lambda key: exact[key][1])
+        top_units = heapq.nlargest(self.by_units.capacity, exact, key=lambda key: exact[key][0])
+        return set(top_revenue) | set(top_units)
+
+    def add(self, key, title, quantity, revenue):
+        if self.is_exact:
+            totals = self.exact.get(key)
+            if totals is None:
+                totals = self.exact[key] = [0, 0.0]
+                self.titles[key] = title
+            totals[0] += quantity
+            totals[1] += revenue
+            if len(self.exact) > self.exact_limit:
+                self._to_sketch()
+            return
+        indexes = self.revenue.indexes(key)
+        revenue_estimate = self.revenue.add(key, revenue, indexes)
+        units_estimate = self.units.add(key, quantity, indexes)
+        self.by_revenue.offer(key, revenue_estimate)
+        self.by_units.offer(key, units_estimate)
+        self._trim_titles()
+        if key in self.by_revenue.scores or key in self.by_units.scores:
+            self.titles[key] = title
+
+    def _trim_titles(self):
+        # Con sketches solo se guardan los títulos de los candidatos actuales
+        if self.is_exact:
+            return
+        if len(self.titles) > (self.by_revenue.capacity + self.by_units.capacity) * 2:
+            keep = set(self.by_revenue.scores) | set(self.by_units.scores)
+            self.titles = {k: v for k, v in self.titles.items() if k in keep}
+
+    def merge(self, other):
+        """Combina el top de otro período o tienda (mismas dimensiones)"""
+        if self.is_exact and other.is_exact and len(set(self.exact) | set(other.exact)) <= self.exact_limit:
+            for key, (units, revenue) in other.exact.items():
+                totals = self.exact.setdefault(key, [0, 0.0])
+                totals[0] += units
+                totals[1] += revenue
+                self.titles.setdefault(key, other.titles.get(key, key))
+            return
+        if self.is_exact:
+            self._to_sketch()
+        if other.is_exact:
+            # Copia en modo sketch sin modificar `other`
+            converted = TopProducts(other.k, other.width, other.depth, other.exact_limit)
+            converted.merge(other)
+            converted._to_sketch()
+            other = converted
+        self.revenue.merge(other.revenue)
+        self.units.merge(other.units)
+        for key in set(self.by_revenue.keys()) | set(other.by_revenue.keys()) | set(self.by_units.keys()) | set(other.by_units.keys()):
+            self.by_revenue.offer(key, self.revenue.estimate(key))
+            self.by_units.offer(key, self.units.estimate(key))
+            if key in other.titles:
+                self.titles.setdefault(key, other.titles[key])
+        self._trim_titles()
+
+    def _entry(self, key, units, revenue):
+        return {
+            "sku": key,
+            "title": self.titles.get(key, key),
+            "units": int(round(units)),
+            "revenue": round(revenue, 2)
+        }
+
+    def _ranking(self, candidates, sketch):
+        ranked = sorted(candidates.keys(), key=lambda key: sketch.estimate(key), reverse=True)[:self.k]
+        return [self._entry(key, self.units.estimate(key), self.revenue.estimate(key)) for key in ranked]
+
+    def _exact_ranking(self, position):
+        ranked = heapq.nlargest(self.k, self.exact, key=lambda key: (self.exact[key][position], key))
+        return [self._entry(key, *self.exact[key]) for key in ranked]
+
+    def result(self):
+        """{'by_revenue': [...], 'by_units': [...]} con sku, title, units y revenue"""
+        if self.is_exact:
+            return {
+                "by_revenue": self._exact_ranking(1),
+                "by_units": self._exact_ranking(0)
+            }
+        return {
+            "by_revenue": self._ranking(self.by_revenue, self.revenue),
+            "by_units": self._ranking(self.by_units, self.units)
+        }